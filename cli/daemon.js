@@ -0,0 +1,135 @@
+const fs = require('fs');
+const net = require('net');
+const path = require('path');
+const readline = require('readline');
+const { spawn } = require('child_process');
+
+// Talks line-delimited JSON-RPC 2.0 to the Python core. Each project gets
+// one long-lived core listening on .dtm/daemon.sock, started on first use;
+// where unix sockets are unavailable a core is spawned over stdin/stdout.
+
+const mainPath = path.join(__dirname, '..', 'core', 'main.py');
+const python = process.env.DTM_PYTHON || 'python3';
+
+class CoreClient {
+  constructor(input, output, onClose) {
+    this.output = output;
+    this.onClose = onClose;
+    this.nextId = 1;
+    this.pending = new Map();
+    this.progressHandlers = new Set();
+
+    const lines = readline.createInterface({ input, crlfDelay: Infinity });
+    lines.on('line', (line) => this.handleLine(line));
+    lines.on('close', () => {
+      for (const { reject } of this.pending.values()) {
+        reject(new Error('DTM core exited before answering'));
+      }
+      this.pending.clear();
+    });
+  }
+
+  handleLine(line) {
+    if (!line.trim()) {
+      return;
+    }
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (error) {
+      return;
+    }
+    if (message.method === 'progress') {
+      this.progressHandlers.forEach(handler => handler(message.params));
+      return;
+    }
+    const request = this.pending.get(message.id);
+    if (!request) {
+      return;
+    }
+    this.pending.delete(message.id);
+    if (message.error) {
+      request.reject(new Error(message.error.message));
+    } else {
+      request.resolve(message.result);
+    }
+  }
+
+  // Send a request; onProgress receives progress events while it runs
+  request(method, params = {}, onProgress = null) {
+    const id = this.nextId++;
+    if (onProgress) {
+      this.progressHandlers.add(onProgress);
+    }
+    const done = new Promise((resolve, reject) => {
+      this.pending.set(id, { resolve, reject });
+      this.output.write(JSON.stringify({ jsonrpc: '2.0', id, method, params }) + '\n');
+    });
+    return done.finally(() => this.progressHandlers.delete(onProgress));
+  }
+
+  close() {
+    this.onClose();
+  }
+}
+
+function connectSocket(socketPath) {
+  return new Promise((resolve, reject) => {
+    const socket = net.createConnection(socketPath);
+    socket.once('connect', () => {
+      socket.removeAllListeners('error');
+      resolve(new CoreClient(socket, socket, () => socket.end()));
+    });
+    socket.once('error', reject);
+  });
+}
+
+function startDaemon(projectDir, socketPath) {
+  const dtmDir = path.dirname(socketPath);
+  fs.mkdirSync(dtmDir, { recursive: true });
+  const log = fs.openSync(path.join(dtmDir, 'daemon.log'), 'a');
+  const child = spawn(python, [mainPath, 'serve', '--socket', socketPath], {
+    cwd: projectDir,
+    detached: true,
+    stdio: ['ignore', log, log]
+  });
+  child.unref();
+}
+
+async function waitForSocket(socketPath, timeoutMs) {
+  const deadline = Date.now() + timeoutMs;
+  for (;;) {
+    try {
+      return await connectSocket(socketPath);
+    } catch (error) {
+      if (Date.now() > deadline) {
+        throw new Error(`DTM core did not start; see ${path.join(path.dirname(socketPath), 'daemon.log')}`);
+      }
+      await new Promise(resolve => setTimeout(resolve, 100));
+    }
+  }
+}
+
+function spawnStdioCore(projectDir) {
+  const child = spawn(python, [mainPath, 'serve'], {
+    cwd: projectDir,
+    stdio: ['pipe', 'pipe', 'inherit']
+  });
+  return new CoreClient(child.stdout, child.stdin, () => child.stdin.end());
+}
+
+// Connect to the project's core, starting one if none is running
+async function connect(projectDir = process.cwd()) {
+  if (process.platform === 'win32') {
+    return spawnStdioCore(projectDir);
+  }
+  const socketPath = path.join(projectDir, '.dtm', 'daemon.sock');
+  try {
+    return await connectSocket(socketPath);
+  } catch (error) {
+    startDaemon(projectDir, socketPath);
+    return waitForSocket(socketPath, 30000);
+  }
+}
+
+module.exports = { connect, CoreClient };
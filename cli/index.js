@@ -3,11 +3,93 @@
 const { program } = require('commander');
 const chalk = require('chalk');
 const inquirer = require('inquirer');
-const { execSync } = require('child_process');
-const path = require('path');
-
-// Get the path to the core directory
-const corePath = path.join(__dirname, '..', 'core');
+const { connect } = require('./daemon');
+
+// Render progress events streamed by the core
+function showProgress(event) {
+  switch (event.event) {
+    case 'probe_started':
+      console.log(chalk.gray(`  Testing ${event.package}@${event.version}...`));
+      break;
+    case 'install_finished':
+      if (!event.installed) {
+        console.log(chalk.red(`  ❌ Failed to install ${event.package}@${event.version}`));
+      }
+      break;
+    case 'test_result':
+      if (event.installed) {
+        const suffix = event.cached ? chalk.gray(' (cached)') : '';
+        console.log(event.passed
+          ? chalk.green(`  ✅ ${event.package}@${event.version} works`) + suffix
+          : chalk.red(`  ❌ ${event.package}@${event.version} failed`) + suffix);
+      }
+      break;
+    case 'package_result':
+      console.log(chalk.blue(`\n📬 Finished ${event.package}`));
+      break;
+    case 'benchmark_result':
+      console.log(event.regressed
+        ? chalk.yellow(`  🐢 ${event.package}@${event.version} is slower (median ${event.median}s)`)
+        : chalk.gray(`  🐇 ${event.package}@${event.version} median ${event.median}s`));
+      break;
+    case 'result_reused':
+      console.log(chalk.gray(`  Reusing the analysis of ${event.package}`));
+      break;
+  }
+}
+
+function showUpgrade(result) {
+  if (result.status !== 'success') {
+    console.log(chalk.red(`  ❌ ${result.message}`));
+    return;
+  }
+  if (result.latest_working) {
+    console.log(chalk.green(`  ✅ Latest working version: ${result.latest_working}`));
+  }
+  if (result.first_broken) {
+    console.log(chalk.red(`  ❌ First broken version: ${result.first_broken}`));
+  }
+  showPerformance(result.performance, '  ');
+}
+
+// Summarise a benchmark regression search
+function showPerformance(performance, indent) {
+  if (!performance) {
+    return;
+  }
+  if (!performance.first_regressed) {
+    console.log(chalk.green(`${indent}🐇 No benchmark regression since ${performance.baseline}`));
+    return;
+  }
+  const regression = performance.regression || {};
+  const details = ['latency', 'rss_kb']
+    .filter(measure => regression[measure])
+    .map(measure => `${measure === 'latency' ? 'latency' : 'peak RSS'} x${regression[measure].ratio}`);
+  console.log(chalk.yellow(`${indent}🐢 First slower version: ${performance.first_regressed}` +
+    ` (${details.join(', ')} vs ${performance.baseline})`));
+  for (const [version, measured] of Object.entries(performance.versions)) {
+    const latency = measured.latency || {};
+    const rss = measured.rss_kb || {};
+    const summary = measured.error
+      ? chalk.red(measured.error.split('\n')[0])
+      : `median ${latency.median}s (p90 ${latency.p90}s), peak RSS ${rss.median} KiB`;
+    console.log(chalk.gray(`${indent}   ${version}: ${summary}`));
+  }
+}
+
+// Core parameters for the benchmark options of a command
+function benchmarkParams(options) {
+  if (!options.bench) {
+    return {};
+  }
+  return { bench: options.bench, samples: Number(options.samples) };
+}
+
+function upgradeParams(pkg, options) {
+  // A package analyzed in a sub-project is upgraded there, not in the root
+  const project = pkg.project && pkg.project !== '.' ? { project: pkg.project } : {};
+  return { package: pkg.package, ...project, ...benchmarkParams(options) };
+}
 
 program
   .version('0.1.1')
@@ -16,13 +98,18 @@ program
 program
   .command('analyze')
   .description('Analyze all dependencies in the project')
-  .action(async () => {
+  .option('--recursive', 'analyze every sub-project, in the environment each installs its dependencies in')
+  .option('--bench <command>', 'also find the first version whose benchmark got slower')
+  .option('--samples <n>', 'benchmark runs per version', '10')
+  .action(async (options) => {
+    let core;
     try {
       console.log(chalk.blue('\n🔍 Analyzing project dependencies...\n'));
       
-      // Run the Python script with the correct path
-      const result = execSync(`python3 ${path.join(corePath, 'main.py')} analyze`, { encoding: 'utf-8' });
-      const analysis = JSON.parse(result.split('\n').pop());
+      // Ask the project's long-lived core, which streams progress as it goes
+      core = await connect();
+      const params = { ...benchmarkParams(options), ...(options.recursive ? { recursive: true } : {}) };
+      const analysis = await core.request('analyze', params, showProgress);
 
       // Process results
       const packages = Object.entries(analysis);
@@ -41,9 +128,10 @@ program
         if (data.status === 'error') {
           errors.push({ package, message: data.message });
         } else if (data.dependency_conflicts) {
-          conflicts.push({ package, ...data });
+          conflicts.push({ package, ...data, key: package });
         } else if (data.latest_working) {
-          upgradable.push({ package, ...data });
+          // data.package is the bare name; the key also names the sub-project it was probed in
+          upgradable.push({ package, ...data, key: package });
         }
       }
 
@@ -51,18 +139,23 @@ program
       if (upgradable.length > 0) {
         console.log(chalk.green('\n✅ Upgradable Packages:'));
         for (const pkg of upgradable) {
-          console.log(`\n  ${chalk.bold(pkg.package)}:`);
+          console.log(`\n  ${chalk.bold(pkg.key)}:`);
           console.log(`    Latest working version: ${pkg.latest_working}`);
           if (pkg.first_broken) {
             console.log(`    First broken version: ${pkg.first_broken}`);
           }
+          if (pkg.used_by) {
+            const projects = [...new Set(pkg.used_by.map(use => use.project))];
+            console.log(chalk.gray(`    Used by: ${projects.join(', ')}`));
+          }
+          showPerformance(pkg.performance, '    ');
         }
       }
 
       if (conflicts.length > 0) {
         console.log(chalk.yellow('\n⚠️ Packages with Conflicts:'));
         for (const pkg of conflicts) {
-          console.log(`\n  ${chalk.bold(pkg.package)}:`);
+          console.log(`\n  ${chalk.bold(pkg.key)}:`);
           console.log('    Dependency conflicts:');
           for (const [dep, issues] of Object.entries(pkg.dependency_conflicts)) {
             console.log(`      - ${dep}:`);
@@ -97,10 +190,11 @@ program
           return;
         }
 
+        // The core answers these from the analysis it just finished
         if (action === 'all') {
           for (const pkg of upgradable) {
-            console.log(`\n${chalk.blue(`Upgrading ${pkg.package}...`)}`);
-            execSync(`dtm upgrade ${pkg.package}`, { stdio: 'inherit' });
+            console.log(`\n${chalk.blue(`Upgrading ${pkg.key}...`)}`);
+            showUpgrade(await core.request('upgrade', upgradeParams(pkg, options), showProgress));
           }
         } else if (action === 'select') {
           const { selectedPackages } = await inquirer.prompt([
@@ -109,15 +203,15 @@ program
               name: 'selectedPackages',
               message: 'Select packages to upgrade:',
               choices: upgradable.map(pkg => ({
-                name: `${pkg.package} (${pkg.latest_working})`,
-                value: pkg.package
+                name: `${pkg.key} (${pkg.latest_working})`,
+                value: pkg
               }))
             }
           ]);
 
-          for (const package of selectedPackages) {
-            console.log(`\n${chalk.blue(`Upgrading ${package}...`)}`);
-            execSync(`dtm upgrade ${package}`, { stdio: 'inherit' });
+          for (const pkg of selectedPackages) {
+            console.log(`\n${chalk.blue(`Upgrading ${pkg.key}...`)}`);
+            showUpgrade(await core.request('upgrade', upgradeParams(pkg, options), showProgress));
           }
         }
       }
@@ -125,19 +219,33 @@ program
     } catch (error) {
       console.error(chalk.red('\nError running DTM:'), error.message);
       process.exit(1);
+    } finally {
+      if (core) {
+        core.close();
+      }
     }
   });
 
 program
   .command('upgrade <package-name>')
   .description('Upgrade a specific package')
-  .action((packageName) => {
+  .option('--bench <command>', 'also find the first version whose benchmark got slower')
+  .option('--samples <n>', 'benchmark runs per version', '10')
+  .option('--project <dir>', 'the sub-project whose environment to probe the package in', '.')
+  .action(async (packageName, options) => {
+    let core;
     try {
       console.log(chalk.blue(`\n🔍 Analyzing ${packageName}...\n`));
-      execSync(`python3 ${path.join(corePath, 'main.py')} upgrade ${packageName}`, { stdio: 'inherit' });
+      core = await connect();
+      showUpgrade(await core.request('upgrade', upgradeParams({ package: packageName, project: options.project }, options),
+                                     showProgress));
     } catch (error) {
       console.error(chalk.red('\nError running DTM:'), error.message);
       process.exit(1);
+    } finally {
+      if (core) {
+        core.close();
+      }
     }
   });
 
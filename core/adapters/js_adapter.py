@@ -1,13 +1,80 @@
-import subprocess
+import glob
+import hashlib
 import json
-from typing import List, Tuple
+import os
+import re
+import shutil
+import subprocess
+import threading
+import uuid
+import weakref
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import requests
+from cache import default_cache_dir
+from metadata import get_metadata_client
+from versions import sort_versions
+from runner import FAILURE_PATTERNS, TestRun, get_test_runner
+from workspaces import mark_in_use, mirror_project, pid_alive, prune_least_recent, release_mark, write_if_changed
+
+# node_modules snapshots kept per project
+DEFAULT_KEEP_SNAPSHOTS = 32
+LOCKFILES = ("package-lock.json", "npm-shrinkwrap.json")
+# Taken from the snapshot rather than the project, because they name the probed version
+REWRITTEN_FILES = {"package.json", *LOCKFILES}
+# Everything npm needs to resolve the tree, besides package.json itself
+INSTALL_INPUTS = (*LOCKFILES, ".npmrc")
+DEPENDENCY_SECTIONS = ("dependencies", "devDependencies", "optionalDependencies", "peerDependencies")
+LOCAL_PROTOCOLS = ("file:", "link:")
+NPM_INSTALL_FLAGS = ["--save-exact", "--prefer-offline", "--no-audit", "--no-fund"]
+
+@lru_cache(maxsize=None)
+def node_version() -> str:
+    """The node binary's version; native modules in a snapshot are built for it."""
+    try:
+        return subprocess.run(["node", "--version"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
 
 class JSAdapter:
-    def __init__(self, package_name: str):
+    """Probes npm package versions against node_modules snapshots.
+
+    Each version's tree is installed once into a snapshot under the DTM
+    cache, from npm's shared content-addressed cache, with the project's
+    lockfile pinning every other package. Tests run in a private copy of
+    the project whose ``node_modules`` is a symlink to the snapshot, so
+    switching to a version seen before, in this run or an earlier one,
+    only swaps the symlink and never touches the project directory.
+    Workspace and ``file:`` packages inside the project are linked to
+    their copies in the workspace instead of the snapshot's.
+    """
+
+    version_scheme = "semver"
+    # Probes never touch the project directory and each has its own workspace
+    parallel_safe = True
+
+    def __init__(self, package_name: str, root: str = ".", keep_snapshots: int = DEFAULT_KEEP_SNAPSHOTS):
         self.package_name = package_name
+        self.root = os.path.abspath(root)
+        self.keep_snapshots = keep_snapshots
+        self.version: Optional[str] = None
+        self.last_test_run: Optional[TestRun] = None
+        self._conflicts: Dict[str, Dict[str, List[str]]] = {}
+        project = hashlib.sha256(self.root.encode()).hexdigest()[:16]
+        self.snapshots_dir = os.path.join(default_cache_dir(), "npm", project, "snapshots")
+        self.work_dir = os.path.join(default_cache_dir(), "npm", project, "work")
+        self.workspace: Optional[str] = None
+        self._marker: Optional[str] = None
 
     def enumerate_versions(self) -> List[str]:
-        """Fetch all available versions from npm."""
+        """Fetch all available versions from the npm registry."""
+        try:
+            versions = get_metadata_client().npm_versions(self.package_name)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Registry lookup failed, falling back to npm view: {e}")
+            versions = []
+        if versions:
+            return sort_versions(versions, "semver")
         try:
             result = subprocess.run(
                 ["npm", "view", self.package_name, "versions", "--json"],
@@ -16,34 +83,280 @@ class JSAdapter:
                 text=True
             )
             versions = json.loads(result.stdout)
-            return versions
+            return sort_versions(versions, "semver")
         except Exception as e:
             print(f"Error fetching versions: {e}")
             return []
 
+    def _manifest(self) -> Dict:
+        try:
+            with open(os.path.join(self.root, "package.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _local_spec_path(self, spec) -> Optional[str]:
+        """Absolute path a file:/link: dependency spec points at, if it is one."""
+        if not isinstance(spec, str) or not spec.startswith(LOCAL_PROTOCOLS):
+            return None
+        path = spec.split(":", 1)[1]
+        return os.path.normpath(path if os.path.isabs(path) else os.path.join(self.root, path))
+
+    def _install_inputs(self) -> List[str]:
+        """Project-relative files npm reads to install the tree.
+
+        Besides the manifest, lockfile and ``.npmrc`` these are the
+        ``package.json`` of every workspace and the local packages or
+        tarballs that ``file:``/``link:`` dependencies name inside the project.
+        """
+        manifest = self._manifest()
+        inputs = ["package.json", *INSTALL_INPUTS]
+        workspaces = manifest.get("workspaces", [])
+        if isinstance(workspaces, dict):
+            workspaces = workspaces.get("packages", [])
+        for pattern in workspaces if isinstance(workspaces, list) else []:
+            for directory in glob.glob(os.path.join(self.root, pattern)):
+                inputs.append(os.path.relpath(os.path.join(directory, "package.json"), self.root))
+        for section in DEPENDENCY_SECTIONS:
+            for spec in (manifest.get(section) or {}).values():
+                path = self._local_spec_path(spec)
+                if path is None or not path.startswith(self.root + os.sep):
+                    continue
+                if os.path.isdir(path):
+                    path = os.path.join(path, "package.json")
+                inputs.append(os.path.relpath(path, self.root))
+        return sorted({name for name in inputs if os.path.isfile(os.path.join(self.root, name))})
+
+    def _snapshot_key(self, version: str) -> str:
+        digest = hashlib.sha256()
+        for name in self._install_inputs():
+            try:
+                with open(os.path.join(self.root, name), "rb") as f:
+                    digest.update(name.encode() + b"\0" + f.read() + b"\0")
+            except FileNotFoundError:
+                pass
+        digest.update(f"{self.package_name}@{version}\0{node_version()}".encode())
+        return digest.hexdigest()[:24]
+
+    def _pin_outside_paths(self, staging: str) -> Dict[Tuple[str, str], str]:
+        """Point local dependencies outside the project at their real location; returns the original specs."""
+        path = os.path.join(staging, "package.json")
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        originals = {}
+        for section in DEPENDENCY_SECTIONS:
+            for name, spec in (manifest.get(section) or {}).items():
+                target = self._local_spec_path(spec)
+                if target is not None and not target.startswith(self.root + os.sep):
+                    originals[(section, name)] = spec
+                    manifest[section][name] = f"{spec.split(':', 1)[0]}:{target}"
+        if originals:
+            with open(path, "w") as f:
+                json.dump(manifest, f, indent=2)
+        return originals
+
+    @staticmethod
+    def _restore_specs(staging: str, originals: Dict[Tuple[str, str], str]):
+        """Put the project's own local dependency specs back into the snapshot's package.json."""
+        path = os.path.join(staging, "package.json")
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        for (section, name), spec in originals.items():
+            manifest.setdefault(section, {})[name] = spec
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.write("\n")
+
+    def _build_snapshot(self, version: str, snapshot: str) -> bool:
+        """Install the project's tree with exactly version of the package into snapshot."""
+        staging = os.path.join(self.snapshots_dir, f".staging-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(staging)
+        try:
+            marker = mark_in_use(staging)  # moves into the snapshot with it
+            for name in self._install_inputs():
+                os.makedirs(os.path.dirname(os.path.join(staging, name)), exist_ok=True)
+                shutil.copy2(os.path.join(self.root, name), os.path.join(staging, name))
+            originals = self._pin_outside_paths(staging)
+            result = subprocess.run(["npm", "install", f"{self.package_name}@{version}", *NPM_INSTALL_FLAGS],
+                                    cwd=staging, capture_output=True, text=True)
+            if result.returncode != 0:
+                conflicts = self._parse_conflicts(result.stderr)
+                if conflicts:
+                    self._conflicts[version] = conflicts
+                print(f"Error installing version {version}: {result.stderr.strip()[-2000:]}")
+                return False
+            if originals:
+                self._restore_specs(staging, originals)
+            try:
+                os.rename(staging, snapshot)
+                self._marker = os.path.join(snapshot, os.path.basename(marker))
+            except OSError:
+                if not os.path.isdir(snapshot):  # not just another probe finishing first
+                    raise
+                self._marker = mark_in_use(snapshot)
+            return True
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @staticmethod
+    def _parse_conflicts(stderr: str) -> Optional[Dict[str, List[str]]]:
+        """Extract the unresolvable requirements from npm's ERESOLVE report."""
+        conflicts: Dict[str, List[str]] = {}
+        in_report = False
+        for line in stderr.splitlines():
+            line = re.sub(r'^npm (?:ERR!|error) ?', '', line).rstrip()
+            if line.startswith(("Could not resolve dependency", "Conflicting peer dependency")):
+                in_report = True
+                continue
+            # Indented lines are the requirement's own dependents, not the conflict
+            match = re.match(r'^(?:peer |peerOptional )?(@?[^@\s]+)@(\S+) from (.+)$', line) if in_report else None
+            if match:
+                conflicts.setdefault(match.group(1), []).append(f"{match.group(2)} required by {match.group(3)}")
+            elif not line:
+                in_report = False
+        return conflicts or None
+
+    def _remove_stale_workspaces(self):
+        """Delete workspaces left behind by DTM processes that have exited."""
+        for name in os.listdir(self.work_dir):
+            pid = name.split("-", 1)[0]
+            if pid.isdigit() and not pid_alive(int(pid)):
+                shutil.rmtree(os.path.join(self.work_dir, name), ignore_errors=True)
+
+    def _ensure_workspace(self) -> str:
+        if self.workspace is None:
+            os.makedirs(self.work_dir, exist_ok=True)
+            self._remove_stale_workspaces()
+            self.workspace = os.path.join(self.work_dir, f"{os.getpid()}-{uuid.uuid4().hex[:12]}")
+            os.makedirs(self.workspace)
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self.workspace, True)
+        return self.workspace
+
+    @staticmethod
+    def _replace(staging: str, path: str):
+        """Move staging to path, replacing whatever is there."""
+        if os.path.lexists(path) and os.path.isdir(path) and not os.path.islink(path) \
+                or os.path.isdir(staging) and not os.path.islink(staging):
+            trash = f"{path}.old-{uuid.uuid4().hex[:8]}"
+            if os.path.lexists(path):
+                os.rename(path, trash)
+            os.rename(staging, path)
+            if os.path.isdir(trash) and not os.path.islink(trash):
+                shutil.rmtree(trash, ignore_errors=True)
+            elif os.path.lexists(trash):
+                os.remove(trash)
+        else:
+            os.replace(staging, path)
+
+    @staticmethod
+    def _local_links(snapshot: str) -> Dict[str, str]:
+        """Top-level node_modules entries that npm linked to a package inside the snapshot.
+
+        Maps each entry (``name`` or ``@scope/name``) to the package's
+        directory relative to the snapshot.
+        """
+        modules = os.path.join(snapshot, "node_modules")
+        entries = []
+        for entry in os.scandir(modules):
+            if entry.name.startswith("@") and entry.is_dir(follow_symlinks=False):
+                entries += [(f"{entry.name}/{sub.name}", sub) for sub in os.scandir(entry.path)]
+            else:
+                entries.append((entry.name, entry))
+        links = {}
+        for name, entry in entries:
+            if entry.is_symlink():
+                target = os.path.realpath(entry.path)
+                if target.startswith(os.path.realpath(snapshot) + os.sep) and \
+                        not target.startswith(os.path.realpath(modules) + os.sep):
+                    links[name] = os.path.relpath(target, os.path.realpath(snapshot))
+        return links
+
+    def _link_modules(self, snapshot: str, workspace: str):
+        """Point the workspace's node_modules at the snapshot's.
+
+        Normally that is one symlink. When npm linked workspace or local
+        packages, node_modules is a directory of links instead, so those
+        packages resolve to their copies in the workspace and everything
+        else to the snapshot.
+        """
+        modules = os.path.join(snapshot, "node_modules")
+        link = os.path.join(workspace, "node_modules")
+        staging = f"{link}.{uuid.uuid4().hex[:8]}"
+        local = self._local_links(snapshot)
+        if not local:
+            os.symlink(modules, staging)
+            self._replace(staging, link)
+            return
+        os.makedirs(staging)
+        for entry in os.scandir(modules):
+            if entry.name.startswith("@") and entry.is_dir(follow_symlinks=False):
+                os.makedirs(os.path.join(staging, entry.name))
+                names = [f"{entry.name}/{sub.name}" for sub in os.scandir(entry.path)]
+            else:
+                names = [entry.name]
+            for name in names:
+                target = os.path.join(workspace, local[name]) if name in local else os.path.join(modules, name)
+                os.symlink(target, os.path.join(staging, name))
+        self._replace(staging, link)
+        # Dependencies npm could not hoist live next to each local package
+        for relative in set(local.values()):
+            nested, path = os.path.join(snapshot, relative, "node_modules"), os.path.join(workspace, relative, "node_modules")
+            if os.path.isdir(nested):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                staging = f"{path}.{uuid.uuid4().hex[:8]}"
+                os.symlink(nested, staging)
+                self._replace(staging, path)
+            elif os.path.islink(path):
+                os.remove(path)
+
     def install_version(self, version: str) -> bool:
-        """Install a specific version using npm."""
+        """Point the workspace's node_modules at the snapshot for version, building it if needed."""
+        self.version = version
+        release_mark(self._marker)
+        self._marker = None
+        snapshot = os.path.join(self.snapshots_dir, self._snapshot_key(version))
         try:
-            subprocess.run(
-                ["npm", "install", f"{self.package_name}@{version}"],
-                check=True,
-                capture_output=True,
-                text=True
-            )
+            os.makedirs(self.snapshots_dir, exist_ok=True)
+            try:
+                self._marker = mark_in_use(snapshot)  # also keeps it most recently used
+            except FileNotFoundError:
+                if not self._build_snapshot(version, snapshot):
+                    return False
+
+            workspace = self._ensure_workspace()
+            for relative in mirror_project(self.root, workspace, REWRITTEN_FILES):
+                # The top-level manifest and lockfile name the probed version
+                source = os.path.join(snapshot if os.path.dirname(relative) == "" else self.root, relative)
+                if not os.path.exists(source):
+                    source = os.path.join(self.root, relative)
+                with open(source, "r") as f:
+                    write_if_changed(os.path.join(workspace, relative), f.read())
+            self._link_modules(snapshot, workspace)
             return True
-        except subprocess.CalledProcessError as e:
-            print(f"Error installing version {version}: {e.stderr}")
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Error installing version {version}: {e}")
             return False
 
-    def run_tests(self, test_command: str = "npm test") -> Tuple[bool, str]:
-        """Run tests and return (success, output)."""
-        try:
-            result = subprocess.run(
-                test_command.split(),
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            return True, result.stdout
-        except subprocess.CalledProcessError as e:
-            return False, e.stderr 
\ No newline at end of file
+    def get_dependency_conflicts(self, version: str) -> Optional[Dict[str, List[str]]]:
+        """Peer dependency conflicts recorded when installing version failed."""
+        return self._conflicts.get(version)
+
+    def close(self):
+        """Delete the workspace and prune old snapshots; the rest stay for later probes."""
+        release_mark(self._marker)
+        self._marker = None
+        if self.workspace is not None:
+            self._finalizer()
+            self.workspace = None
+        prune_least_recent(self.snapshots_dir, self.keep_snapshots)
+
+    def command_cwd(self) -> Optional[str]:
+        """Directory benchmark commands run in, so they see the installed version."""
+        return self.workspace
+
+    def run_tests(self, test_command: str = "npm test", cancel: Optional[threading.Event] = None) -> Tuple[bool, str]:
+        """Run tests in the workspace and return (success, output tail)."""
+        self.last_test_run = get_test_runner().run(test_command.split(), cwd=self.workspace,
+                                                   label=f"{self.package_name}-{self.version}",
+                                                   failure_patterns=FAILURE_PATTERNS.get("npm"), cancel=cancel)
+        return self.last_test_run.passed, self.last_test_run.output
@@ -1,125 +1,190 @@
 import subprocess
 import json
-import requests
 import os
 import sys
+import threading
 from typing import List, Tuple, Dict, Optional
+from metadata import get_metadata_client, normalize_python_name
+from manifests import python_requirements
+from versions import sort_versions
+from pruning import StaticPruner, parse_pinned_requirements
+from envs import Environment, get_environment_manager
+from wheelhouse import Prefetcher, get_prefetcher
+from runner import FAILURE_PATTERNS, TestRun, get_test_runner
+from impact import get_impact_index
+from forkserver import STALE_EXIT, ForkServer, get_fork_server
 
 class PythonAdapter:
-    def __init__(self, package_name: str):
+    version_scheme = "pep440"
+    # Every probe runs in its own clone of the baseline venv, so probes can run side by side
+    parallel_safe = True
+
+    def __init__(self, package_name: str, root: str = "."):
         self.package_name = package_name
-        self.pypi_url = f"https://pypi.org/pypi/{package_name}/json"
-        self.venv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "venv")
-        self._ensure_venv()
-
-    def _ensure_venv(self):
-        """Ensure virtual environment exists and is properly set up."""
-        if not os.path.exists(self.venv_path):
-            subprocess.run([sys.executable, "-m", "venv", self.venv_path], check=True)
-            # Install requirements
-            requirements_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "requirements.txt")
-            if os.path.exists(requirements_path):
-                subprocess.run([
-                    os.path.join(self.venv_path, "bin", "pip"),
-                    "install",
-                    "-r",
-                    requirements_path
-                ], check=True)
-
-    def _get_pip_path(self) -> str:
-        """Get the path to pip in the virtual environment."""
-        if sys.platform == "win32":
-            return os.path.join(self.venv_path, "Scripts", "pip")
-        return os.path.join(self.venv_path, "bin", "pip")
+        self.root = os.path.abspath(root)
+        self.requirements_path = os.path.join(self.root, "requirements.txt")
+        # Projects declared only in pyproject.toml or poetry.lock get a baseline from the parsed manifest
+        self.declared = None if os.path.exists(self.requirements_path) else python_requirements(self.root)
+        self.env_manager = get_environment_manager(self.requirements_path, self.declared)
+        self.env: Optional[Environment] = None
+        self._prefetcher: Optional[Prefetcher] = None
+        self._conflicts: Dict[str, Dict[str, List[str]]] = {}
+        self.version: Optional[str] = None
+        self.last_test_run: Optional[TestRun] = None
+        self._import_names: Optional[List[str]] = None
 
     def enumerate_versions(self) -> List[str]:
-        """Fetch all available versions from PyPI."""
+        """Fetch all available versions from the PyPI simple index."""
         try:
-            response = requests.get(self.pypi_url)
-            response.raise_for_status()
-            data = response.json()
-            versions = list(data["releases"].keys())
-            # Sort versions semantically
-            versions.sort(key=lambda s: [int(u) for u in s.split('.')])
-            return versions
+            versions = get_metadata_client().pypi_versions(self.package_name)
+            # Sort versions by PEP 440 precedence
+            return sort_versions(versions, "pep440")
         except Exception as e:
             print(f"Error fetching versions: {e}")
             return []
 
-    def install_version(self, version: str) -> bool:
-        """Install a specific version using pip in the virtual environment."""
+    def import_names(self) -> List[str]:
+        """Top-level modules the package provides, read from the baseline venv."""
+        if self._import_names is not None:
+            return self._import_names
+        script = ("import importlib.metadata as m, json, re, sys\n"
+                  "norm = lambda n: re.sub(r'[-_.]+', '-', n).lower()\n"
+                  "print(json.dumps([top for top, dists in m.packages_distributions().items()"
+                  " if norm(sys.argv[1]) in map(norm, dists)]))")
         try:
-            # First, uninstall any existing version
-            subprocess.run(
-                [self._get_pip_path(), "uninstall", "-y", self.package_name],
-                check=False,
-                capture_output=True,
-                text=True
-            )
-            
-            # Install the specific version
-            result = subprocess.run(
-                [self._get_pip_path(), "install", f"{self.package_name}=={version}"],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            
-            # Check for dependency conflicts
-            if "ERROR: pip's dependency resolver" in result.stderr:
-                print(f"Warning: Dependency conflicts detected for {self.package_name} {version}")
-                return False
-                
-            return True
-        except subprocess.CalledProcessError as e:
-            print(f"Error installing version {version}: {e.stderr}")
+            result = subprocess.run([self.env_manager.baseline_python, "-c", script, self.package_name],
+                                    check=True, capture_output=True, text=True)
+            names = json.loads(result.stdout)
+        except (subprocess.CalledProcessError, OSError, ValueError):
+            names = []
+        self._import_names = names or [self.package_name.replace("-", "_")]
+        return self._import_names
+
+    def prune_versions(self, versions: List[str]) -> Tuple[List[str], Dict[str, Dict[str, List[str]]]]:
+        """Drop versions that registry metadata shows cannot install next to the project's pins."""
+        pins = parse_pinned_requirements(self.requirements_path)
+        for spec in self.declared or []:
+            name, _, version = spec.partition("==")
+            if version:
+                pins[normalize_python_name(name)] = version
+        pruner = StaticPruner(get_metadata_client(), pins)
+        return pruner.prune(self.package_name, versions)
+
+    def _get_prefetcher(self) -> Prefetcher:
+        if self._prefetcher is None:
+            self._prefetcher = get_prefetcher(self.env_manager.baseline_python)
+        return self._prefetcher
+
+    def prefetch(self, versions: List[str]):
+        """Download wheels for versions likely to be probed next in the background."""
+        for version in versions:
+            self._get_prefetcher().prefetch(self.package_name, version)
+
+    def install_version(self, version: str) -> bool:
+        """Install a specific version into a fresh clone of the baseline venv.
+
+        Wheels come from the local wheelhouse when they are stored or a
+        prefetch is already downloading them, so repeat probes of a version
+        never touch the network. Otherwise pip installs from the index and
+        the wheels are saved in the background for next time.
+        """
+        if self.env is not None:
+            self.env_manager.release(self.env)
+        self.env = self.env_manager.acquire()
+        self.version = version
+
+        requirement = f"{self.package_name}=={version}"
+        prefetcher = self._get_prefetcher()
+        if prefetcher.available(self.package_name, version) is not None:
+            success, stderr = self.env.pip_install("--no-index", "--find-links",
+                                                   prefetcher.wheelhouse.links_dir, requirement)
+            if not success and "No matching distribution found" in stderr:
+                success, stderr = self.env.pip_install(requirement)
+        else:
+            success, stderr = self.env.pip_install(requirement)
+            if success:
+                prefetcher.prefetch(self.package_name, version)
+        conflicts = self._parse_conflicts(stderr)
+        if conflicts is not None:
+            self._conflicts[version] = conflicts
+        if not success:
+            print(f"Error installing version {version}: {stderr}")
             return False
 
-    def run_tests(self, test_command: str = "pytest") -> Tuple[bool, str]:
-        """Run tests in the virtual environment."""
-        try:
-            # Activate virtual environment and run tests
-            if sys.platform == "win32":
-                python_path = os.path.join(self.venv_path, "Scripts", "python")
-            else:
-                python_path = os.path.join(self.venv_path, "bin", "python")
-                
-            result = subprocess.run(
-                [python_path, "-m"] + test_command.split(),
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            return True, result.stdout
-        except subprocess.CalledProcessError as e:
-            return False, e.stderr
+        # Check for dependency conflicts
+        if "ERROR: pip's dependency resolver" in stderr:
+            print(f"Warning: Dependency conflicts detected for {self.package_name} {version}")
+            return False
 
-    def get_dependency_conflicts(self, version: str) -> Optional[Dict[str, List[str]]]:
-        """Get dependency conflicts for a specific version."""
-        try:
-            result = subprocess.run(
-                [self._get_pip_path(), "install", f"{self.package_name}=={version}"],
-                check=False,
-                capture_output=True,
-                text=True
-            )
-            
-            if "ERROR: pip's dependency resolver" in result.stderr:
-                # Parse the error message to extract conflicts
-                conflicts = {}
-                current_package = None
-                for line in result.stderr.split('\n'):
-                    if "requires" in line and "but you have" in line:
-                        parts = line.split()
-                        if len(parts) >= 4:
-                            package = parts[0]
-                            required = parts[2]
-                            current = parts[-1]
-                            if package not in conflicts:
-                                conflicts[package] = []
-                            conflicts[package].append(f"requires {required} but you have {current}")
-                return conflicts
+        return True
+
+    def _fork_server(self) -> Optional[ForkServer]:
+        """A zygote with the project's unrelated imports loaded, if one can be used."""
+        index = get_impact_index(self.root)
+        names = self.import_names()
+        return get_fork_server(self.env_manager.baseline_python, self.root, self.package_name, names,
+                               ["pytest"] + index.python_preload_modules(names), index.signature("python"))
+
+    def run_tests(self, test_command: str = "pytest", cancel: Optional[threading.Event] = None) -> Tuple[bool, str]:
+        """Run tests in the probe's virtual environment, returning (success, output tail)."""
+        runner = get_test_runner()
+        args = test_command.split()
+        if runner.fail_fast and args[0] == "pytest" and "-x" not in args:
+            args.append("-x")
+        label = f"{self.package_name}-{self.version}"
+        patterns = FAILURE_PATTERNS.get(args[0])
+
+        server = self._fork_server() if runner.fork_server else None
+        if server is not None:
+            run = runner.run(server.command(self.env.path, args), cwd=self.root, label=label,
+                             failure_patterns=patterns, cancel=cancel)
+            if run.returncode != STALE_EXIT:
+                self.last_test_run = run
+                return run.passed, run.output
+            print(f"🧬 Zygote cannot serve {label}: {run.output.splitlines()[-1] if run.output else 'no reply'}")
+
+        self.last_test_run = runner.run([self.env.python, "-m"] + args, cwd=self.root, label=label,
+                                        failure_patterns=patterns, cancel=cancel)
+        return self.last_test_run.passed, self.last_test_run.output
+
+    def command_cwd(self) -> str:
+        """Directory benchmark commands run in: the project's."""
+        return self.root
+
+    def command_argv(self, command: str) -> List[str]:
+        """argv that runs command in the probe's virtual environment.
+
+        ``python ...`` uses the venv's interpreter; anything else runs as a module.
+        """
+        args = command.split()
+        if args[0] in ("python", "python3"):
+            return [self.env.python] + args[1:]
+        return [self.env.python, "-m"] + args
+
+    @staticmethod
+    def _parse_conflicts(stderr: str) -> Optional[Dict[str, List[str]]]:
+        """Extract resolver conflicts from pip's stderr."""
+        if "ERROR: pip's dependency resolver" not in stderr:
             return None
-        except Exception as e:
-            print(f"Error checking dependencies: {e}")
-            return None 
\ No newline at end of file
+        conflicts = {}
+        for line in stderr.split('\n'):
+            if "requires" in line and "but you have" in line:
+                parts = line.split()
+                if len(parts) >= 4:
+                    package = parts[0]
+                    required = parts[2]
+                    current = parts[-1]
+                    if package not in conflicts:
+                        conflicts[package] = []
+                    conflicts[package].append(f"requires {required} but you have {current}")
+        return conflicts
+
+    def get_dependency_conflicts(self, version: str) -> Optional[Dict[str, List[str]]]:
+        """Get dependency conflicts recorded when the version was installed."""
+        return self._conflicts.get(version)
+
+    def close(self):
+        """Give the probe's venv clone back to the manager."""
+        if self.env is not None:
+            self.env_manager.release(self.env)
+            self.env = None
@@ -1,83 +1,272 @@
-import subprocess
+import glob
+import hashlib
 import json
-from typing import List, Tuple
+import os
+import re
+import shutil
+import subprocess
+import threading
+from functools import lru_cache
+from typing import IO, Dict, List, Optional, Tuple
+import requests
+from cache import default_cache_dir
+from metadata import crates_index_path, get_metadata_client
+from versions import sort_versions
+from runner import FAILURE_PATTERNS, TestRun, get_test_runner
+from workspaces import mirror_project, mark_in_use, prune_least_recent, release_mark, write_if_changed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Probe workspaces (one per version) kept per project
+DEFAULT_KEEP_WORKSPACES = 16
+# Written rather than copied, because probes change them
+REWRITTEN_FILES = {"Cargo.toml", "Cargo.lock"}
+DEPENDENCY_SECTION = re.compile(r'^\[(?:.*\.)?(?:dev-|build-)?dependencies\]$')
+
+@lru_cache(maxsize=None)
+def rustc_version(root: str) -> str:
+    """Verbose version of the rustc that builds the project at root (rustup honours its toolchain file)."""
+    try:
+        return subprocess.run(["rustc", "-vV"], cwd=root, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def cargo_cached_versions(crate: str) -> List[str]:
+    """Non-yanked versions of crate from cargo's own on-disk index cache, if any."""
+    cargo_home = os.environ.get("CARGO_HOME") or os.path.join(os.path.expanduser("~"), ".cargo")
+    versions = set()
+    for path in glob.glob(os.path.join(cargo_home, "registry", "index", "*", ".cache", crates_index_path(crate))):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        # One format byte, a u32 index format, then NUL-terminated
+        # (index version, then version/JSON pairs)
+        fields = data[5:].split(b"\0")
+        for json_line in fields[2::2]:
+            try:
+                release = json.loads(json_line)
+            except ValueError:
+                continue
+            if not release.get("yanked"):
+                versions.add(release["vers"])
+    return list(versions)
+
+def pin_dependency(manifest: str, crate: str, version: str) -> Tuple[str, bool]:
+    """Require exactly version of crate in every dependency table of a Cargo.toml.
+
+    Returns the new manifest and whether the crate was found.
+    """
+    lines = manifest.splitlines(keepends=True)
+    in_deps = False
+    found = False
+    key = re.compile(rf'^(\s*(?:"{re.escape(crate)}"|{re.escape(crate)})\s*=\s*)(.*)$')
+    table = re.compile(rf'^\[(?:.*\.)?(?:dev-|build-)?dependencies\.(?:"{re.escape(crate)}"|{re.escape(crate)})\]$')
+    in_table = False
+    for i, line in enumerate(lines):
+        stripped = line.split('#', 1)[0].strip()
+        if stripped.startswith('['):
+            in_deps = bool(DEPENDENCY_SECTION.match(stripped))
+            in_table = bool(table.match(stripped))
+            continue
+        newline = "\n" if line.endswith("\n") else ""
+        if in_table and re.match(r'^\s*version\s*=', line):
+            lines[i] = f'version = "={version}"{newline}'
+            found = True
+            continue
+        match = key.match(line.rstrip("\n")) if in_deps else None
+        if not match:
+            continue
+        value = match.group(2).strip()
+        if re.search(r'\bworkspace\s*=\s*true', value):
+            continue  # pinned where [workspace.dependencies] declares it
+        if value.startswith('{'):
+            if re.search(r'\bversion\s*=', value):
+                value = re.sub(r'\bversion\s*=\s*"[^"]*"', f'version = "={version}"', value)
+            else:
+                value = value[:-1].rstrip().rstrip(',') + f', version = "={version}" }}'
+        elif value.startswith('"'):
+            value = f'"={version}"'
+        else:
+            continue
+        lines[i] = f"{match.group(1)}{value}{newline}"
+        found = True
+    return "".join(lines), found
 
 class RustAdapter:
-    def __init__(self, package_name: str):
+    """Probes crate versions in scratch copies of the project.
+
+    Each version gets its own workspace under the DTM cache: a private
+    copy of the project with the crate pinned in ``Cargo.toml``. Builds go
+    to a target directory shared by every version built with the same
+    toolchain, so crates that are the same in every version are compiled
+    only once. Each adapter holds one such directory exclusively while it
+    is open, so probes running side by side never wait on cargo's build
+    lock. When ``sccache`` is installed it is used as the compiler wrapper.
+    """
+
+    version_scheme = "semver"
+    # Probes never touch the project directory or each other's workspaces
+    parallel_safe = True
+
+    def __init__(self, package_name: str, root: str = ".", keep_workspaces: int = DEFAULT_KEEP_WORKSPACES):
         self.package_name = package_name
+        self.root = os.path.abspath(root)
+        self.keep_workspaces = keep_workspaces
+        self.version: Optional[str] = None
+        self.workspace: Optional[str] = None
+        self.last_test_run: Optional[TestRun] = None
+        self._conflicts: Dict[str, Dict[str, List[str]]] = {}
+        project = hashlib.sha256(self.root.encode()).hexdigest()[:16]
+        self.workspaces_dir = os.path.join(default_cache_dir(), "rust", project, "workspaces")
+        self.targets_dir = os.path.join(default_cache_dir(), "rust", project, "targets")
+        self._target_dir: Optional[str] = None
+        self._target_lock: Optional[IO] = None
+        self._marker: Optional[str] = None
 
     def enumerate_versions(self) -> List[str]:
-        """Fetch all available versions from crates.io."""
+        """Fetch all available versions from the crates.io sparse index."""
         try:
-            result = subprocess.run(
-                ["cargo", "search", self.package_name, "--limit", "100", "--json"],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            # Parse the JSON output from cargo search
-            versions = []
-            for line in result.stdout.splitlines():
-                if line.strip():
-                    try:
-                        data = json.loads(line)
-                        if data.get("name") == self.package_name:
-                            versions.append(data["vers"])
-                    except json.JSONDecodeError:
-                        continue
-            return sorted(versions, key=lambda s: [int(u) for u in s.split('.')])
-        except Exception as e:
-            print(f"Error fetching versions: {e}")
-            return []
+            versions = get_metadata_client().crate_versions(self.package_name)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Registry lookup failed, falling back to cargo's index cache: {e}")
+            versions = cargo_cached_versions(self.package_name)
+        return sort_versions(versions, "semver")
+
+    def _claim_target_dir(self) -> str:
+        """A target directory for this toolchain that no other open adapter is building in."""
+        if self._target_dir is not None:
+            return self._target_dir
+        if fcntl is None:
+            return os.path.join(self.workspace, "target")  # no locking: one per workspace
+        toolchain = hashlib.sha256(rustc_version(self.root).encode()).hexdigest()[:12]
+        os.makedirs(self.targets_dir, exist_ok=True)
+        slot = 0
+        while True:
+            lock = open(os.path.join(self.targets_dir, f"{toolchain}-{slot}.lock"), "w")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                slot += 1
+                continue
+            self._target_lock = lock
+            self._target_dir = os.path.join(self.targets_dir, f"{toolchain}-{slot}")
+            return self._target_dir
+
+    def _environment(self) -> Dict[str, str]:
+        env = dict(os.environ, CARGO_TARGET_DIR=self._claim_target_dir())
+        if "RUSTC_WRAPPER" not in env and shutil.which("sccache"):
+            env["RUSTC_WRAPPER"] = "sccache"
+        return env
+
+    def _absolute_outside_paths(self, manifest: str, manifest_dir: str) -> str:
+        """Point path dependencies that leave the project at their real location."""
+        def replace(match):
+            target = os.path.normpath(os.path.join(self.root, manifest_dir, match.group(2)))
+            if os.path.isabs(match.group(2)) or target.startswith(self.root + os.sep):
+                return match.group(0)
+            return f'{match.group(1)}{target}"'
+        return re.sub(r'(\bpath\s*=\s*")([^"]*)"', replace, manifest)
+
+    @staticmethod
+    def _parse_conflicts(stderr: str) -> Optional[Dict[str, List[str]]]:
+        """Extract the resolver's complaint from cargo's stderr."""
+        conflicts: Dict[str, List[str]] = {}
+        current = None
+        for line in stderr.splitlines():
+            match = re.search(r"failed to select a version for(?: the requirement)? `([^`=\s]+)", line)
+            if match:
+                current = match.group(1)
+                conflicts.setdefault(current, [])
+            elif current and line.strip() and not line.startswith("error"):
+                conflicts[current].append(line.strip())
+        return conflicts or None
 
     def install_version(self, version: str) -> bool:
-        """Install a specific version using Cargo."""
+        """Prepare a workspace with exactly version of the crate resolved in Cargo.lock."""
+        self.version = version
+        self.workspace = os.path.join(self.workspaces_dir, f"{self.package_name}-{version}")
+        source = os.path.join(self.workspace, "src")
+        release_mark(self._marker)
+        self._marker = None
         try:
-            # Update Cargo.toml with the specific version
-            with open("Cargo.toml", "r") as f:
-                content = f.read()
-            
-            # Replace or add the dependency
-            dep_line = f'{self.package_name} = "{version}"'
-            if f'"{self.package_name}"' in content:
-                # Replace existing version
-                import re
-                content = re.sub(
-                    f'{self.package_name} = "[^"]*"',
-                    dep_line,
-                    content
-                )
-            else:
-                # Add new dependency
-                content = content.replace(
-                    "[dependencies]",
-                    f"[dependencies]\n{dep_line}"
-                )
-            
-            with open("Cargo.toml", "w") as f:
-                f.write(content)
-
-            # Run cargo update
-            subprocess.run(
-                ["cargo", "update", "-p", f"{self.package_name}"],
-                check=True,
-                capture_output=True,
-                text=True
-            )
+            os.makedirs(source, exist_ok=True)
+            self._marker = mark_in_use(self.workspace)  # also keeps it most recently used
+            found = False
+            for relative in mirror_project(self.root, source, REWRITTEN_FILES):
+                with open(os.path.join(self.root, relative), "r") as f:
+                    content = f.read()
+                if os.path.basename(relative) == "Cargo.toml":
+                    content, pinned = pin_dependency(content, self.package_name, version)
+                    found = found or pinned
+                    content = self._absolute_outside_paths(content, os.path.dirname(relative))
+                write_if_changed(os.path.join(source, relative), content)
+            if not found:
+                print(f"{self.package_name} is not a dependency in any Cargo.toml")
+                return False
+
+            # Move only this crate in the lockfile; everything else stays as the project has it
+            env = self._environment()
+            result = subprocess.run(["cargo", "update", "-p", self.package_name, "--precise", version],
+                                    cwd=source, env=env, capture_output=True, text=True)
+            if result.returncode != 0:
+                # Several versions of the crate in the graph make -p ambiguous;
+                # resolving again still honours the exact requirement.
+                result = subprocess.run(["cargo", "metadata", "--format-version", "1"],
+                                        cwd=source, env=env, capture_output=True, text=True)
+            if result.returncode != 0:
+                conflicts = self._parse_conflicts(result.stderr)
+                if conflicts:
+                    self._conflicts[version] = conflicts
+                print(f"Error installing version {version}: {result.stderr.strip()[-2000:]}")
+                return False
             return True
-        except Exception as e:
+        except (OSError, subprocess.SubprocessError) as e:
             print(f"Error installing version {version}: {e}")
             return False
 
-    def run_tests(self, test_command: str = "cargo test") -> Tuple[bool, str]:
-        """Run tests and return (success, output)."""
-        try:
-            result = subprocess.run(
-                test_command.split(),
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            return True, result.stdout
-        except subprocess.CalledProcessError as e:
-            return False, e.stderr 
\ No newline at end of file
+    def get_dependency_conflicts(self, version: str) -> Optional[Dict[str, List[str]]]:
+        """Resolver conflicts recorded when installing version failed."""
+        return self._conflicts.get(version)
+
+    def command_cwd(self) -> Optional[str]:
+        """Directory benchmark commands run in, so they see the installed version."""
+        return os.path.join(self.workspace, "src") if self.workspace else None
+
+    def command_env(self) -> Dict[str, str]:
+        """Environment benchmark commands run with, so they reuse the probe's build."""
+        return self._environment()
+
+    def close(self):
+        """Release the workspace and target directory, then prune old workspaces."""
+        release_mark(self._marker)
+        self._marker = None
+        if self._target_lock is not None:
+            self._target_lock.close()
+            self._target_lock = None
+        self._target_dir = None
+        prune_least_recent(self.workspaces_dir, self.keep_workspaces)
+
+    def run_tests(self, test_command: str = "cargo test", cancel: Optional[threading.Event] = None) -> Tuple[bool, str]:
+        """Build the tests, then run them, in the version's workspace; returns (success, output tail).
+
+        A build failure ends the probe before any test runs.
+        """
+        runner = get_test_runner()
+        args = test_command.split()
+        label = f"{self.package_name}-{self.version}"
+        cwd = os.path.join(self.workspace, "src")
+        env = self._environment()
+        if args[:2] == ["cargo", "test"]:
+            build = runner.run(args + ["--no-run"], cwd=cwd, env=env, label=f"{label}-build", cancel=cancel)
+            if not build.passed:
+                self.last_test_run = build
+                return False, build.output
+        self.last_test_run = runner.run(args, cwd=cwd, env=env, label=label,
+                                        failure_patterns=FAILURE_PATTERNS.get("cargo"), cancel=cancel)
+        return self.last_test_run.passed, self.last_test_run.output
@@ -0,0 +1,198 @@
+"""Offline benchmarks of DTM's search modes.
+
+A fake adapter serves versions from a synthetic in-memory registry and
+simulates installs and test runs with configurable latency, a failure
+boundary, uninstallable versions and flaky tests. Every scenario is run in
+every search mode, reporting probe counts, end-to-end time and the time
+spent in each phase, so changes that make DTM slower show up in CI.
+"""
+import io
+import json
+import random
+import threading
+import time
+from contextlib import redirect_stdout
+from typing import Dict, List, Optional, Tuple
+from instrument import get_tracer, span
+from parallel import parallel_search_versions
+from search import make_strategy
+
+TEST_COMMAND = "synthetic-tests"
+
+class Scenario:
+    """A synthetic package: its releases, where it breaks, and how slow and flaky it is."""
+
+    def __init__(self, name: str, majors: int = 3, minors: int = 5, patches: int = 4,
+                 boundary: float = 0.6, install_latency: float = 0.02, test_latency: float = 0.01,
+                 flakiness: float = 0.0, uninstallable: float = 0.0, seed: int = 0):
+        self.name = name
+        self.versions = [f"{major}.{minor}.{patch}" for major in range(1, majors + 1)
+                         for minor in range(minors) for patch in range(patches)]
+        # versions[boundary_index] is the first broken one; len(versions) if none breaks
+        self.boundary_index = min(len(self.versions), int(len(self.versions) * boundary))
+        self.install_latency = install_latency
+        self.test_latency = test_latency
+        self.flakiness = flakiness
+        rng = random.Random(seed)
+        # Versions past the boundary that cannot install (a resolver conflict)
+        self.uninstallable = {v for v in self.versions[self.boundary_index:] if rng.random() < uninstallable}
+        self.seed = seed
+
+    @property
+    def expected(self) -> Tuple[Optional[str], Optional[str]]:
+        """The (latest_working, first_broken) a correct search reports."""
+        latest = self.versions[self.boundary_index - 1] if self.boundary_index > 0 else None
+        broken = self.versions[self.boundary_index] if self.boundary_index < len(self.versions) else None
+        return latest, broken
+
+    def to_dict(self) -> Dict:
+        return {"versions": len(self.versions), "boundary": self.boundary_index,
+                "install_latency": self.install_latency, "test_latency": self.test_latency,
+                "flakiness": self.flakiness, "uninstallable": len(self.uninstallable)}
+
+SCENARIOS = {
+    "small": Scenario("small", majors=1, minors=4, patches=3, boundary=0.5),
+    "wide": Scenario("wide", majors=6, minors=10, patches=8, boundary=0.7),
+    "no-break": Scenario("no-break", majors=2, minors=8, patches=4, boundary=1.0),
+    "early-break": Scenario("early-break", majors=4, minors=6, patches=5, boundary=0.05),
+    "conflicts": Scenario("conflicts", majors=3, minors=8, patches=4, boundary=0.4, uninstallable=0.3, seed=3),
+    "flaky": Scenario("flaky", majors=3, minors=8, patches=4, boundary=0.5, flakiness=0.05, seed=7),
+}
+
+MODES = ["bisect", "bisect+verify", "hierarchical", "hierarchical+verify", "parallel-4"]
+
+class FakeAdapter:
+    """An adapter over a Scenario's in-memory registry that never touches the network."""
+
+    version_scheme = "semver"
+    parallel_safe = True
+
+    def __init__(self, package_name: str, scenario: Scenario, slot: int = 0):
+        self.package_name = package_name
+        self.scenario = scenario
+        self.version: Optional[str] = None
+        # Each slot has its own seeded stream so parallel runs stay reproducible
+        self._rng = random.Random(scenario.seed * 1000 + slot)
+
+    def enumerate_versions(self) -> List[str]:
+        return list(self.scenario.versions)
+
+    def install_version(self, version: str) -> bool:
+        time.sleep(self.scenario.install_latency)
+        self.version = version
+        return version not in self.scenario.uninstallable
+
+    def get_dependency_conflicts(self, version: str) -> Optional[Dict[str, List[str]]]:
+        if version in self.scenario.uninstallable:
+            return {"synthetic-dep": [f"requires a version incompatible with {self.package_name} {version}"]}
+        return None
+
+    def run_tests(self, test_command: str, cancel: Optional[threading.Event] = None) -> Tuple[bool, str]:
+        (cancel or threading.Event()).wait(self.scenario.test_latency)
+        passed = self.scenario.versions.index(self.version) < self.scenario.boundary_index
+        if passed and self._rng.random() < self.scenario.flakiness:
+            return False, "synthetic flaky failure"
+        return passed, "synthetic test run"
+
+def run_mode(scenario: Scenario, mode: str) -> Dict:
+    """Search scenario's registry in one mode and report probes, time and correctness."""
+    # Imported here because main imports this module
+    from main import binary_search_versions
+
+    tracer = get_tracer()
+    tracer.reset()
+    adapter = FakeAdapter(f"synthetic-{scenario.name}", scenario)
+    stats: Dict = {}
+    start = time.perf_counter()
+    # The searches' progress output would drown the report
+    with redirect_stdout(io.StringIO()):
+        with span("enumerate_versions", package=adapter.package_name):
+            versions = adapter.enumerate_versions()
+        if mode.startswith("parallel-"):
+            workers = int(mode.split("-", 1)[1])
+            latest_working, first_broken, _ = parallel_search_versions(
+                versions, lambda slot: FakeAdapter(adapter.package_name, scenario, slot), TEST_COMMAND, workers,
+                stats=stats)
+        else:
+            name, _, verify = mode.partition("+")
+            strategy = make_strategy(name, verify_boundary=bool(verify))
+            latest_working, first_broken, _ = binary_search_versions(versions, adapter, TEST_COMMAND,
+                                                                     stats=stats, strategy=strategy)
+    return {
+        "probes": stats.get("probes"),
+        "wall_time": round(time.perf_counter() - start, 4),
+        "correct": (latest_working, first_broken) == scenario.expected,
+        "latest_working": latest_working,
+        "first_broken": first_broken,
+        "phases": tracer.phases(),
+    }
+
+def run_benchmarks(scenarios: List[str], modes: List[str], repeat: int = 1) -> Dict:
+    """Run every scenario in every mode, keeping the fastest of ``repeat`` runs."""
+    tracer = get_tracer()
+    was_enabled = tracer.enabled
+    tracer.enabled = True
+    results: Dict[str, Dict] = {}
+    try:
+        for name in scenarios:
+            scenario = SCENARIOS[name]
+            results[name] = {"scenario": scenario.to_dict(), "modes": {}}
+            for mode in modes:
+                runs = [run_mode(scenario, mode) for _ in range(max(1, repeat))]
+                results[name]["modes"][mode] = min(runs, key=lambda run: run["wall_time"])
+    finally:
+        tracer.enabled = was_enabled
+    return results
+
+def compare(results: Dict, baseline: Dict, max_slowdown: float = 0.25) -> List[str]:
+    """Regressions of results against a previous run: more probes, slower runs or wrong answers."""
+    problems = []
+    for name, scenario in results.items():
+        for mode, run in scenario["modes"].items():
+            before = baseline.get(name, {}).get("modes", {}).get(mode)
+            if not run["correct"] and not (before and not before["correct"]):
+                problems.append(f"{name}/{mode}: found {run['latest_working']}..{run['first_broken']}")
+            if before is None:
+                continue
+            if run["probes"] > before["probes"]:
+                problems.append(f"{name}/{mode}: {run['probes']} probes, was {before['probes']}")
+            if run["wall_time"] > before["wall_time"] * (1 + max_slowdown):
+                problems.append(f"{name}/{mode}: {run['wall_time']}s, was {before['wall_time']}s")
+    return problems
+
+def format_table(results: Dict) -> str:
+    lines = [f"{'scenario':<12} {'mode':<20} {'probes':>6} {'time':>8} {'install':>8} {'tests':>8}  ok"]
+    for name, scenario in results.items():
+        for mode, run in scenario["modes"].items():
+            phases = run["phases"]
+            lines.append(f"{name:<12} {mode:<20} {run['probes']:>6} {run['wall_time']:>7.3f}s "
+                         f"{phases.get('install_version', {}).get('wall', 0):>7.3f}s "
+                         f"{phases.get('run_tests', {}).get('wall', 0):>7.3f}s  {'✅' if run['correct'] else '❌'}")
+    return "\n".join(lines)
+
+def bench(scenarios: List[str], modes: List[str], repeat: int = 3, output: Optional[str] = None,
+          baseline_path: Optional[str] = None, max_slowdown: float = 0.25) -> int:
+    """Run the benchmarks for ``main.py bench``; returns the exit status.
+
+    With ``baseline_path`` the run fails when any scenario needs more
+    probes, gets slower by more than ``max_slowdown`` or finds a wrong
+    boundary compared to that earlier output.
+    """
+    print(f"🏁 Benchmarking {len(modes)} search modes on {len(scenarios)} synthetic registries...")
+    results = run_benchmarks(scenarios, modes, repeat=repeat)
+    print("\n" + format_table(results))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    problems = []
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            problems = compare(results, json.load(f), max_slowdown=max_slowdown)
+        if problems:
+            print(f"\n❌ {len(problems)} regressions against {baseline_path}:")
+            for problem in problems:
+                print(f"  - {problem}")
+        else:
+            print(f"\n✅ No regressions against {baseline_path}")
+    print("\n" + json.dumps(results))
+    return 1 if problems else 0
@@ -0,0 +1,188 @@
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Files whose contents decide whether a cached probe result is still valid.
+SOURCE_EXTENSIONS = {".py", ".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".rs"}
+MANIFEST_FILES = {
+    "requirements.txt", "setup.py", "setup.cfg", "pyproject.toml", "poetry.lock",
+    "Pipfile", "Pipfile.lock", "package.json", "package-lock.json", "yarn.lock",
+    "pnpm-lock.yaml", "Cargo.toml", "Cargo.lock",
+}
+# Test runner and build tool configuration, matched against file names or relative paths
+CONFIG_PATTERNS = [
+    "pytest.ini", "tox.ini", "noxfile.py", ".coveragerc", ".python-version",
+    "tsconfig*.json", "jsconfig.json", ".npmrc", ".nvmrc", ".babelrc", "babel.config.*",
+    "jest.config.*", "vitest.config.*", ".mocharc*", "rust-toolchain", "rust-toolchain.toml",
+    ".cargo/config*", "*/.cargo/config*",
+]
+# Every file below these directories is test data the results depend on
+TEST_DATA_DIRS = {"tests", "test", "__tests__", "spec", "fixtures", "testdata", "test_data"}
+IGNORED_DIRS = {".git", ".dtm", "venv", ".venv", "node_modules", "target", "__pycache__", ".pytest_cache", ".tox"}
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+def default_cache_dir() -> str:
+    """Return the directory DTM uses for persistent caches."""
+    return os.environ.get("DTM_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "dtm")
+
+def fingerprinted(relative: str) -> bool:
+    """Whether a project file, by its path relative to the root, can change test results."""
+    relative = relative.replace(os.sep, "/")
+    parts = relative.split("/")
+    name = parts[-1]
+    return (
+        os.path.splitext(name)[1] in SOURCE_EXTENSIONS or name in MANIFEST_FILES
+        or (name.startswith("requirements") and name.endswith(".txt"))
+        or any(fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(relative, pattern)
+               for pattern in CONFIG_PATTERNS)
+        or any(part in TEST_DATA_DIRS for part in parts[:-1])
+    )
+
+_toolchain_lock = threading.Lock()
+_toolchain_versions: Dict[Tuple[str, int], str] = {}
+
+def toolchain_versions() -> Dict[str, str]:
+    """Versions of the interpreters and compilers probes run under.
+
+    Each binary is asked once per path and mtime, so an upgrade in place
+    is still noticed by a long-lived process.
+    """
+    versions = {"python": sys.version}
+    for tool in ("node", "rustc"):
+        binary = shutil.which(tool)
+        if binary is None:
+            continue
+        try:
+            key = (os.path.realpath(binary), os.stat(binary).st_mtime_ns)
+        except OSError:
+            continue
+        with _toolchain_lock:
+            version = _toolchain_versions.get(key)
+        if version is None:
+            try:
+                version = subprocess.run([binary, "--version"], capture_output=True, text=True,
+                                         timeout=30).stdout.strip()
+            except (OSError, subprocess.SubprocessError):
+                continue
+            with _toolchain_lock:
+                _toolchain_versions[key] = version
+        versions[tool] = version
+    return versions
+
+def project_fingerprint(root: str = ".") -> str:
+    """Hash the project's source, test data, config, manifest and lock files.
+
+    The toolchain versions are part of the hash too, so results cached
+    under one interpreter or compiler are not reused after an upgrade.
+    """
+    digest = hashlib.sha256(json.dumps(toolchain_versions(), sort_keys=True).encode())
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_DIRS)
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if not fingerprinted(os.path.relpath(path, root)):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+            except OSError:
+                continue
+            digest.update(os.path.relpath(path, root).replace(os.sep, "/").encode())
+            digest.update(b"\0")
+            digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+def project_scoped_fingerprint(fingerprint: Optional[str], project: str) -> Optional[str]:
+    """The fingerprint of probes run in the sub-project at project, which must not share the root's results."""
+    if fingerprint is None or project == ".":
+        return fingerprint
+    return hashlib.sha256(f"{fingerprint}\0{project}".encode()).hexdigest()
+
+class ResultCache:
+    """On-disk store of probe results keyed by project fingerprint and probe."""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.path = path or os.path.join(default_cache_dir(), "results.sqlite3")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    adapter TEXT NOT NULL,
+                    package TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+        self.evict()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call keeps the cache safe to share between threads,
+        # and SQLite's own locking handles concurrent DTM processes.
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(fingerprint: str, adapter: str, package: str, version: str, test_command: str) -> str:
+        """Build the cache key for a single probe."""
+        payload = json.dumps([fingerprint, adapter, package, version, test_command])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached result for key, or None if absent or expired."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.max_age:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, adapter: str, package: str, version: str, result: Dict):
+        """Store the result of a probe."""
+        now = time.time()
+        payload = json.dumps(result)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, adapter, package, version, payload, len(payload), now, now)
+            )
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones beyond max_bytes."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - self.max_age,))
+            conn.execute("""
+                DELETE FROM results WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_used DESC) AS running
+                        FROM results
+                    ) WHERE running > ?
+                )
+            """, (self.max_bytes,))
+
+    def clear(self):
+        """Remove every cached result."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
@@ -0,0 +1,577 @@
+"""Probes spread over worker processes, possibly on other hosts.
+
+A coordinator turns every probe of a search into a task (package,
+language, version, test command, project fingerprint and the directory of
+the sub-project to probe in) and serves them
+over HTTP with JSON bodies. Benchmark runs of a performance bisection are
+tasks too (``kind`` "benchmark", with the command and sample count):
+
+- ``POST /register``: a worker announces its host, slots and project
+  fingerprint, and learns its id and heartbeat interval
+- ``POST /lease``: a worker asks for a task, waiting up to ``wait`` seconds
+- ``POST /heartbeat``: extends a task's lease; the answer says whether the
+  task was cancelled in the meantime
+- ``POST /result``: the probe result, with the gzip test log attached
+- ``GET /status``: workers and queue lengths
+
+Tasks go to a per-worker queue, preferring the worker that last probed the
+same package since its sandboxes are warm. A worker with an empty queue
+steals the newest task from the longest queue. Benchmarks are pinned to the
+worker that measured the baseline, so their timings compare, and are never
+stolen. A task whose lease is not renewed in time is queued again, up to
+``max_attempts`` times.
+"""
+import base64
+import json
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, List, Optional, Tuple
+import requests
+from events import emit
+from perf import PerformanceBisector, summarize
+from probe import lookup_cached, probe_version, store_result
+from runner import get_test_runner
+
+DEFAULT_PORT = 8765
+DEFAULT_LEASE_TIMEOUT = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+# Longest a lease request waits for a task before answering "nothing yet"
+LEASE_WAIT = 10.0
+# Larger logs are not sent to the coordinator; the worker keeps them
+MAX_LOG_BYTES = 8 * 1024 * 1024
+# Packages whose adapters a worker slot keeps warm; older ones are closed
+SLOT_ADAPTERS = 4
+
+class CoordinatorError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def affinity_key(spec: Dict) -> Tuple[str, str, str]:
+    """What makes a worker's sandboxes warm for a task: its language, package and project."""
+    return spec["language"], spec["package"], spec.get("project", ".")
+
+class Task:
+    """One probe and its lease."""
+
+    def __init__(self, spec: Dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.spec = dict(spec, id=self.id)
+        self.attempts = 0
+        self.worker: Optional[str] = None
+        self.deadline = 0.0
+        self.cancelled = False
+        self.result: Optional[Dict] = None
+        self.done = threading.Event()
+
+class Coordinator:
+    """Hands out probe tasks to workers and collects their results."""
+
+    def __init__(self, fingerprint: Optional[str] = None, lease_timeout: float = DEFAULT_LEASE_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, token: Optional[str] = None):
+        self.fingerprint = fingerprint
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.token = token
+        self.workers: Dict[str, Dict] = {}
+        self.queues: Dict[str, Deque[Task]] = {}
+        self.unassigned: Deque[Task] = deque()
+        self.tasks: Dict[str, Task] = {}
+        self.affinity: Dict[Tuple[str, str, str], str] = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # Worker side of the protocol
+
+    def register(self, info: Dict) -> Dict:
+        fingerprint = info.get("fingerprint")
+        if self.fingerprint and fingerprint and fingerprint != self.fingerprint:
+            raise CoordinatorError(409, "the worker's checkout of the project differs from the coordinator's")
+        worker_id = f"{info.get('host', 'worker')}-{info.get('pid', 0)}-{uuid.uuid4().hex[:6]}"
+        with self._condition:
+            self.workers[worker_id] = {"id": worker_id, "host": info.get("host"), "pid": info.get("pid"),
+                                       "slots": max(1, int(info.get("slots", 1))), "last_seen": time.monotonic(),
+                                       "completed": 0}
+            self.queues[worker_id] = deque()
+            self._condition.notify_all()
+        print(f"🤝 Worker {worker_id} joined with {self.workers[worker_id]['slots']} slots")
+        return {"worker": worker_id, "heartbeat_interval": self.lease_timeout / 4, "lease_timeout": self.lease_timeout}
+
+    def _seen(self, worker_id: str) -> Dict:
+        worker = self.workers.get(worker_id)
+        if worker is None:
+            raise CoordinatorError(404, f"unknown worker {worker_id}; register again")
+        worker["last_seen"] = time.monotonic()
+        return worker
+
+    def _next_task(self, worker_id: str) -> Optional[Task]:
+        own = self.queues[worker_id]
+        if own:
+            return own.popleft()
+        # Steal the newest task from the longest queue; its owner gets to the older ones first
+        for victim in sorted(self.queues.values(), key=len, reverse=True):
+            for task in reversed(victim):
+                if not task.spec.get("pinned_to"):
+                    victim.remove(task)
+                    return task
+        if self.unassigned:
+            return self.unassigned.popleft()
+        return None
+
+    def lease(self, worker_id: str, wait: float = LEASE_WAIT) -> Optional[Dict]:
+        deadline = time.monotonic() + min(wait, LEASE_WAIT)
+        with self._condition:
+            while True:
+                self._seen(worker_id)
+                task = self._next_task(worker_id)
+                if task is not None:
+                    task.worker = worker_id
+                    task.attempts += 1
+                    task.deadline = time.monotonic() + self.lease_timeout
+                    self.affinity[affinity_key(task.spec)] = worker_id
+                    spec = dict(task.spec, attempt=task.attempts)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopped.is_set():
+                    return None
+                self._condition.wait(remaining)
+        emit("probe_started", package=spec["package"], version=spec["version"], worker=worker_id)
+        return spec
+
+    def heartbeat(self, worker_id: str, task_id: str) -> Dict:
+        with self._condition:
+            self._seen(worker_id)
+            task = self.tasks.get(task_id)
+            if task is None or task.worker != worker_id:
+                # Finished, cancelled or handed to another worker after the lease ran out
+                return {"cancelled": True}
+            task.deadline = time.monotonic() + self.lease_timeout
+            return {"cancelled": task.cancelled}
+
+    def complete(self, worker_id: str, task_id: str, result: Optional[Dict]) -> Dict:
+        with self._condition:
+            worker = self._seen(worker_id)
+            task = self.tasks.get(task_id)
+            if task is None or task.worker != worker_id:
+                return {"accepted": False}
+            if task.cancelled:
+                del self.tasks[task_id]
+                return {"accepted": False}
+            if result is None:
+                # The worker gave up on a task nobody cancelled; let another one try
+                task.worker = None
+                self._place(task, front=True)
+                self._condition.notify_all()
+                return {"accepted": False}
+            del self.tasks[task_id]
+            worker["completed"] += 1
+        task.result = self._store_log(dict(result, worker=worker_id), task)
+        task.done.set()
+        return {"accepted": True}
+
+    def _store_log(self, result: Dict, task: Task) -> Dict:
+        """Write an attached gzip log next to the local test logs and point the result at it."""
+        encoded = result.pop("log_gz", None)
+        if encoded:
+            log_dir = get_test_runner().log_dir
+            label = re.sub(r"[^A-Za-z0-9._-]+", "_", f"{task.spec['package']}-{task.spec['version']}")[:80]
+            path = os.path.join(log_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{task.id}.log.gz")
+            try:
+                os.makedirs(log_dir, exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(base64.b64decode(encoded))
+                result["log"] = path
+            except (OSError, ValueError):
+                pass
+        return result
+
+    # Search side
+
+    def submit(self, spec: Dict) -> Task:
+        """Queue a probe, preferably with the worker that already has the package warm."""
+        task = Task(spec)
+        with self._condition:
+            self.tasks[task.id] = task
+            self._place(task)
+            self._condition.notify_all()
+        return task
+
+    def _place(self, task: Task, front: bool = False):
+        owner = task.spec.get("pinned_to") or self.affinity.get(affinity_key(task.spec))
+        if owner not in self.workers:
+            candidates = list(self.workers.values())
+            owner = min(candidates, key=lambda w: len(self.queues[w["id"]]) / w["slots"])["id"] if candidates else None
+        queue = self.queues[owner] if owner else self.unassigned
+        if front:
+            queue.appendleft(task)
+        else:
+            queue.append(task)
+
+    def cancel(self, task: Task):
+        """Withdraw a queued task, or ask its worker to stop at the next heartbeat."""
+        with self._condition:
+            if task.done.is_set():
+                return
+            task.cancelled = True
+            for queue in [self.unassigned, *self.queues.values()]:
+                if task in queue:
+                    queue.remove(task)
+                    self.tasks.pop(task.id, None)
+                    break
+        task.done.set()
+
+    def wait(self, task: Task, cancel: Optional[threading.Event] = None) -> Optional[Dict]:
+        """The task's result, or None if cancel is set first."""
+        while not task.done.wait(0.1):
+            if cancel is not None and cancel.is_set():
+                self.cancel(task)
+        return None if task.cancelled else task.result
+
+    def capacity(self) -> int:
+        """Probe slots of all registered workers."""
+        with self._condition:
+            return sum(worker["slots"] for worker in self.workers.values())
+
+    def wait_for_workers(self, count: int, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while len(self.workers) < count:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def expire(self):
+        """Re-queue tasks whose lease ran out and drop workers that stopped calling in."""
+        now = time.monotonic()
+        failed = []
+        with self._condition:
+            for worker_id, worker in list(self.workers.items()):
+                if now - worker["last_seen"] > self.lease_timeout:
+                    print(f"💤 Worker {worker_id} stopped responding; re-queueing its tasks")
+                    del self.workers[worker_id]
+                    self.unassigned.extend(self.queues.pop(worker_id))
+                    self.affinity = {key: owner for key, owner in self.affinity.items() if owner != worker_id}
+            for task in list(self.tasks.values()):
+                if task.worker is None or task.deadline > now:
+                    continue
+                task.worker = None
+                if task.cancelled:
+                    del self.tasks[task.id]
+                elif task.attempts >= self.max_attempts:
+                    del self.tasks[task.id]
+                    failed.append(task)
+                else:
+                    print(f"⏰ Lease on {task.spec['package']} {task.spec['version']} expired; re-queueing")
+                    self._place(task, front=True)
+            self._condition.notify_all()
+        for task in failed:
+            task.result = {"version": task.spec["version"], "installed": False, "passed": False, "conflicts": None,
+                           "error": f"no worker finished the probe in {task.attempts} attempts"}
+            task.done.set()
+
+    def status(self) -> Dict:
+        with self._condition:
+            return {
+                "workers": [dict(worker, queued=len(self.queues[worker["id"]]),
+                                 last_seen=round(time.monotonic() - worker["last_seen"], 3))
+                            for worker in self.workers.values()],
+                "unassigned": len(self.unassigned),
+                "leased": sum(1 for task in self.tasks.values() if task.worker),
+            }
+
+    # Transport
+
+    def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> Tuple[str, int]:
+        """Answer workers on host:port from background threads; returns the bound address."""
+        coordinator = self
+
+        class Handler(CoordinatorHandler):
+            pass
+        Handler.coordinator = coordinator
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        def reap():
+            while not self._stopped.wait(1.0):
+                self.expire()
+        threading.Thread(target=reap, daemon=True).start()
+        return self._server.server_address[:2]
+
+    def shutdown(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    coordinator: Coordinator
+
+    def log_message(self, format, *args):
+        pass  # requests are too frequent to log
+
+    def _reply(self, status: int, body: Optional[Dict] = None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self) -> bool:
+        token = self.coordinator.token
+        if token and self.headers.get("Authorization") != f"Bearer {token}":
+            self._reply(401, {"error": "missing or wrong token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/status":
+            self._reply(200, self.coordinator.status())
+        else:
+            self._reply(404, {"error": f"no such endpoint {self.path}"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            coordinator = self.coordinator
+            if self.path == "/register":
+                self._reply(200, coordinator.register(body))
+            elif self.path == "/lease":
+                task = coordinator.lease(body["worker"], float(body.get("wait", LEASE_WAIT)))
+                self._reply(200, {"task": task})
+            elif self.path == "/heartbeat":
+                self._reply(200, coordinator.heartbeat(body["worker"], body["task"]))
+            elif self.path == "/result":
+                self._reply(200, coordinator.complete(body["worker"], body["task"], body.get("result")))
+            else:
+                self._reply(404, {"error": f"no such endpoint {self.path}"})
+        except CoordinatorError as e:
+            self._reply(e.status, {"error": e.message})
+        except (KeyError, TypeError, ValueError) as e:
+            self._reply(400, {"error": f"bad request: {e}"})
+
+class RemoteProber:
+    """Runs one package's probes on the coordinator's workers, for ``parallel_search_versions``.
+
+    Results are looked up in and stored to the local result cache the same
+    way local probes are.
+    """
+
+    def __init__(self, coordinator: Coordinator, adapter, language: str, test_command: str,
+                 cache=None, fingerprint: Optional[str] = None, project: str = "."):
+        self.coordinator = coordinator
+        self.adapter = adapter
+        self.language = language
+        self.test_command = test_command
+        self.cache = cache
+        self.fingerprint = fingerprint
+        self.project = project
+
+    def __call__(self, version: str, cancel: threading.Event) -> Optional[Dict]:
+        package = self.adapter.package_name
+        cached = lookup_cached(self.adapter, version, self.test_command, self.cache, self.fingerprint)
+        if cached is not None:
+            print(f"⚡ Using cached result for version {version}")
+            emit("test_result", package=package, version=version, installed=cached["installed"],
+                 passed=cached["passed"], cached=True)
+            return cached
+        task = self.coordinator.submit({"package": package, "language": self.language, "version": version,
+                                        "test_command": self.test_command, "fingerprint": self.fingerprint,
+                                        "project": self.project})
+        result = self.coordinator.wait(task, cancel)
+        if result is None:
+            return None
+        emit("test_result", package=package, version=version, installed=result["installed"],
+             passed=result["passed"], cached=False, worker=result.get("worker"))
+        if "error" not in result:
+            store_result(self.adapter, version, self.test_command, result, self.cache, self.fingerprint)
+        return result
+
+    def works(self, version: str) -> bool:
+        result = self(version, threading.Event())
+        return bool(result) and result["installed"] and result["passed"]
+
+class RemoteBenchmark:
+    """Samples one package's benchmark on the coordinator's workers, for ``PerformanceBisector``.
+
+    Every version is measured on the worker that measured the first one;
+    another worker takes over only if that one leaves.
+    """
+
+    def __init__(self, coordinator: Coordinator, adapter, language: str, command: str, samples: int,
+                 fingerprint: Optional[str] = None, project: str = "."):
+        self.coordinator = coordinator
+        self.adapter = adapter
+        self.language = language
+        self.command = command
+        self.samples = samples
+        self.fingerprint = fingerprint
+        self.project = project
+        self.worker: Optional[str] = None
+
+    def __call__(self, version: str) -> Dict:
+        spec = {"kind": "benchmark", "package": self.adapter.package_name, "language": self.language,
+                "version": version, "command": self.command, "samples": self.samples,
+                "fingerprint": self.fingerprint, "project": self.project, "pinned_to": self.worker}
+        result = self.coordinator.wait(self.coordinator.submit(spec)) or {}
+        if "latency" not in result:
+            empty = summarize([])
+            return {"latency": empty, "cpu": empty, "rss_kb": empty,
+                    "error": result.get("error", "the benchmark did not run on any worker")}
+        self.worker = self.worker or result.get("worker")
+        return result
+
+class Worker:
+    """Leases probe tasks from a coordinator and runs them in this checkout of the project.
+
+    Each of ``slots`` threads keeps its own adapters for the
+    ``SLOT_ADAPTERS`` packages it probed last, so repeated probes of a
+    package reuse that slot's warm sandboxes. ``adapter_factory`` is called
+    with the package, language and the task's project directory.
+    """
+
+    def __init__(self, url: str, adapter_factory, slots: int = 1, token: Optional[str] = None,
+                 fingerprint: Optional[str] = None, cache=None):
+        self.url = url.rstrip("/")
+        self.adapter_factory = adapter_factory
+        self.slots = max(1, slots)
+        self.fingerprint = fingerprint
+        self.cache = cache
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.worker_id: Optional[str] = None
+        self.heartbeat_interval = DEFAULT_LEASE_TIMEOUT / 4
+        self.stopped = threading.Event()
+        self._register_lock = threading.Lock()
+
+    def _post(self, path: str, body: Dict, timeout: float = 30.0) -> Dict:
+        response = self.session.post(f"{self.url}{path}", json=body, timeout=timeout)
+        if response.status_code != 200:
+            message = response.json().get("error", response.text) if response.content else response.reason
+            raise CoordinatorError(response.status_code, message)
+        return response.json()
+
+    def register(self, stale: Optional[str] = None):
+        with self._register_lock:
+            if self.worker_id != stale:
+                return  # another slot registered again already
+            reply = self._post("/register", {"host": socket.gethostname(), "pid": os.getpid(),
+                                             "slots": self.slots, "fingerprint": self.fingerprint})
+            self.worker_id = reply["worker"]
+            self.heartbeat_interval = reply["heartbeat_interval"]
+        print(f"🤝 Registered with {self.url} as {self.worker_id}")
+
+    def run(self):
+        """Serve tasks until stopped or interrupted."""
+        self.register()
+        threads = [threading.Thread(target=self._slot, args=(slot,), daemon=True) for slot in range(self.slots)]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            print("\n👋 Worker stopping")
+        self.stopped.set()
+
+    def _slot(self, slot: int):
+        adapters: "OrderedDict[Tuple[str, str, str], object]" = OrderedDict()
+        try:
+            self._serve_slot(adapters)
+        finally:
+            for adapter in adapters.values():
+                if hasattr(adapter, 'close'):
+                    adapter.close()
+
+    def _serve_slot(self, adapters: "OrderedDict[Tuple[str, str, str], object]"):
+        while not self.stopped.is_set():
+            worker_id = self.worker_id
+            try:
+                task = self._post("/lease", {"worker": worker_id, "wait": LEASE_WAIT}, timeout=LEASE_WAIT + 30)["task"]
+            except CoordinatorError as e:
+                if e.status == 404:
+                    self.register(stale=worker_id)
+                    continue
+                print(f"❌ Coordinator refused the worker: {e.message}")
+                self.stopped.set()
+                return
+            except requests.RequestException as e:
+                print(f"Coordinator unreachable, retrying: {e}")
+                self.stopped.wait(self.heartbeat_interval)
+                continue
+            if task is None:
+                continue
+            key = affinity_key(task)
+            if key not in adapters:
+                adapters[key] = self.adapter_factory(task["package"], task["language"], key[2])
+                if len(adapters) > SLOT_ADAPTERS:
+                    _, oldest = adapters.popitem(last=False)
+                    if hasattr(oldest, 'close'):
+                        oldest.close()
+            adapters.move_to_end(key)
+            result = self._execute(adapters[key], task, worker_id)
+            try:
+                self._post("/result", {"worker": worker_id, "task": task["id"], "result": result})
+            except (CoordinatorError, requests.RequestException) as e:
+                print(f"Could not report {task['package']} {task['version']}: {e}")
+
+    def _execute(self, adapter, task: Dict, worker_id: str) -> Optional[Dict]:
+        """Probe or benchmark the task's version while heartbeating; None if the coordinator cancelled it."""
+        benchmark = task.get("kind") == "benchmark"
+        if not benchmark:
+            print(f"\nTesting {task['package']} {task['version']} (attempt {task['attempt']})...")
+        cancel = threading.Event()
+        finished = threading.Event()
+
+        def heartbeat():
+            while not finished.wait(self.heartbeat_interval):
+                try:
+                    if self._post("/heartbeat", {"worker": worker_id, "task": task["id"]})["cancelled"]:
+                        cancel.set()
+                        return
+                except (CoordinatorError, requests.RequestException):
+                    pass  # the lease runs out on its own if the coordinator is gone
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            if benchmark:
+                bisector = PerformanceBisector(adapter, task["command"], samples=task["samples"])
+                result = bisector.collect(task["version"])
+            else:
+                result = probe_version(adapter, task["version"], task["test_command"],
+                                       cache=self.cache, fingerprint=task.get("fingerprint"), cancel=cancel)
+        except Exception as e:
+            result = {"version": task["version"], "installed": False, "passed": False, "conflicts": None,
+                      "error": f"{type(e).__name__}: {e}"}
+        finally:
+            finished.set()
+        if result is None:
+            return None
+        if benchmark:
+            return result
+        run = getattr(adapter, 'last_test_run', None)
+        if run is not None and result.get("installed") and not result.get("cached"):
+            result["output"] = run.output
+            if run.log_path and os.path.exists(run.log_path) and os.path.getsize(run.log_path) <= MAX_LOG_BYTES:
+                with open(run.log_path, "rb") as f:
+                    result["log_gz"] = base64.b64encode(f.read()).decode()
+        print(f"{'✅' if result.get('passed') else '❌'} {task['package']} {task['version']}")
+        return result
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import uuid
+from typing import List, Optional, Tuple
+from cache import default_cache_dir
+from workspaces import pid_alive
+
+def _python_in(venv_path: str) -> str:
+    """Path to the interpreter of a virtual environment."""
+    if sys.platform == "win32":
+        return os.path.join(venv_path, "Scripts", "python.exe")
+    return os.path.join(venv_path, "bin", "python")
+
+def _link_or_copy(src: str, dst: str):
+    """Hardlink a file into a clone, copying when links are not possible."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+class Environment:
+    """A disposable clone of the baseline virtual environment."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.python = _python_in(path)
+
+    def pip_install(self, *requirements: str) -> Tuple[bool, str]:
+        """Run a single pip install and return (success, stderr)."""
+        result = subprocess.run(
+            [self.python, "-m", "pip", "install", "--disable-pip-version-check", *requirements],
+            capture_output=True,
+            text=True
+        )
+        return result.returncode == 0, result.stderr
+
+class EnvironmentManager:
+    """Builds a baseline venv once and hands out cheap hardlinked clones.
+
+    pip unlinks files before rewriting them, so installing into a clone never
+    touches the baseline's copies. Warm clones are kept in ``pool/`` and
+    survive between runs; a clone is claimed by renaming it into ``in-use/``
+    and is thrown away when released. The pool is kept at ``pool_size``
+    clones however many are in use.
+
+    The baseline installs ``requirements_path`` when it exists, and the
+    ``requirements`` specifiers otherwise (for projects that declare their
+    dependencies in ``pyproject.toml`` or ``poetry.lock``).
+    """
+
+    def __init__(self, requirements_path: str = "requirements.txt",
+                 extra_requirements: Optional[List[str]] = None, pool_size: int = 2,
+                 requirements: Optional[List[str]] = None):
+        self.requirements_path = os.path.abspath(requirements_path)
+        self.requirements = list(requirements or [])
+        self.extra_requirements = extra_requirements if extra_requirements is not None else ["pytest"]
+        self.pool_size = pool_size
+        self.root = os.path.join(default_cache_dir(), "envs", self._baseline_key())
+        self.baseline_path = os.path.join(self.root, "baseline")
+        self.pool_dir = os.path.join(self.root, "pool")
+        self.in_use_dir = os.path.join(self.root, "in-use")
+        self._lock = threading.Lock()
+        self._baseline_lock = threading.Lock()
+        self._refilling = False
+        os.makedirs(self.pool_dir, exist_ok=True)
+        os.makedirs(self.in_use_dir, exist_ok=True)
+        self._remove_stale_clones()
+
+    def _baseline_key(self) -> str:
+        digest = hashlib.sha256(sys.version.encode())
+        digest.update("\n".join(self.extra_requirements).encode())
+        if os.path.exists(self.requirements_path):
+            with open(self.requirements_path, "rb") as f:
+                digest.update(f.read())
+        else:
+            digest.update("\n".join(["--"] + self.requirements).encode())
+        return digest.hexdigest()[:16]
+
+    def _remove_stale_clones(self):
+        """Delete clones and staging dirs left behind by DTM processes that have exited."""
+        leftovers = [os.path.join(self.in_use_dir, name) for name in os.listdir(self.in_use_dir)]
+        leftovers += [os.path.join(self.root, name) for name in os.listdir(self.root) if name.startswith("staging-")]
+        for path in leftovers:
+            pid = os.path.basename(path).replace("staging-", "").split("-", 1)[0]
+            if pid.isdigit() and not pid_alive(int(pid)):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def ensure_baseline(self):
+        """Create the baseline venv with the project's requirements if missing."""
+        with self._baseline_lock:
+            if os.path.exists(self.baseline_path):
+                return
+            # Build under a private name and rename, so concurrent DTM processes
+            # never see a half-built baseline.
+            staging = os.path.join(self.root, f"staging-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+            try:
+                subprocess.run([sys.executable, "-m", "venv", staging], check=True)
+                install = [_python_in(staging), "-m", "pip", "install", "--disable-pip-version-check"]
+                if os.path.exists(self.requirements_path):
+                    subprocess.run(install + ["-r", self.requirements_path], check=True)
+                elif self.requirements:
+                    subprocess.run(install + self.requirements, check=True)
+                if self.extra_requirements:
+                    subprocess.run(install + self.extra_requirements, check=True)
+                try:
+                    os.rename(staging, self.baseline_path)
+                except OSError:
+                    pass  # another process finished first
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+    @property
+    def baseline_python(self) -> str:
+        """Interpreter of the baseline venv, building it first if needed."""
+        self.ensure_baseline()
+        return _python_in(self.baseline_path)
+
+    def _clone(self, destination: str):
+        shutil.copytree(self.baseline_path, destination, symlinks=True, copy_function=_link_or_copy)
+
+    def _new_warm_clone(self):
+        staging = os.path.join(self.root, f"staging-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        self._clone(staging)
+        os.rename(staging, os.path.join(self.pool_dir, uuid.uuid4().hex[:12]))
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    if len(os.listdir(self.pool_dir)) >= self.pool_size:
+                        self._refilling = False
+                        return
+                self._new_warm_clone()
+        except OSError:
+            with self._lock:
+                self._refilling = False
+
+    def _schedule_refill(self):
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def acquire(self) -> Environment:
+        """Take a clone from the warm pool, cloning a fresh one if it is empty."""
+        self.ensure_baseline()
+        destination = os.path.join(self.in_use_dir, f"{os.getpid()}-{uuid.uuid4().hex[:12]}")
+        for name in os.listdir(self.pool_dir):
+            try:
+                os.rename(os.path.join(self.pool_dir, name), destination)
+                break
+            except OSError:
+                continue  # claimed by another worker
+        else:
+            self._clone(destination)
+        self._schedule_refill()
+        return Environment(destination)
+
+    def release(self, env: Environment):
+        """Discard a used clone."""
+        threading.Thread(target=shutil.rmtree, args=(env.path, True), daemon=True).start()
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_environment_manager(requirements_path: str = "requirements.txt",
+                            requirements: Optional[List[str]] = None) -> EnvironmentManager:
+    """Return the process-wide manager for a requirements file, or for parsed requirements without one."""
+    key = (os.path.abspath(requirements_path), tuple(requirements or ()))
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = EnvironmentManager(requirements_path, requirements=requirements)
+        return _managers[key]
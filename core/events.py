@@ -0,0 +1,43 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+Listener = Callable[[str, Dict], None]
+
+_listeners: List[Tuple[Listener, Optional[str]]] = []
+_listeners_lock = threading.Lock()
+# The request an event belongs to; worker threads inherit it through copy_context()
+_scope: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("dtm_event_scope", default=None)
+
+def subscribe(listener: Listener, scope: Optional[str] = None):
+    """Register a callback that receives progress events as (event, fields).
+
+    With a scope, only events emitted inside ``event_scope(scope)`` reach it.
+    """
+    with _listeners_lock:
+        _listeners.append((listener, scope))
+
+def unsubscribe(listener: Listener):
+    with _listeners_lock:
+        _listeners[:] = [entry for entry in _listeners if entry[0] != listener]
+
+@contextmanager
+def event_scope(scope: str):
+    """Tag every event emitted by this thread, and threads it starts with a copied context, with scope."""
+    token = _scope.set(scope)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def emit(event: str, **fields):
+    """Send a progress event to its listeners; a failing listener is dropped."""
+    scope = _scope.get()
+    with _listeners_lock:
+        listeners = [listener for listener, wanted in _listeners if wanted is None or wanted == scope]
+    for listener in listeners:
+        try:
+            listener(event, fields)
+        except Exception:
+            unsubscribe(listener)
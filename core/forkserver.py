@@ -0,0 +1,313 @@
+"""Fork-server ("zygote") for Python test runs.
+
+The zygote runs in the baseline venv, imports the modules a test run needs
+that cannot reach the package under test, and then forks one child per test
+run. The child re-points ``sys.path`` at the probe's venv clone, so the
+package under test and everything not yet imported come from the clone.
+
+This file runs both inside DTM and, by path, under the baseline venv's
+interpreter (``zygote`` and ``client`` modes), so it only uses the
+standard library.
+"""
+import filecmp
+import hashlib
+import importlib
+import json
+import os
+import runpy
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import traceback
+from typing import Dict, List, Optional
+
+# Exit status of a client whose run could not use the zygote; the caller
+# then runs the tests cold.
+STALE_EXIT = 75
+READY_TIMEOUT = 300
+
+def supported() -> bool:
+    return hasattr(os, "fork") and hasattr(socket, "send_fds") and hasattr(socket, "AF_UNIX")
+
+def _same_file(baseline_file: str, clone_file: str) -> bool:
+    """Clones hardlink the baseline; pip replaces files it changes, so compare those by content."""
+    try:
+        a, b = os.stat(baseline_file), os.stat(clone_file)
+    except OSError:
+        return False
+    if (a.st_ino, a.st_dev) == (b.st_ino, b.st_dev):
+        return True
+    return a.st_size == b.st_size and filecmp.cmp(baseline_file, clone_file, shallow=False)
+
+def _stale_module(baseline: str, clone: str) -> Optional[str]:
+    """Name of a preloaded module whose file differs in the clone, if any."""
+    prefix = baseline + os.sep
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path and path.startswith(prefix) and not _same_file(path, clone + path[len(baseline):]):
+            return name
+    return None
+
+def _run_child(request: Dict, fds: List[int]):
+    """Body of the forked test process; never returns."""
+    code = 1
+    try:
+        os.setsid()
+        for fd, target in zip(fds, (0, 1, 2)):
+            os.dup2(fd, target)
+        for fd in fds:
+            os.close(fd)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["environ"])
+
+        baseline, clone = sys.prefix, request["prefix"]
+        stale = _stale_module(baseline, clone)
+        if stale:
+            sys.stderr.write(f"[dtm-zygote] {stale} differs in {clone}; needs a cold start\n")
+            code = STALE_EXIT
+        else:
+            sys.path[:] = [clone + p[len(baseline):] if p.startswith(baseline) else p for p in sys.path]
+            sys.prefix = sys.exec_prefix = clone
+            sys.path_importer_cache.clear()
+            importlib.invalidate_caches()
+            sys.argv = list(request["argv"])
+            try:
+                runpy.run_module(sys.argv[0], run_name="__main__", alter_sys=True)
+                code = 0
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    code = e.code or 0
+                else:
+                    sys.stderr.write(f"{e.code}\n")
+                    code = 1
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+def _supervise(conn: socket.socket, request: Dict, fds: List[int]):
+    """Forked per request: run the child, forward kills, report its exit status."""
+    child = os.fork()
+    if child == 0:
+        conn.close()
+        _run_child(request, fds)
+    for fd in fds:
+        os.close(fd)
+
+    def watch():
+        # A "kill" line or a vanished client ends the run
+        try:
+            conn.recv(64)
+        except OSError:
+            pass
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(child, sig)
+            except OSError:
+                return
+            threading.Event().wait(3)
+
+    threading.Thread(target=watch, daemon=True).start()
+    _, status = os.waitpid(child, 0)
+    code = os.waitstatus_to_exitcode(status)
+    try:
+        conn.sendall(json.dumps({"exit": code}).encode() + b"\n")
+    except OSError:
+        pass
+    os._exit(0)
+
+def zygote_main(socket_path: str, root: str):
+    """Preload modules read from stdin, then serve fork requests until stdin closes."""
+    config = json.loads(sys.stdin.readline())
+    targets = set(config["targets"])
+    sys.path.insert(0, root)
+    os.chdir(root)
+
+    preloaded = []
+    for name in config["modules"]:
+        try:
+            importlib.import_module(name)
+            preloaded.append(name)
+        except BaseException:
+            pass
+    tainted = sorted(name for name in sys.modules if name.split(".")[0] in targets)
+    status = {"ready": not tainted, "preloaded": len(preloaded), "tainted": tainted[:5]}
+    sys.stdout.write(json.dumps(status) + "\n")
+    sys.stdout.flush()
+    if tainted:
+        return
+
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # supervisors are reaped automatically
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    listener.listen(16)
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    selector.register(sys.stdin, selectors.EVENT_READ)
+    try:
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is sys.stdin:
+                    return  # DTM went away or asked us to stop
+                conn, _ = listener.accept()
+                try:
+                    message, fds, _, _ = socket.recv_fds(conn, 1 << 20, 3)
+                    request = json.loads(message.decode())
+                except (OSError, ValueError):
+                    conn.close()
+                    continue
+                sys.stdout.flush()
+                sys.stderr.flush()
+                if os.fork() == 0:
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    listener.close()
+                    _supervise(conn, request, fds)
+                conn.close()
+                for fd in fds:
+                    os.close(fd)
+    finally:
+        listener.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+def client_main(socket_path: str, prefix: str, argv: List[str]) -> int:
+    """Hand this process's stdio to the zygote and exit with the test run's status."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError as e:
+        sys.stderr.write(f"[dtm-zygote] unavailable: {e}\n")
+        return STALE_EXIT
+    request = {"cwd": os.getcwd(), "environ": dict(os.environ), "prefix": prefix, "argv": argv}
+    socket.send_fds(conn, [json.dumps(request).encode()], [0, 1, 2])
+
+    def forward(signum, frame):
+        try:
+            conn.sendall(b"kill\n")
+        except OSError:
+            pass
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    reply = b""
+    while not reply.endswith(b"\n"):
+        try:
+            chunk = conn.recv(4096)
+        except InterruptedError:
+            continue
+        if not chunk:
+            return STALE_EXIT
+        reply += chunk
+    return json.loads(reply.decode())["exit"]
+
+class ForkServer:
+    """A running zygote for one (interpreter, package, source state)."""
+
+    def __init__(self, python: str, root: str, targets: List[str], modules: List[str], key: str):
+        self.python = python
+        self.key = key
+        self.socket_path = os.path.join(tempfile.gettempdir(), f"dtm-zygote-{os.getpid()}-{key[:12]}.sock")
+        self.ready = False
+        self.process = subprocess.Popen(
+            [python, os.path.abspath(__file__), "zygote", self.socket_path, root],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            start_new_session=True
+        )
+        self.process.stdin.write(json.dumps({"targets": targets, "modules": modules}) + "\n")
+        self.process.stdin.flush()
+
+        status_line = []
+        reader = threading.Thread(target=lambda: status_line.append(self.process.stdout.readline()), daemon=True)
+        reader.start()
+        reader.join(READY_TIMEOUT)
+        try:
+            status = json.loads(status_line[0]) if status_line else {}
+        except ValueError:
+            status = {}
+        self.ready = bool(status.get("ready"))
+        self.preloaded = status.get("preloaded", 0)
+        self.tainted = status.get("tainted", [])
+        if not self.ready:
+            self.stop()
+
+    def command(self, prefix: str, argv: List[str]) -> List[str]:
+        """Command that runs ``python -m argv`` through the zygote against the venv at prefix."""
+        return [self.python, os.path.abspath(__file__), "client", self.socket_path, prefix, "--"] + argv
+
+    def stop(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+_servers: Dict[tuple, ForkServer] = {}
+_servers_lock = threading.Lock()
+
+def server_key(python: str, package: str, source_signature: str, root: str = ".") -> str:
+    """Zygotes are invalidated when the interpreter, its venv or the sources change."""
+    digest = hashlib.sha256(f"{python}\0{package}\0{source_signature}\0{os.path.abspath(root)}".encode())
+    try:
+        digest.update(str(os.stat(python).st_mtime_ns).encode())
+    except OSError:
+        pass
+    return digest.hexdigest()
+
+def get_fork_server(python: str, root: str, package: str, targets: List[str], modules: List[str],
+                    source_signature: str) -> Optional[ForkServer]:
+    """Return a ready zygote for package, starting or replacing it as needed.
+
+    Returns None when fork servers are unsupported or the package could not
+    be kept out of the zygote; the caller then runs tests cold.
+    """
+    if not supported():
+        return None
+    key = server_key(python, package, source_signature, root)
+    with _servers_lock:
+        # Projects can share a baseline interpreter, but each needs its own zygote
+        slot = (python, package, os.path.abspath(root))
+        server = _servers.get(slot)
+        if server is not None and server.key == key:
+            return server if server.ready else None
+        if server is not None:
+            server.stop()
+        server = ForkServer(python, root, targets, modules, key)
+        _servers[slot] = server
+        if server.ready:
+            print(f"🧬 Zygote for {package} ready with {server.preloaded} modules preloaded")
+        elif server.tainted:
+            print(f"🧬 {package} is imported by the preloaded modules ({', '.join(server.tainted)}); running tests cold")
+        return server if server.ready else None
+
+def stop_fork_servers(package: str, root: Optional[str] = None):
+    """Stop the zygotes preloaded for package, under any interpreter, or only those for the project at root."""
+    with _servers_lock:
+        for key in [key for key in _servers
+                    if key[1] == package and (root is None or key[2] == os.path.abspath(root))]:
+            _servers.pop(key).stop()
+
+def stop_all():
+    with _servers_lock:
+        for server in _servers.values():
+            server.stop()
+        _servers.clear()
+
+if __name__ == "__main__":
+    if sys.argv[1] == "zygote":
+        zygote_main(sys.argv[2], sys.argv[3])
+    elif sys.argv[1] == "client":
+        separator = sys.argv.index("--")
+        sys.exit(client_main(sys.argv[2], sys.argv[3], sys.argv[separator + 1:]))
@@ -0,0 +1,370 @@
+import ast
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Set
+from cache import IGNORED_DIRS
+
+INDEX_VERSION = 1
+
+LANGUAGE_EXTENSIONS = {
+    "python": {".py"},
+    "js": {".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx"},
+    "rust": {".rs"},
+}
+JS_RESOLVE_SUFFIXES = ["", ".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx",
+                       "/index.js", "/index.jsx", "/index.mjs", "/index.ts", "/index.tsx"]
+
+JS_IMPORT_PATTERN = re.compile(
+    r"""(?:\brequire\s*\(\s*|\bimport\s*\(\s*|\bfrom\s+|^\s*import\s+)['"]([^'"]+)['"]""", re.MULTILINE)
+RUST_USE_PATTERN = re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:use|extern\s+crate)\s+:?:?([A-Za-z_][A-Za-z0-9_]*)",
+                              re.MULTILINE)
+RUST_PATH_PATTERN = re.compile(r"(?<![A-Za-z0-9_:])([A-Za-z_][A-Za-z0-9_]*)::")
+RUST_MOD_PATTERN = re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?mod\s+([A-Za-z_][A-Za-z0-9_]*)\s*;", re.MULTILINE)
+RUST_LOCAL_ROOTS = {"crate", "self", "super", "std", "core", "alloc", "Self"}
+
+def _language_of(path: str) -> Optional[str]:
+    extension = os.path.splitext(path)[1]
+    for language, extensions in LANGUAGE_EXTENSIONS.items():
+        if extension in extensions:
+            return language
+    return None
+
+def is_test_file(path: str, language: str, source: str = "") -> bool:
+    """Whether the project's test runner would pick this file up as tests."""
+    name = os.path.basename(path)
+    parts = path.replace(os.sep, "/").split("/")[:-1]
+    if language == "python":
+        return name.startswith("test_") or name.endswith("_test.py")
+    if language == "js":
+        return bool(re.match(r"^(.*\.)?(test|spec)\.[cm]?[jt]sx?$", name)) or "__tests__" in parts
+    if language == "rust":
+        return _rust_test_target(path) is not None or "#[test]" in source
+    return False
+
+def _rust_test_target(path: str) -> Optional[str]:
+    """Integration test target of a file: tests/x.rs and tests/x/main.rs are target x."""
+    parts = path.replace(os.sep, "/").split("/")
+    if len(parts) == 2 and parts[0] == "tests":
+        return os.path.splitext(parts[1])[0]
+    if len(parts) == 3 and parts[0] == "tests" and parts[2] == "main.rs":
+        return parts[1]
+    return None
+
+def _python_imports(source: str, module: str, is_package: bool) -> List[str]:
+    """Absolute module names imported by a Python file; relative imports are resolved."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    package = module.split(".") if is_package else module.split(".")[:-1]
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[:len(package) - (node.level - 1)] if node.level > 1 else package
+                prefix = ".".join(base + ([node.module] if node.module else []))
+            else:
+                prefix = node.module or ""
+            if prefix:
+                names.append(prefix)
+            names.extend(f"{prefix}.{alias.name}" if prefix else alias.name
+                         for alias in node.names if alias.name != "*")
+    return names
+
+def _python_module_name(relative: str) -> str:
+    parts = relative[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+def _rust_references(source: str) -> Dict[str, List[str]]:
+    crates = set(RUST_USE_PATTERN.findall(source)) | set(RUST_PATH_PATTERN.findall(source))
+    return {"crates": sorted(crates - RUST_LOCAL_ROOTS), "mods": sorted(set(RUST_MOD_PATTERN.findall(source)))}
+
+class ImpactIndex:
+    """A static import graph of the project's source and test files.
+
+    The graph lives in ``.dtm/impact-index.json``. On every refresh only
+    files whose size or mtime changed are parsed again. It answers which
+    test files can transitively reach a given third-party package.
+    """
+
+    def __init__(self, root: str = ".", path: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.path = path or os.path.join(self.root, ".dtm", "impact-index.json")
+        self.files: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.files = data.get("files", {})
+        except (OSError, ValueError):
+            self.files = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"version": INDEX_VERSION, "files": self.files}, f)
+        os.replace(temporary, self.path)
+
+    def _parse(self, relative: str, language: str) -> Dict:
+        try:
+            with open(os.path.join(self.root, relative), "r", encoding="utf-8", errors="replace") as f:
+                source = f.read()
+        except OSError:
+            source = ""
+        entry = {"language": language, "test": is_test_file(relative, language, source)}
+        if language == "python":
+            module = _python_module_name(relative)
+            entry["imports"] = _python_imports(source, module, relative.endswith("__init__.py"))
+        elif language == "js":
+            entry["imports"] = sorted(set(JS_IMPORT_PATTERN.findall(source)))
+        else:
+            entry.update(_rust_references(source))
+        return entry
+
+    def refresh(self) -> "ImpactIndex":
+        """Re-parse new and changed files, drop deleted ones and persist the index."""
+        with self._lock:
+            seen = set()
+            changed = False
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS and not d.startswith(".")]
+                for name in filenames:
+                    full = os.path.join(dirpath, name)
+                    relative = os.path.relpath(full, self.root).replace(os.sep, "/")
+                    language = _language_of(name)
+                    if language is None:
+                        continue
+                    try:
+                        stat = os.stat(full)
+                    except OSError:
+                        continue
+                    seen.add(relative)
+                    entry = self.files.get(relative)
+                    if entry and entry.get("mtime") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+                        continue
+                    self.files[relative] = dict(self._parse(relative, language),
+                                                mtime=stat.st_mtime_ns, size=stat.st_size)
+                    changed = True
+            for relative in set(self.files) - seen:
+                del self.files[relative]
+                changed = True
+            if changed:
+                try:
+                    self._save()
+                except OSError:
+                    pass
+        return self
+
+    def _python_graph(self, targets: Set[str]):
+        """(internal edges, files importing a target) for Python files."""
+        modules = {}
+        for relative, entry in self.files.items():
+            if entry["language"] == "python":
+                name = _python_module_name(relative)
+                modules[name] = relative
+                if name.startswith("src."):
+                    modules[name[4:]] = relative
+        edges, direct = {}, set()
+        for relative, entry in self.files.items():
+            if entry["language"] != "python":
+                continue
+            deps = set()
+            for name in entry["imports"]:
+                parts = name.split(".")
+                if parts[0].lower() in targets:
+                    direct.add(relative)
+                for length in range(len(parts), 0, -1):
+                    module = ".".join(parts[:length])
+                    if module in modules:
+                        deps.add(modules[module])
+                        break
+            # pytest loads every conftest.py above a test file first
+            if entry["test"]:
+                directory = os.path.dirname(relative)
+                while True:
+                    conftest = f"{directory}/conftest.py" if directory else "conftest.py"
+                    if conftest in self.files:
+                        deps.add(conftest)
+                    if not directory:
+                        break
+                    directory = os.path.dirname(directory)
+            edges[relative] = deps
+        return edges, direct
+
+    def _js_graph(self, targets: Set[str]):
+        edges, direct = {}, set()
+        for relative, entry in self.files.items():
+            if entry["language"] != "js":
+                continue
+            deps = set()
+            for specifier in entry["imports"]:
+                if specifier.startswith("."):
+                    base = os.path.normpath(os.path.join(os.path.dirname(relative), specifier)).replace(os.sep, "/")
+                    for suffix in JS_RESOLVE_SUFFIXES:
+                        if base + suffix in self.files:
+                            deps.add(base + suffix)
+                            break
+                    continue
+                parts = specifier.split("/")
+                package = "/".join(parts[:2]) if specifier.startswith("@") else parts[0]
+                if package.startswith("node:"):
+                    continue
+                if package in targets:
+                    direct.add(relative)
+            edges[relative] = deps
+        return edges, direct
+
+    def _rust_graph(self, targets: Set[str]):
+        crate_name = self._rust_crate_name()
+        roots = [r for r in ("src/lib.rs", "src/main.rs") if r in self.files]
+        edges, direct = {}, set()
+        for relative, entry in self.files.items():
+            if entry["language"] != "rust":
+                continue
+            deps = set()
+            directory = os.path.dirname(relative)
+            stem = os.path.splitext(os.path.basename(relative))[0]
+            # `mod x;` in a crate root or a mod.rs lives next to it; in a/y.rs it lives in a/y/x.rs
+            crate_root = stem in ("lib", "main", "mod", "build") or directory in ("tests", "examples", "benches", "src/bin")
+            module_dir = directory if crate_root else f"{directory}/{stem}"
+            for module in entry["mods"]:
+                for candidate in (f"{module_dir}/{module}.rs", f"{module_dir}/{module}/mod.rs"):
+                    if candidate in self.files:
+                        deps.add(candidate)
+                        break
+            if crate_name in entry["crates"] and not relative.startswith("src/"):
+                deps.update(roots)
+            if targets & set(entry["crates"]):
+                direct.add(relative)
+            edges[relative] = deps
+        return edges, direct
+
+    def _rust_crate_name(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, "Cargo.toml"), "r") as f:
+                text = f.read()
+        except OSError:
+            return None
+        match = re.search(r'^\[package\][^\[]*?^name\s*=\s*"([^"]+)"', text, re.MULTILINE | re.DOTALL)
+        return match.group(1).replace("-", "_") if match else None
+
+    def _reaching(self, language: str, import_names: List[str]):
+        """(internal edges, files that transitively import any of import_names)."""
+        targets = {name.lower() if language == "python" else name for name in import_names}
+        if language == "rust":
+            targets = {name.replace("-", "_") for name in targets}
+        graph = {"python": self._python_graph, "js": self._js_graph, "rust": self._rust_graph}.get(language)
+        if graph is None:
+            return {}, set()
+        edges, direct = graph(targets)
+        reverse: Dict[str, Set[str]] = {}
+        for source, deps in edges.items():
+            for dep in deps:
+                reverse.setdefault(dep, set()).add(source)
+        reached = set(direct)
+        queue = deque(direct)
+        while queue:
+            for dependant in reverse.get(queue.popleft(), ()):
+                if dependant not in reached:
+                    reached.add(dependant)
+                    queue.append(dependant)
+        return edges, reached
+
+    def tests_reaching(self, language: str, import_names: List[str]) -> List[str]:
+        """Test files (relative paths) that transitively import any of import_names."""
+        with self._lock:
+            _, reached = self._reaching(language, import_names)
+            return sorted(f for f in reached if self.files[f]["test"])
+
+    def usage_files(self, language: str, import_names: List[str]) -> List[str]:
+        """Files whose changes can alter how the project uses import_names.
+
+        These are the files that transitively import any of them plus
+        everything those files import in turn. When nothing imports them
+        statically every indexed file of the language counts.
+        """
+        with self._lock:
+            edges, reached = self._reaching(language, import_names)
+            if not reached:
+                return sorted(f for f, entry in self.files.items() if entry["language"] == language)
+            files = set(reached)
+            queue = deque(reached)
+            while queue:
+                for dep in edges.get(queue.popleft(), ()):
+                    if dep not in files:
+                        files.add(dep)
+                        queue.append(dep)
+            return sorted(files)
+
+    def python_preload_modules(self, import_names: List[str]) -> List[str]:
+        """Modules that can be imported ahead of a test run without importing import_names.
+
+        These are third-party modules imported by project files that do not
+        reach the package, then project modules that some file imports and
+        that do not reach it. Tests and conftest files are left to pytest.
+        """
+        targets = {name.lower() for name in import_names}
+        with self._lock:
+            edges, reached = self._reaching("python", import_names)
+            project_roots = {_python_module_name(f).split(".")[0] for f in edges} | {"src"}
+            external, internal = set(), set()
+            for relative, deps in edges.items():
+                internal.update(dep for dep in deps if dep not in reached and not self.files[dep]["test"]
+                                and os.path.basename(dep) != "conftest.py")
+                if relative in reached:
+                    continue
+                for name in self.files[relative]["imports"]:
+                    top = name.split(".")[0]
+                    if top and top not in project_roots and top.lower() not in targets:
+                        external.add(top)
+            modules = [_python_module_name(f) for f in internal]
+            return sorted(external) + sorted(m[4:] if m.startswith("src.") else m for m in modules)
+
+    def signature(self, language: str = "python") -> str:
+        """Hash of the indexed files of a language; changes whenever one of them does."""
+        digest = hashlib.sha256()
+        with self._lock:
+            for relative in sorted(self.files):
+                entry = self.files[relative]
+                if entry["language"] == language:
+                    digest.update(f"{relative}\0{entry['mtime']}\0{entry['size']}\n".encode())
+        return digest.hexdigest()
+
+def narrow_test_command(language: str, test_command: str, test_files: List[str]) -> str:
+    """The test command restricted to test_files."""
+    if language == "rust":
+        targets = [f"--test {_rust_test_target(f)}" for f in test_files if _rust_test_target(f)]
+        unit = [f for f in test_files if f.startswith("src/")]
+        if any(f == "src/main.rs" or f.startswith("src/bin/") for f in unit):
+            targets.insert(0, "--bins")
+        if any(f != "src/main.rs" and not f.startswith("src/bin/") for f in unit):
+            targets.insert(0, "--lib")
+        return " ".join([test_command] + targets)
+    if language == "js":
+        return " ".join([test_command, "--"] + test_files)
+    return " ".join([test_command] + test_files)
+
+_indexes: Dict[str, ImpactIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_impact_index(root: str = ".") -> ImpactIndex:
+    """Return the process-wide, freshly refreshed impact index for a project."""
+    key = os.path.abspath(root)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = ImpactIndex(key)
+        index = _indexes[key]
+    return index.refresh()
@@ -0,0 +1,132 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def _peak_rss_kb(who) -> Optional[int]:
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    peak = resource.getrusage(who).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+class Tracer:
+    """Records timed spans around DTM's phases.
+
+    Each span keeps its wall time, the CPU time of its thread, the CPU time
+    of child processes reaped while it ran, and the peak RSS of DTM and of
+    its children so far. Child figures are process-wide, so spans running
+    concurrently share them. A disabled tracer records nothing.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.epoch = time.time()
+        self.origin = time.perf_counter()
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            yield attrs
+            return
+        start = time.perf_counter()
+        thread_cpu = time.thread_time()
+        times = os.times()
+        try:
+            yield attrs  # callers may add attributes while the span runs
+        finally:
+            end = time.perf_counter()
+            after = os.times()
+            record = {
+                "name": name,
+                "start": round(start - self.origin, 6),
+                "duration": round(end - start, 6),
+                "cpu": round(time.thread_time() - thread_cpu, 6),
+                "child_cpu": round((after.children_user + after.children_system)
+                                   - (times.children_user + times.children_system), 6),
+                "peak_rss_kb": _peak_rss_kb(resource.RUSAGE_SELF) if resource else None,
+                "children_peak_rss_kb": _peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+                "pid": os.getpid(),
+                "thread": threading.get_ident(),
+                "attrs": attrs,
+            }
+            with self._lock:
+                self.spans.append(record)
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+            self.epoch = time.time()
+            self.origin = time.perf_counter()
+
+    def phases(self) -> Dict[str, Dict]:
+        """Per span name: count, total and longest wall time, and CPU times."""
+        summary: Dict[str, Dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for record in spans:
+            phase = summary.setdefault(record["name"], {"count": 0, "wall": 0.0, "max": 0.0, "cpu": 0.0, "child_cpu": 0.0})
+            phase["count"] += 1
+            phase["wall"] += record["duration"]
+            phase["max"] = max(phase["max"], record["duration"])
+            phase["cpu"] += record["cpu"]
+            phase["child_cpu"] += record["child_cpu"]
+        return {name: {key: round(value, 6) for key, value in phase.items()} for name, phase in summary.items()}
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {"epoch": self.epoch, "spans": spans, "phases": self.phases()}
+
+    def chrome_trace(self) -> Dict:
+        """The spans as Chrome trace events, viewable in chrome://tracing or Perfetto."""
+        with self._lock:
+            spans = list(self.spans)
+        threads = {}
+        events = []
+        for record in spans:
+            tid = threads.setdefault(record["thread"], len(threads) + 1)
+            args = dict(record["attrs"], cpu=record["cpu"], child_cpu=record["child_cpu"],
+                        peak_rss_kb=record["peak_rss_kb"], children_peak_rss_kb=record["children_peak_rss_kb"])
+            events.append({"name": record["name"], "cat": "dtm", "ph": "X", "pid": record["pid"], "tid": tid,
+                           "ts": round(record["start"] * 1e6), "dur": round(record["duration"] * 1e6),
+                           "args": {key: value for key, value in args.items() if value is not None}})
+        for tid in threads.values():
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                           "args": {"name": f"thread-{tid}"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, directory: str) -> Tuple[str, str]:
+        """Write spans.json and a Chrome trace.json into directory and return their paths."""
+        os.makedirs(directory, exist_ok=True)
+        spans_path = os.path.join(directory, "spans.json")
+        trace_path = os.path.join(directory, "trace.json")
+        with open(spans_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        with open(trace_path, "w") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        return spans_path, trace_path
+
+_tracer = Tracer()
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer."""
+    return _tracer
+
+def enable_tracing() -> Tracer:
+    _tracer.enabled = True
+    return _tracer
+
+def span(name: str, **attrs):
+    """A span on the process-wide tracer: ``with span("install_version", version=v): ...``."""
+    return _tracer.span(name, **attrs)
@@ -2,10 +2,32 @@ import sys
 import json
 import os
 import re
-from typing import List, Tuple, Optional, Dict, Set
+import argparse
+import threading
+import time
+from typing import Callable, List, Tuple, Optional, Dict, Set
 from adapters.python_adapter import PythonAdapter
 from adapters.js_adapter import JSAdapter
 from adapters.rust_adapter import RustAdapter
+from cache import ResultCache, project_fingerprint, project_scoped_fingerprint
+from probe import Prober
+from search import STRATEGIES, BisectStrategy, SearchStrategy, make_strategy
+from versions import is_prerelease, parse_version
+from parallel import parallel_search_versions
+from metadata import get_metadata_client, normalize_python_name
+from pruning import parse_pinned_requirements
+from scheduler import AnalysisScheduler, Job, ResourcePool, default_resources
+from events import emit
+from instrument import enable_tracing, get_tracer, span
+from benchmark import MODES, SCENARIOS
+from runner import configure_test_runner
+from forkserver import stop_all as stop_all_fork_servers, stop_fork_servers
+from impact import get_impact_index, narrow_test_command
+from state import AnalysisState, incremental_candidates, snapshot, usage_signature
+from manifests import current_version, get_manifest_index
+from distributed import DEFAULT_LEASE_TIMEOUT, DEFAULT_PORT, Coordinator, RemoteBenchmark, RemoteProber, Worker
+from perf import (DEFAULT_LATENCY_THRESHOLD, DEFAULT_MEMORY_THRESHOLD, DEFAULT_SAMPLES,
+                  PerformanceBisector)
 
 def parse_requirements_file(file_path: str) -> Set[str]:
     """Parse requirements.txt file and return set of package names."""
@@ -38,6 +60,7 @@ def parse_package_json(file_path: str) -> Set[str]:
 def parse_cargo_toml(file_path: str) -> Set[str]:
     """Parse Cargo.toml file and return set of package names."""
     packages = set()
+    in_deps = False
     try:
         with open(file_path, 'r') as f:
             for line in f:
@@ -64,23 +87,145 @@ def detect_dependencies() -> Dict[str, Set[str]]:
     }
     return dependencies
 
-def detect_language() -> str:
+def parse_cargo_dependency_versions(file_path: str) -> Tuple[Dict[str, str], Set[str]]:
+    """Return ({crate: version requirement}, dev-only crates) from Cargo.toml."""
+    versions, runtime, dev = {}, set(), set()
+    section = None
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line.startswith('['):
+                    section = line.strip('[] ')
+                    continue
+                if not section or not section.endswith('dependencies') or '=' not in line:
+                    continue
+                name, value = (part.strip() for part in line.split('=', 1))
+                match = re.search(r'version\s*=\s*"([^"]*)"', value) if value.startswith('{') else re.match(r'"([^"]*)"', value)
+                is_dev = section.endswith('dev-dependencies')
+                if match and not (is_dev and name in versions):
+                    versions[name] = match.group(1)
+                (dev if is_dev else runtime).add(name)
+    except FileNotFoundError:
+        pass
+    return versions, dev - runtime
+
+def detect_dev_dependencies() -> Dict[str, Set[str]]:
+    """Detect dependencies only needed for development (tests, builds)."""
+    dev = {'python': set(), 'js': set(), 'rust': set()}
+    try:
+        with open('package.json', 'r') as f:
+            data = json.load(f)
+        dev['js'] = set(data.get('devDependencies', {})) - set(data.get('dependencies', {}))
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    dev['rust'] = parse_cargo_dependency_versions('Cargo.toml')[1]
+    return dev
+
+def detect_current_versions() -> Dict[str, Dict[str, str]]:
+    """Detect the version (or range) of each dependency the project uses now."""
+    current = {'python': parse_pinned_requirements('requirements.txt'), 'js': {}, 'rust': {}}
+    try:
+        with open('package.json', 'r') as f:
+            data = json.load(f)
+        for deps in [data.get('devDependencies', {}), data.get('dependencies', {})]:
+            current['js'].update(deps)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    current['rust'] = parse_cargo_dependency_versions('Cargo.toml')[0]
+    return current
+
+def releases_behind(package_name: str, language: str, current: Optional[str]) -> int:
+    """Count the stable releases newer than the version the project uses."""
+    match = re.search(r'\d+(?:\.\d+)*', current or '')
+    if not match:
+        return 0
+    scheme = "pep440" if language == "python" else "semver"
+    used = parse_version(match.group(0), scheme)
+    client = get_metadata_client()
+    try:
+        if language == "js":
+            versions = client.npm_versions(package_name)
+        elif language == "rust":
+            versions = client.crate_versions(package_name)
+        else:
+            versions = client.pypi_versions(package_name)
+    except Exception:
+        return 0
+    newer = 0
+    for version in versions:
+        parsed = parse_version(version, scheme)
+        if parsed is not None and not parsed.is_prerelease and parsed > used:
+            newer += 1
+    return newer
+
+def plan_analysis_jobs(dependencies: Dict[str, Set[str]], order: str = "direct-first",
+                       dev: Optional[Dict[str, Set[str]]] = None,
+                       current: Optional[Dict[str, Dict[str, str]]] = None,
+                       environments: Optional[Dict[str, Dict[str, Dict[str, List[Dict]]]]] = None) -> List[Job]:
+    """Build one job per dependency, prioritised by ``order``.
+
+    ``direct-first`` runs runtime dependencies before dev dependencies, most
+    outdated first within each group; ``most-outdated`` ranks by releases
+    behind alone and uses the dev/runtime split as a tie-breaker. ``dev``
+    and ``current`` default to what the project in the working directory
+    declares. With ``environments`` (the manifest index's uses grouped by
+    the project they install in) a package gets one job per such project,
+    ranked by the version and dev status of its uses there.
+    """
+    dev = detect_dev_dependencies() if dev is None else dev
+    current = detect_current_versions() if current is None else current
+    jobs = []
+    for language, packages in dependencies.items():
+        for package in packages:
+            projects = environments[language][package] if environments else {".": None}
+            for project, uses in sorted(projects.items()):
+                if uses:
+                    used, is_dev = current_version(language, uses), all(use["dev"] for use in uses)
+                else:
+                    key = normalize_python_name(package) if language == 'python' else package
+                    used, is_dev = current[language].get(key), package in dev[language]
+                behind = releases_behind(package, language, used)
+                priority = (is_dev, -behind) if order == "direct-first" else (-behind, is_dev)
+                jobs.append(Job(language, package, priority + (language, package, project), project=project))
+    return jobs
+
+def baseline_version(package_name: str, language: str, versions: List[str],
+                     current: Optional[str] = None) -> Optional[str]:
+    """The latest of versions not newer than the one the project uses now, or ``current``."""
+    if current is None:
+        key = normalize_python_name(package_name) if language == 'python' else package_name
+        current = detect_current_versions()[language].get(key)
+    match = re.search(r'\d+(?:\.\d+)*', current or '')
+    if not match:
+        return None
+    scheme = "pep440" if language == "python" else "semver"
+    used = parse_version(match.group(0), scheme)
+    older = [v for v in versions if parse_version(v, scheme) is not None and parse_version(v, scheme) <= used]
+    return older[-1] if older else None
+
+def benchmark_options(args: argparse.Namespace) -> Dict:
+    """analyze_package keyword arguments for the benchmark flags."""
+    return {"bench": args.bench, "samples": args.samples,
+            "latency_threshold": args.latency_threshold, "memory_threshold": args.memory_threshold}
+
+def detect_language(root: str = ".") -> str:
     """Detect the project language based on files present."""
-    if os.path.exists("package.json"):
+    if os.path.exists(os.path.join(root, "package.json")):
         return "js"
-    elif os.path.exists("Cargo.toml"):
+    elif os.path.exists(os.path.join(root, "Cargo.toml")):
         return "rust"
-    elif os.path.exists("requirements.txt") or os.path.exists("setup.py"):
+    elif os.path.exists(os.path.join(root, "requirements.txt")) or os.path.exists(os.path.join(root, "setup.py")):
         return "python"
     return "python"  # Default to Python for now
 
-def get_adapter(package_name: str, language: str):
-    """Get the appropriate adapter for the language."""
+def get_adapter(package_name: str, language: str, root: str = "."):
+    """Get the appropriate adapter for the language, probing in the project at root."""
     if language == "js":
-        return JSAdapter(package_name)
+        return JSAdapter(package_name, root)
     elif language == "rust":
-        return RustAdapter(package_name)
-    return PythonAdapter(package_name)
+        return RustAdapter(package_name, root)
+    return PythonAdapter(package_name, root)
 
 def get_test_command(language: str) -> str:
     """Get the default test command for the language."""
@@ -90,95 +235,515 @@ def get_test_command(language: str) -> str:
         return "cargo test"
     return "pytest"
 
-def analyze_package(package_name: str, language: str) -> Dict:
-    """Analyze a single package and return results."""
-    adapter = get_adapter(package_name, language)
-    test_command = get_test_command(language)
+def package_import_names(adapter) -> List[str]:
+    """Names the project's code imports the adapter's package by."""
+    return adapter.import_names() if hasattr(adapter, 'import_names') else [adapter.package_name]
 
-    print(f"\n🔍 Analyzing {package_name} for {language}...")
-    versions = adapter.enumerate_versions()
-    
-    if not versions:
-        return {
+def select_impacted_tests(adapter, language: str, root: str = ".") -> List[str]:
+    """Test files that can reach the adapter's package, from the test-impact index."""
+    return get_impact_index(root).tests_reaching(language, package_import_names(adapter))
+
+def package_usage(adapter, language: str, test_command: str, root: str = ".") -> str:
+    """Signature of the code, manifests and test command that decide whether a version works."""
+    files = get_impact_index(root).usage_files(language, package_import_names(adapter))
+    return usage_signature(language, files, test_command, root=root)
+
+def analyze_package(package_name: str, language: str, cache: Optional[ResultCache] = None,
+                    fingerprint: Optional[str] = None, workers: int = 1,
+                    strategy: Optional[SearchStrategy] = None, include_prereleases: bool = False,
+                    resources: Optional[ResourcePool] = None, select_tests: bool = True,
+                    state: Optional[AnalysisState] = None, bench: Optional[str] = None,
+                    samples: int = DEFAULT_SAMPLES, latency_threshold: float = DEFAULT_LATENCY_THRESHOLD,
+                    memory_threshold: float = DEFAULT_MEMORY_THRESHOLD,
+                    remote: Optional[Coordinator] = None, root: str = ".",
+                    current: Optional[str] = None) -> Dict:
+    """Analyze a single package and return results.
+
+    When a cache and project fingerprint are given, probes already run
+    against the same code, manifest and test command are not repeated.
+    With ``workers`` > 1 several versions are probed at once in separate
+    sandboxes; otherwise ``strategy`` picks the serial search strategy.
+    Pre-releases are skipped unless ``include_prereleases`` is set.
+    ``resources`` limits concurrent installs and test runs when several
+    analyses share the machine. With ``select_tests`` probes run only the
+    test files that import the package, and the answer is confirmed
+    against the full suite. With a ``state`` the previous analysis is
+    reused: when the package's usage is unchanged only versions published
+    since, between the known working and broken ones, are probed.
+    With ``bench`` the working versions newer than the one in use are also
+    bisected for the first whose benchmark got significantly slower or
+    used more memory, reported under ``performance``. With a ``remote``
+    coordinator the search's probes run on its workers, as many at once as
+    they have slots, and so do the full-suite confirmation and the
+    benchmarks. Probes install and test in the project at ``root``;
+    ``current`` overrides the version it is taken to use now.
+    """
+    adapter = get_adapter(package_name, language, root)
+    try:
+        test_command = get_test_command(language)
+
+        print(f"\n🔍 Analyzing {package_name} for {language}...")
+        with span("enumerate_versions", package=package_name, language=language):
+            versions = adapter.enumerate_versions()
+        
+        if not versions:
+            return {
+                "package": package_name,
+                "status": "error",
+                "message": "No versions found"
+            }
+
+        print(f"\n📦 Found {len(versions)} versions")
+        scheme = getattr(adapter, 'version_scheme', 'pep440')
+        if not include_prereleases:
+            versions = [version for version in versions if not is_prerelease(version, scheme)]
+        all_versions = versions
+
+        previous = None
+        candidates = None
+        above = []
+        if state is not None:
+            usage = package_usage(adapter, language, test_command, root)
+            strategy = strategy or BisectStrategy()
+            options = [strategy.name, strategy.verify_boundary, include_prereleases]
+            if bench:
+                options += [bench, samples, latency_threshold, memory_threshold]
+            previous = state.get(language, package_name, usage, options)
+            incremental = incremental_candidates(previous, versions, scheme) if previous else None
+            if incremental is None:
+                previous = None
+            else:
+                candidates, above = incremental
+                if above:
+                    # Past a known break new releases normally stay broken; only
+                    # one that works again means the boundary must be searched anew
+                    print(f"🆕 Checking the {len(above)} versions published after {previous['first_broken']}")
+                    if remote is not None:
+                        check = RemoteProber(remote, adapter, language, test_command, cache=cache,
+                                             fingerprint=fingerprint, project=root)
+                    else:
+                        check = Prober(adapter, test_command, cache=cache, fingerprint=fingerprint,
+                                       resources=resources)
+                    for version in reversed(above):
+                        if check.works(version):
+                            print(f"🔀 {version} works again; searching every version")
+                            previous = candidates = None
+                            # The search has to look past the first break it finds
+                            strategy = type(strategy)(verify_boundary=True)
+                            break
+            if previous is not None and not candidates:
+                print(f"♻️ {package_name} has no new version that can move its boundary; reusing its result")
+                state.put(language, package_name, all_versions, previous["result"], fingerprint, usage, options)
+                return dict(previous["result"], search={"mode": "incremental", "probes": len(above), "reused": True})
+            if candidates is not None:
+                print(f"🆕 Probing only the {len(candidates)} versions published since the last analysis")
+                versions = candidates
+
+        pruned = {}
+        if hasattr(adapter, 'prune_versions'):
+            versions, pruned = adapter.prune_versions(versions)
+            if pruned:
+                print(f"✂️ Skipping {len(pruned)} versions that cannot install in this project")
+
+        def search(command: str, stats: Dict):
+            if remote is not None:
+                run_probe = RemoteProber(remote, adapter, language, command, cache=cache, fingerprint=fingerprint,
+                                         project=root)
+                return parallel_search_versions(
+                    versions, None, command, max(workers, remote.capacity()), stats=stats, run_probe=run_probe
+                )
+            if workers > 1 and getattr(adapter, 'parallel_safe', False):
+                return parallel_search_versions(
+                    versions, lambda slot: get_adapter(package_name, language, root), command,
+                    workers, cache=cache, fingerprint=fingerprint, stats=stats, resources=resources
+                )
+            return binary_search_versions(
+                versions, adapter, command, cache=cache, fingerprint=fingerprint, stats=stats,
+                strategy=strategy, resources=resources
+            )
+
+        full_test_command = test_command
+        selection = select_impacted_tests(adapter, language, root) if select_tests else []
+        if selection:
+            test_command = narrow_test_command(language, test_command, selection)
+            print(f"🎯 Probing with the {len(selection)} test files that reach {package_name}")
+
+        stats = {}
+        latest_working, first_broken, dependency_conflicts = search(test_command, stats)
+        print(f"\n⏱️ {stats['probes']} probes in {stats['wall_time']}s ({stats['mode']} search)")
+
+        if selection:
+            # Confirmed only once the full suite has actually passed on the answer
+            stats["test_selection"] = {"files": len(selection), "confirmed": False}
+            if latest_working:
+                print(f"\n🔁 Confirming {latest_working} with the full test suite...")
+                if remote is not None:
+                    confirm = RemoteProber(remote, adapter, language, full_test_command, cache=cache,
+                                           fingerprint=fingerprint, project=root)
+                else:
+                    confirm = Prober(adapter, full_test_command, cache=cache, fingerprint=fingerprint,
+                                     resources=resources)
+                if confirm.works(latest_working):
+                    stats["test_selection"]["confirmed"] = True
+                else:
+                    # The selection missed a test that breaks; trust the full suite
+                    print(f"⚠️ {latest_working} fails the full suite; searching again without test selection")
+                    stats = {"test_selection": {"files": len(selection), "confirmed": False}}
+                    latest_working, first_broken, dependency_conflicts = search(full_test_command, stats)
+
+        # The new versions all lie between the previous boundary versions
+        position = {version: i for i, version in enumerate(all_versions)}
+        pruned_versions = set(pruned)
+        if previous is not None:
+            stats["incremental"] = {"probed_versions": len(candidates), "checked_above_boundary": len(above)}
+            latest_working = latest_working or previous["latest_working"]
+            if first_broken is None:
+                first_broken = previous["first_broken"]
+                dependency_conflicts = previous["result"].get("dependency_conflicts")
+            pruned_versions.update(v for v in previous["result"].get("pruned_versions", []) if v in position)
+
+        # A pruned version right above the latest working one is the real
+        # upgrade blocker, and its static conflicts explain why.
+        floor = position[latest_working] if latest_working else -1
+        blocked = [version for version in all_versions if version in pruned and position[version] > floor]
+        if blocked and (first_broken is None or position[blocked[0]] < position[first_broken]):
+            first_broken = blocked[0]
+            dependency_conflicts = pruned[blocked[0]]
+
+        result = {
             "package": package_name,
-            "status": "error",
-            "message": "No versions found"
+            "status": "success",
+            "latest_working": latest_working,
+            "first_broken": first_broken,
+            "dependency_conflicts": dependency_conflicts,
+            "total_versions": len(all_versions),
+            "pruned_versions": sorted(pruned_versions, key=position.get),
+            "search": stats
         }
+        if bench and latest_working:
+            baseline = baseline_version(package_name, language, all_versions, current) or all_versions[0]
+            upgrades = [v for v in all_versions[position[baseline] + 1:position[latest_working] + 1]
+                        if v not in pruned_versions]
+            print(f"\n⏱️ Looking for a performance regression in {len(upgrades)} versions after {baseline}")
+            measure_remotely = None
+            if remote is not None:
+                measure_remotely = RemoteBenchmark(remote, adapter, language, bench, samples, fingerprint=fingerprint,
+                                                   project=root)
+            bisector = PerformanceBisector(adapter, bench, samples=samples, latency_threshold=latency_threshold,
+                                           memory_threshold=memory_threshold, resources=resources,
+                                           remote=measure_remotely)
+            result["performance"] = bisector.bisect(upgrades, baseline)
+        if state is not None:
+            state.put(language, package_name, all_versions, result, fingerprint, usage, options)
+        return result
+    finally:
+        # Nothing else probes this package, so its sandbox and zygote only hold resources now
+        if hasattr(adapter, 'close'):
+            adapter.close()
+        stop_fork_servers(package_name, root)
 
-    print(f"\n📦 Found {len(versions)} versions")
-    latest_working, first_broken, dependency_conflicts = binary_search_versions(versions, adapter, test_command)
-
-    return {
-        "package": package_name,
-        "status": "success",
-        "latest_working": latest_working,
-        "first_broken": first_broken,
-        "dependency_conflicts": dependency_conflicts,
-        "total_versions": len(versions)
-    }
+def binary_search_versions(versions: List[str], adapter, test_command: str,
+                           cache: Optional[ResultCache] = None,
+                           fingerprint: Optional[str] = None,
+                           stats: Optional[Dict] = None,
+                           strategy: Optional[SearchStrategy] = None,
+                           resources: Optional[ResourcePool] = None) -> Tuple[Optional[str], Optional[str], Optional[Dict]]:
+    """Find the latest working version using binary search.
 
-def binary_search_versions(versions: List[str], adapter, test_command: str) -> Tuple[Optional[str], Optional[str], Optional[Dict]]:
-    """Find the latest working version using binary search."""
+    ``strategy`` replaces the plain bisection with another search strategy.
+    If ``stats`` is given it is filled with probe counts and wall-clock time.
+    """
     if not versions:
         return None, None, None
 
-    left, right = 0, len(versions) - 1
-    latest_working = None
-    first_broken = None
-    dependency_conflicts = None
-
-    while left <= right:
-        mid = (left + right) // 2
-        version = versions[mid]
-        print(f"\nTesting version {version}...")
-
-        if adapter.install_version(version):
-            success, output = adapter.run_tests(test_command)
-            if success:
-                print(f"✅ Version {version} works!")
-                latest_working = version
-                left = mid + 1
-            else:
-                print(f"❌ Version {version} failed!")
-                first_broken = version
-                right = mid - 1
-        else:
-            print(f"❌ Failed to install version {version}")
-            first_broken = version
-            if hasattr(adapter, 'get_dependency_conflicts'):
-                conflicts = adapter.get_dependency_conflicts(version)
-                if conflicts:
-                    dependency_conflicts = conflicts
-                    print("\n🔍 Dependency conflicts detected:")
-                    for package, issues in conflicts.items():
-                        print(f"  - {package}:")
-                        for issue in issues:
-                            print(f"    {issue}")
-            right = mid - 1
+    start = time.monotonic()
+    strategy = strategy or BisectStrategy()
+    prober = Prober(adapter, test_command, cache=cache, fingerprint=fingerprint, resources=resources)
+    latest_working, first_broken, dependency_conflicts, extra = strategy.search(versions, prober)
+
+    if stats is not None:
+        stats.update(extra, mode=strategy.name, workers=1, probes=prober.probes,
+                     cache_hits=prober.cache_hits, cancelled=0,
+                     wall_time=round(time.monotonic() - start, 3))
 
     return latest_working, first_broken, dependency_conflicts
 
+def analyze_project(args: argparse.Namespace, cache: Optional[ResultCache] = None,
+                    fingerprint: Optional[str] = None,
+                    strategy: Optional[SearchStrategy] = None,
+                    on_result: Optional[Callable[[Job, Dict], None]] = None,
+                    state: Optional[AnalysisState] = None,
+                    remote: Optional[Coordinator] = None) -> Dict[str, Dict]:
+    """Analyze every detected dependency with the options of an ``analyze`` command.
+
+    Each package's result is streamed as a JSON line and a
+    ``package_result`` event, and passed to ``on_result``, as soon as it
+    is done. With ``args.recursive`` the dependencies of every sub-project
+    come from the manifest index. A package is analyzed once per
+    environment it is installed in - the sub-project itself, or the npm or
+    Cargo workspace around it - by probing inside that environment, and
+    each result lists the projects it covers under ``used_by``. Results of
+    packages probed outside the root are keyed ``"<package> (<project>)"``.
+    """
+    print("🔍 Analyzing project dependencies...")
+    environments = None
+    if args.recursive:
+        index = get_manifest_index()
+        for manifest, error in index.errors().items():
+            print(f"⚠️ Could not read {manifest}: {error}")
+        environments = index.environments()
+        dependencies = {language: set(packages) for language, packages in environments.items()}
+        print(f"\n🗂️ Found {len(index.projects())} projects with "
+              f"{sum(len(packages) for packages in dependencies.values())} distinct dependencies")
+        dev, current = index.dev_dependencies(), index.current_versions()
+    else:
+        dependencies = detect_dependencies()
+        dev = current = None
+    
+    for language, packages in dependencies.items():
+        if packages:
+            print(f"\n📦 Found {len(packages)} {language} dependencies:")
+            for package in packages:
+                print(f"  - {package}")
+            
+            # Fetch every package's version list up front, concurrently
+            get_metadata_client().prefetch(language, sorted(packages))
+
+    jobs = plan_analysis_jobs(dependencies, order=args.order, dev=dev, current=current,
+                              environments=environments)
+    resources = default_resources(args.cpu_slots, args.network_slots)
+    finished = []
+    progress_lock = threading.Lock()
+    states = {".": state}
+
+    def project_state(project: str) -> Optional[AnalysisState]:
+        # Every sub-project remembers its own analyses, like the root does
+        if state is None:
+            return None
+        with progress_lock:
+            if project not in states:
+                states[project] = AnalysisState(os.path.join(os.path.abspath(project), ".dtm",
+                                                             "analysis-state.json"))
+            return states[project]
+
+    def analyze_job(job: Job) -> Dict:
+        uses = environments[job.language][job.package][job.project] if environments else None
+        return analyze_package(job.package, job.language, cache=cache,
+                               fingerprint=project_scoped_fingerprint(fingerprint, job.project),
+                               workers=args.workers, strategy=strategy,
+                               include_prereleases=args.include_prereleases, resources=resources,
+                               select_tests=not args.no_test_selection, state=project_state(job.project),
+                               remote=remote, root=job.project,
+                               current=current_version(job.language, uses) if uses else None,
+                               **benchmark_options(args))
+
+    def report(job: Job, result: Dict):
+        if environments is not None:
+            result["used_by"] = environments[job.language][job.package][job.project]
+            result["project"] = job.project
+        # Stream each result as soon as its package is done
+        with progress_lock:
+            finished.append(job.key)
+            print(f"\n📬 [{len(finished)}/{len(jobs)}] Finished {job.key} ({job.language})")
+            print(json.dumps({"event": "package_result", "language": job.language, "result": result}),
+                  flush=True)
+        emit("package_result", package=job.package, language=job.language, result=result)
+        if on_result is not None:
+            on_result(job, result)
+
+    print(f"\n🔬 Analyzing {len(jobs)} dependencies, {max(1, args.jobs)} at a time...")
+    completed = AnalysisScheduler(max_jobs=args.jobs).run(jobs, analyze_job, on_result=report)
+    results = {job.key: completed[job.key] for job in jobs if job.key in completed}
+    return results
+
+def watch_project(args: argparse.Namespace, cache: Optional[ResultCache] = None,
+                  strategy: Optional[SearchStrategy] = None, state: Optional[AnalysisState] = None):
+    """Analyze the project, then again whenever a manifest or source file changes.
+
+    Packages whose usage did not change are answered from ``state``, so a
+    round only probes the dependencies the change can affect. Each round
+    ends with its results as one JSON line.
+    """
+    print(f"👀 Watching {os.getcwd()} for changes (Ctrl+C to stop)")
+    seen = None
+    try:
+        while True:
+            current = snapshot()
+            if current != seen:
+                if seen is not None:
+                    changed = sorted(path for path in current.keys() | seen.keys() if current.get(path) != seen.get(path))
+                    print(f"\n✏️ {len(changed)} files changed: {', '.join(changed[:5])}{' ...' if len(changed) > 5 else ''}")
+                # Taken before analyzing so edits made meanwhile trigger another round
+                seen = current
+                fingerprint = project_fingerprint() if cache is not None else None
+                results = analyze_project(args, cache=cache, fingerprint=fingerprint, strategy=strategy, state=state)
+                print("\n" + json.dumps(results), flush=True)
+                print("\n👀 Waiting for changes...")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching")
+    finally:
+        stop_all_fork_servers()
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser for the core."""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--no-cache", action="store_true", help="Ignore and do not update the probe result cache")
+    common.add_argument("--clear-cache", action="store_true", help="Drop all cached probe results before running")
+    common.add_argument("--workers", type=int, default=1,
+                        help="Number of versions to probe in parallel, each in its own sandbox")
+    common.add_argument("--strategy", choices=sorted(STRATEGIES), default="bisect",
+                        help="Search strategy for serial runs")
+    common.add_argument("--verify-boundary", action="store_true",
+                        help="Also probe around the boundary to catch non-monotonic breakage")
+    common.add_argument("--include-prereleases", action="store_true",
+                        help="Consider pre-release versions")
+    common.add_argument("--cpu-slots", type=int, default=None,
+                        help="Maximum concurrent test runs (default: number of CPUs)")
+    common.add_argument("--network-slots", type=int, default=4,
+                        help="Maximum concurrent installs and downloads")
+    common.add_argument("--test-timeout", type=float, default=3600,
+                        help="Kill a test run after this many seconds (0 disables)")
+    common.add_argument("--test-idle-timeout", type=float, default=600,
+                        help="Kill a test run that prints nothing for this many seconds (0 disables)")
+    common.add_argument("--no-fail-fast", action="store_true",
+                        help="Run the whole test suite instead of stopping at the first failure")
+    common.add_argument("--fork-server", action="store_true",
+                        help="Start Python test runs from a zygote with the project's unrelated imports preloaded")
+    common.add_argument("--no-test-selection", action="store_true",
+                        help="Probe with the full test suite instead of only the tests that reach the package")
+    common.add_argument("--full", action="store_true",
+                        help="Re-analyze every version instead of only what changed since the last analysis")
+    common.add_argument("--bench", metavar="COMMAND",
+                        help="Also find the first working version whose benchmark command got slower or larger")
+    common.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help="Benchmark runs per version (at least 5 are needed to show a significant change)")
+    common.add_argument("--latency-threshold", type=float, default=DEFAULT_LATENCY_THRESHOLD,
+                        help="Smallest relative slowdown of the median reported as a regression")
+    common.add_argument("--memory-threshold", type=float, default=DEFAULT_MEMORY_THRESHOLD,
+                        help="Smallest relative growth of the median peak RSS reported as a regression")
+    common.add_argument("--trace", metavar="DIR",
+                        help="Write timing spans of every phase to DIR/spans.json and a Chrome trace to DIR/trace.json")
+
+    parser = argparse.ArgumentParser(prog="main.py")
+    subparsers = parser.add_subparsers(dest="command")
+    analyze = subparsers.add_parser("analyze", parents=[common], help="Analyze all project dependencies")
+    analyze.add_argument("--jobs", type=int, default=1, help="Number of packages to analyze concurrently")
+    analyze.add_argument("--order", choices=["direct-first", "most-outdated"], default="direct-first",
+                         help="Which packages to analyze first")
+    analyze.add_argument("--recursive", action="store_true",
+                         help="Analyze the dependencies of every sub-project, in the environment each installs them in")
+    upgrade = subparsers.add_parser("upgrade", parents=[common], help="Find the latest working version of a package")
+    upgrade.add_argument("package")
+    watch = subparsers.add_parser("watch", parents=[common],
+                                  help="Re-analyze affected dependencies whenever manifests or sources change")
+    watch.add_argument("--jobs", type=int, default=1, help="Number of packages to analyze concurrently")
+    watch.add_argument("--order", choices=["direct-first", "most-outdated"], default="direct-first",
+                       help="Which packages to analyze first")
+    watch.add_argument("--recursive", action="store_true",
+                       help="Analyze the dependencies of every sub-project, in the environment each installs them in")
+    watch.add_argument("--interval", type=float, default=2.0, help="Seconds between checks for changes")
+    coordinator = subparsers.add_parser("coordinator", parents=[common],
+                                        help="Analyze all project dependencies with probes run by remote workers")
+    coordinator.add_argument("--jobs", type=int, default=1, help="Number of packages to analyze concurrently")
+    coordinator.add_argument("--order", choices=["direct-first", "most-outdated"], default="direct-first",
+                             help="Which packages to analyze first")
+    coordinator.add_argument("--recursive", action="store_true",
+                             help="Analyze the dependencies of every sub-project, in the environment each installs them in")
+    coordinator.add_argument("--listen", default=f"127.0.0.1:{DEFAULT_PORT}", metavar="HOST:PORT",
+                             help="Address workers connect to")
+    coordinator.add_argument("--token", default=os.environ.get("DTM_COORDINATOR_TOKEN"),
+                             help="Shared secret workers must send (default: $DTM_COORDINATOR_TOKEN)")
+    coordinator.add_argument("--wait-workers", type=int, default=1,
+                             help="Number of workers to wait for before analyzing")
+    coordinator.add_argument("--lease-timeout", type=float, default=DEFAULT_LEASE_TIMEOUT,
+                             help="Seconds without a heartbeat after which a probe is given to another worker")
+    worker = subparsers.add_parser("worker", parents=[common],
+                                   help="Run probes for a coordinator in this checkout of the project")
+    worker.add_argument("coordinator", metavar="URL", help="The coordinator, e.g. http://127.0.0.1:8765")
+    worker.add_argument("--slots", type=int, default=1, help="Number of probes to run at once")
+    worker.add_argument("--token", default=os.environ.get("DTM_COORDINATOR_TOKEN"),
+                        help="Shared secret of the coordinator (default: $DTM_COORDINATOR_TOKEN)")
+    bench = subparsers.add_parser("bench", help="Benchmark DTM's search modes on synthetic registries")
+    bench.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                       help="Scenario to run (repeatable; default: all)")
+    bench.add_argument("--mode", action="append", choices=MODES, help="Search mode to run (repeatable; default: all)")
+    bench.add_argument("--repeat", type=int, default=3, help="Runs per scenario and mode; the fastest is kept")
+    bench.add_argument("--output", help="Also write the results as JSON to this file")
+    bench.add_argument("--compare", metavar="FILE", help="Fail on regressions against an earlier --output file")
+    bench.add_argument("--max-slowdown", type=float, default=0.25,
+                       help="With --compare, the relative slowdown that counts as a regression")
+    serve = subparsers.add_parser("serve", help="Run a long-lived core that answers JSON-RPC requests")
+    serve.add_argument("--socket", help="Listen on this unix socket instead of stdin/stdout")
+    serve.add_argument("--idle-timeout", type=float, default=900,
+                       help="With --socket, exit after this many seconds without requests")
+    return parser
+
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python main.py [upgrade <package-name> | analyze]")
+        print("Usage: python main.py [upgrade <package-name> | analyze | watch | coordinator | worker <url> | bench | serve]")
         sys.exit(1)
 
-    if sys.argv[1] == 'analyze':
-        # Analyze all dependencies
-        print("🔍 Analyzing project dependencies...")
-        dependencies = detect_dependencies()
-        
-        results = {}
-        for language, packages in dependencies.items():
-            if packages:
-                print(f"\n📦 Found {len(packages)} {language} dependencies:")
-                for package in packages:
-                    print(f"  - {package}")
-                
-                print(f"\n🔬 Analyzing {language} dependencies...")
-                for package in packages:
-                    result = analyze_package(package, language)
-                    results[package] = result
+    if sys.argv[1] not in ('analyze', 'upgrade', 'watch', 'coordinator', 'worker', 'bench', 'serve'):
+        print("Unknown command. Use 'analyze', 'upgrade <package-name>', 'watch', 'coordinator', "
+              "'worker <url>', 'bench' or 'serve'")
+        sys.exit(1)
+
+    args = build_parser().parse_args()
+
+    if args.command == 'serve':
+        # Imported here because the server drives this module's functions
+        from server import serve
+        serve(socket_path=args.socket, idle_timeout=args.idle_timeout)
+        return
+
+    if args.command == 'bench':
+        from benchmark import bench
+        sys.exit(bench(args.scenario or list(SCENARIOS), args.mode or MODES, repeat=args.repeat,
+                       output=args.output, baseline_path=args.compare, max_slowdown=args.max_slowdown))
+
+    if args.trace:
+        enable_tracing()
+
+    strategy = make_strategy(args.strategy, verify_boundary=args.verify_boundary)
+    configure_test_runner(wall_timeout=args.test_timeout, idle_timeout=args.test_idle_timeout,
+                          fail_fast=not args.no_fail_fast, fork_server=args.fork_server)
+    cache = None
+    fingerprint = None
+    if not args.no_cache:
+        cache = ResultCache()
+        if args.clear_cache:
+            cache.clear()
+        fingerprint = project_fingerprint()
+
+    state = None if args.full else AnalysisState()
+
+    if args.command == 'worker':
+        try:
+            Worker(args.coordinator, get_adapter, slots=args.slots, token=args.token,
+                   fingerprint=project_fingerprint(), cache=cache).run()
+        finally:
+            stop_all_fork_servers()
+        return
+
+    remote = None
+    if args.command == 'coordinator':
+        host, _, port = args.listen.rpartition(":")
+        remote = Coordinator(fingerprint=project_fingerprint(), lease_timeout=args.lease_timeout, token=args.token)
+        host, port = remote.serve(host or "127.0.0.1", int(port))
+        print(f"📡 Coordinating on http://{host}:{port}; waiting for {args.wait_workers} workers...")
+        remote.wait_for_workers(args.wait_workers)
+
+    if args.command == 'watch':
+        watch_project(args, cache=cache, strategy=strategy, state=state)
+
+    elif args.command in ('analyze', 'coordinator'):
+        try:
+            results = analyze_project(args, cache=cache, fingerprint=fingerprint, strategy=strategy,
+                                      state=state, remote=remote)
+        finally:
+            if remote is not None:
+                remote.shutdown()
 
         # Output results
         print("\n📊 Analysis Results:")
@@ -189,6 +754,12 @@ def main():
                     print(f"  ✅ Latest working version: {result['latest_working']}")
                 if result["first_broken"]:
                     print(f"  ❌ First broken version: {result['first_broken']}")
+                performance = result.get("performance")
+                if performance and performance["first_regressed"]:
+                    regression = performance["regression"]
+                    ratios = ", ".join(f"{measure} x{regression[measure]['ratio']}"
+                                       for measure in ("latency", "rss_kb") if regression.get(measure))
+                    print(f"  🐢 First slower version: {performance['first_regressed']} ({ratios} vs {performance['baseline']})")
                 if result["dependency_conflicts"]:
                     print("  ⚠️ Dependency conflicts found:")
                     for dep, issues in result["dependency_conflicts"].items():
@@ -201,19 +772,21 @@ def main():
         # Output JSON for CLI to parse
         print("\n" + json.dumps(results))
 
-    elif sys.argv[1] == 'upgrade':
-        if len(sys.argv) < 3:
-            print("Usage: python main.py upgrade <package-name>")
-            sys.exit(1)
-
-        package_name = sys.argv[2]
+    elif args.command == 'upgrade':
+        package_name = args.package
         language = detect_language()
-        result = analyze_package(package_name, language)
+        result = analyze_package(package_name, language, cache=cache, fingerprint=fingerprint,
+                                 workers=args.workers, strategy=strategy,
+                                 include_prereleases=args.include_prereleases,
+                                 resources=default_resources(args.cpu_slots, args.network_slots),
+                                 select_tests=not args.no_test_selection, state=state,
+                                 **benchmark_options(args))
         print("\n" + json.dumps(result))
 
-    else:
-        print("Unknown command. Use 'analyze' or 'upgrade <package-name>'")
-        sys.exit(1)
+    if args.trace:
+        # stderr, so the results stay the last line of stdout
+        spans_path, trace_path = get_tracer().export(args.trace)
+        print(f"🧭 Wrote {spans_path} and {trace_path}", file=sys.stderr)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
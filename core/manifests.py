@@ -0,0 +1,498 @@
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from cache import IGNORED_DIRS
+from metadata import normalize_python_name
+from versions import parse_version
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+INDEX_VERSION = 2
+IGNORE_FILES = (".gitignore", ".dtmignore")
+LANGUAGES = ("python", "js", "rust")
+# Dependency groups that only matter for development
+DEV_GROUPS = {"dev", "test", "tests", "testing", "lint", "docs", "typing"}
+LOCKFILE_NAMES = {"poetry.lock", "package-lock.json", "npm-shrinkwrap.json", "Cargo.lock"}
+# Manifests that can make a directory the workspace root of the projects below it
+WORKSPACE_MANIFESTS = {"js": "package.json", "rust": "Cargo.toml"}
+PEP440_OPERATORS = ("===", "==", "!=", "~=", ">=", "<=", ">", "<")
+PEP508_NAME = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[[^\]]*\])?\s*(.*)$')
+
+def manifest_kind(name: str) -> Optional[Tuple[str, str]]:
+    """(language, parser) for a manifest or lockfile name, or None for other files."""
+    if name.startswith("requirements") and name.endswith(".txt"):
+        return "python", "requirements"
+    return {
+        "pyproject.toml": ("python", "pyproject"),
+        "poetry.lock": ("python", "poetry-lock"),
+        "package.json": ("js", "package-json"),
+        "package-lock.json": ("js", "npm-lock"),
+        "npm-shrinkwrap.json": ("js", "npm-lock"),
+        "Cargo.toml": ("rust", "cargo-toml"),
+        "Cargo.lock": ("rust", "cargo-lock"),
+    }.get(name)
+
+def _glob_regex(pattern: str) -> str:
+    """A gitignore glob as a regex over /-separated paths."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            regex += fnmatch.translate(pattern[i:end + 1])[4:-3]
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+class IgnoreRules:
+    """The common subset of gitignore syntax, from every ignore file seen so far.
+
+    Rules from a nested ignore file only match below its directory; the
+    last matching rule wins and ``!`` re-includes.
+    """
+
+    def __init__(self):
+        self.rules: List[Tuple[re.Pattern, bool, bool]] = []
+
+    def load(self, directory: str, relative_dir: str):
+        base = "" if relative_dir == "." else relative_dir + "/"
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(directory, name), "r", encoding="utf-8", errors="replace") as f:
+                    lines = f.read().splitlines()
+            except OSError:
+                continue
+            for line in lines:
+                line = line.rstrip()
+                if not line or line.startswith("#"):
+                    continue
+                negate = line.startswith("!")
+                line = line[1:] if negate else line
+                dir_only = line.endswith("/")
+                line = line.rstrip("/")
+                # Patterns without a slash match at any depth
+                prefix = re.escape(base) if "/" in line else re.escape(base) + "(?:.*/)?"
+                self.rules.append((re.compile(prefix + _glob_regex(line.lstrip("/")) + "$"), negate, dir_only))
+
+    def ignored(self, relative: str, is_dir: bool) -> bool:
+        ignored = False
+        for pattern, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if pattern.match(relative):
+                ignored = not negate
+        return ignored
+
+def _requirement(spec: str) -> Optional[Tuple[str, str]]:
+    match = PEP508_NAME.match(spec.split(";", 1)[0])
+    if not match:
+        return None
+    return normalize_python_name(match.group(1)), match.group(2).strip()
+
+def _parse_requirements(text: str, name: str) -> Dict:
+    dev = bool(re.search(r"dev|test|lint|doc", name))
+    dependencies = {}
+    for line in text.splitlines():
+        line = line.split(" #", 1)[0].strip()
+        if not line or line.startswith(("#", "-")) or "://" in line:
+            continue
+        requirement = _requirement(line)
+        if requirement:
+            dependencies[requirement[0]] = {"constraint": requirement[1], "dev": dev}
+    return {"dependencies": dependencies}
+
+def _poetry_constraint(value) -> Optional[str]:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict) and "version" in value:
+        return value["version"]
+    return None  # path, git and url dependencies have no registry versions
+
+def _parse_pyproject(data: Dict) -> Dict:
+    dependencies = {}
+
+    def add(name: str, constraint: Optional[str], dev: bool):
+        key = normalize_python_name(name)
+        if key == "python" or constraint is None:
+            return
+        # A runtime declaration wins over a dev one
+        if key not in dependencies or dependencies[key]["dev"]:
+            dependencies[key] = {"constraint": constraint, "dev": dev}
+
+    project = data.get("project", {})
+    for spec in project.get("dependencies", []):
+        requirement = _requirement(spec)
+        if requirement:
+            add(requirement[0], requirement[1], False)
+    for group, specs in project.get("optional-dependencies", {}).items():
+        for spec in specs:
+            requirement = _requirement(spec)
+            if requirement:
+                add(requirement[0], requirement[1], group in DEV_GROUPS)
+    for specs in data.get("dependency-groups", {}).values():
+        for spec in specs:
+            requirement = _requirement(spec) if isinstance(spec, str) else None
+            if requirement:
+                add(requirement[0], requirement[1], True)
+    poetry = data.get("tool", {}).get("poetry", {})
+    for name, value in poetry.get("dependencies", {}).items():
+        add(name, _poetry_constraint(value), False)
+    for name, value in poetry.get("dev-dependencies", {}).items():
+        add(name, _poetry_constraint(value), True)
+    for group, table in poetry.get("group", {}).items():
+        for name, value in table.get("dependencies", {}).items():
+            add(name, _poetry_constraint(value), group != "main")
+    return {"dependencies": dependencies}
+
+def _parse_package_json(data: Dict) -> Dict:
+    dependencies = {}
+    for field, dev in (("devDependencies", True), ("optionalDependencies", False), ("dependencies", False)):
+        for name, constraint in (data.get(field) or {}).items():
+            if isinstance(constraint, str) and not constraint.startswith(("file:", "link:", "workspace:")):
+                dependencies[name] = {"constraint": constraint, "dev": dev}
+    parsed = {"dependencies": dependencies}
+    workspaces = data.get("workspaces")
+    if isinstance(workspaces, dict):  # Yarn's {"packages": [...]}
+        workspaces = workspaces.get("packages")
+    if workspaces:
+        parsed["workspace"] = {"members": list(workspaces), "exclude": []}
+    return parsed
+
+def _parse_npm_lock(data: Dict) -> Dict:
+    locked = {}
+    for path, entry in (data.get("packages") or {}).items():
+        # Only the project's own, hoisted copies; nested ones belong to other packages
+        if path.startswith("node_modules/") and "/node_modules/" not in path and not entry.get("link"):
+            locked[path[len("node_modules/"):]] = entry.get("version")
+    if not locked:  # lockfileVersion 1
+        for name, entry in (data.get("dependencies") or {}).items():
+            locked[name] = entry.get("version")
+    return {"locked": {name: version for name, version in locked.items() if version}}
+
+def _parse_cargo_toml(data: Dict) -> Dict:
+    dependencies = {}
+
+    def add_table(table: Dict, dev: bool, dependencies: Dict):
+        for name, value in (table or {}).items():
+            if isinstance(value, str):
+                constraint = value
+            elif isinstance(value, dict) and value.get("workspace"):
+                constraint = "workspace"
+            elif isinstance(value, dict) and "version" in value:
+                constraint = value["version"]
+                name = value.get("package", name)
+            else:
+                continue  # path and git dependencies
+            if name not in dependencies or dependencies[name]["dev"]:
+                dependencies[name] = {"constraint": constraint, "dev": dev}
+
+    tables = [data] + list(data.get("target", {}).values())
+    for table in tables:
+        add_table(table.get("dependencies"), False, dependencies)
+        add_table(table.get("build-dependencies"), False, dependencies)
+        add_table(table.get("dev-dependencies"), True, dependencies)
+    # Declared for members that say `workspace = true`; not a use in itself
+    inherited: Dict[str, Dict] = {}
+    add_table(data.get("workspace", {}).get("dependencies"), False, inherited)
+    parsed = {"dependencies": dependencies}
+    if "workspace" in data:
+        parsed["workspace"] = {"members": data["workspace"].get("members", []),
+                               "exclude": data["workspace"].get("exclude", [])}
+    if inherited:
+        parsed["workspace_dependencies"] = {name: declared["constraint"] for name, declared in inherited.items()}
+    return parsed
+
+def _parse_lock_packages(data: Dict, registry_only: bool) -> Dict:
+    locked = {}
+    for package in data.get("package", []):
+        if registry_only and not str(package.get("source", "")).startswith(("registry+", "sparse+")):
+            continue  # workspace members and path crates
+        name = normalize_python_name(package["name"]) if not registry_only else package["name"]
+        locked[name] = package.get("version")
+    return {"locked": locked}
+
+def parse_manifest(content: bytes, name: str) -> Dict:
+    """Dependencies ({name: {constraint, dev}}) and locked versions of one manifest's content."""
+    language, kind = manifest_kind(name)
+    text = content.decode("utf-8", "replace")
+    try:
+        if kind == "requirements":
+            return _parse_requirements(text, name)
+        if kind in ("package-json", "npm-lock"):
+            data = json.loads(text)
+            return _parse_package_json(data) if kind == "package-json" else _parse_npm_lock(data)
+        if tomllib is None:
+            return {"error": "reading TOML needs Python 3.11 or the tomli package"}
+        data = tomllib.loads(text)
+        if kind == "pyproject":
+            return _parse_pyproject(data)
+        if kind == "cargo-toml":
+            return _parse_cargo_toml(data)
+        return _parse_lock_packages(data, registry_only=(kind == "cargo-lock"))
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+def _matches(relative: str, patterns: List[str]) -> bool:
+    """Whether relative matches one of a workspace's member globs."""
+    return any(fnmatch.fnmatchcase(relative, os.path.normpath(pattern)) for pattern in patterns)
+
+class ManifestIndex:
+    """Every dependency manifest and lockfile under a root, in ``.dtm/manifest-index.json``.
+
+    A refresh walks the tree once, skipping ignored paths, and re-parses,
+    in parallel, only manifests whose size or mtime changed and whose
+    content hash differs from the stored one. The index answers which
+    projects use which package, at which constraint and locked version.
+    """
+
+    def __init__(self, root: str = ".", path: Optional[str] = None, workers: Optional[int] = None):
+        self.root = os.path.abspath(root)
+        self.path = path or os.path.join(self.root, ".dtm", "manifest-index.json")
+        self.workers = workers
+        self.files: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.files = data.get("files", {})
+        except (OSError, ValueError):
+            self.files = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"version": INDEX_VERSION, "files": self.files}, f)
+        os.replace(temporary, self.path)
+
+    def _walk(self) -> Dict[str, os.stat_result]:
+        """Stat of every manifest not excluded by an ignore file, by relative path."""
+        found = {}
+        rules = IgnoreRules()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            relative_dir = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            rules.load(dirpath, relative_dir)
+            prefix = "" if relative_dir == "." else relative_dir + "/"
+            dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_DIRS and not d.startswith(".")
+                                 and not rules.ignored(prefix + d, True))
+            for name in filenames:
+                if manifest_kind(name) is None or rules.ignored(prefix + name, False):
+                    continue
+                try:
+                    found[prefix + name] = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+        return found
+
+    def _reparse(self, relative: str, stat: os.stat_result) -> Optional[Dict]:
+        """The new entry for a manifest whose stat changed, or None if it vanished."""
+        try:
+            with open(os.path.join(self.root, relative), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        digest = hashlib.sha256(content).hexdigest()
+        entry = self.files.get(relative)
+        if entry is None or entry.get("sha256") != digest:
+            language, _ = manifest_kind(os.path.basename(relative))
+            entry = dict(parse_manifest(content, os.path.basename(relative)), language=language, sha256=digest)
+        return dict(entry, mtime=stat.st_mtime_ns, size=stat.st_size)
+
+    def refresh(self) -> "ManifestIndex":
+        """Re-read new and changed manifests, drop deleted ones and persist the index."""
+        with self._lock:
+            found = self._walk()
+            stale = [relative for relative, stat in found.items()
+                     if (self.files.get(relative) or {}).get("mtime") != stat.st_mtime_ns
+                     or self.files[relative].get("size") != stat.st_size]
+            changed = set(self.files) != set(found)
+            if stale:
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    entries = list(pool.map(lambda relative: self._reparse(relative, found[relative]), stale))
+                for relative, entry in zip(stale, entries):
+                    if entry is None:
+                        found.pop(relative)
+                    elif entry != self.files.get(relative):
+                        self.files[relative] = entry
+                        changed = True
+            for relative in set(self.files) - set(found):
+                del self.files[relative]
+            if changed:
+                try:
+                    self._save()
+                except OSError:
+                    pass
+        return self
+
+    def errors(self) -> Dict[str, str]:
+        """Manifests that could not be parsed, with the reason."""
+        with self._lock:
+            return {relative: entry["error"] for relative, entry in self.files.items() if entry.get("error")}
+
+    def _locked_versions(self, language: str, directory: str) -> Dict[str, str]:
+        """Versions pinned by the nearest lockfile of language at or above directory."""
+        while True:
+            prefix = "" if directory == "." else directory + "/"
+            for name in sorted(LOCKFILE_NAMES):
+                entry = self.files.get(prefix + name)
+                if entry and entry.get("language") == language and "locked" in entry:
+                    return entry["locked"]
+            if directory == ".":
+                return {}
+            directory = os.path.dirname(directory) or "."
+
+    def environment(self, language: str, directory: str) -> str:
+        """The directory whose install provides the dependencies of the project in directory.
+
+        That is the nearest npm or Cargo workspace root above it that lists
+        it as a member, which installs for all its members; every other
+        project installs on its own.
+        """
+        manifest = WORKSPACE_MANIFESTS.get(language)
+        current = directory
+        with self._lock:
+            while manifest and current != ".":
+                current = os.path.dirname(current) or "."
+                prefix = "" if current == "." else current + "/"
+                workspace = self.files.get(prefix + manifest, {}).get("workspace")
+                member = directory[len(prefix):]
+                if workspace and _matches(member, workspace["members"]) and not _matches(member, workspace["exclude"]):
+                    return current
+        return directory
+
+    def _inherited_constraint(self, package: str, directory: str) -> str:
+        """The constraint a Cargo workspace at or above directory declares for package."""
+        while directory != ".":
+            directory = os.path.dirname(directory) or "."
+            entry = self.files.get(("" if directory == "." else directory + "/") + "Cargo.toml") or {}
+            if package in entry.get("workspace_dependencies", {}):
+                return entry["workspace_dependencies"][package]
+        return "workspace"
+
+    def graph(self) -> Dict[str, Dict[str, List[Dict]]]:
+        """For each language and package, every project that declares it.
+
+        Each use records the project directory, the manifest, the declared
+        constraint, the version its lockfile pins (if any) and whether it
+        is only a dev dependency there.
+        """
+        with self._lock:
+            graph: Dict[str, Dict[str, List[Dict]]] = {language: {} for language in LANGUAGES}
+            for relative in sorted(self.files):
+                entry = self.files[relative]
+                directory = os.path.dirname(relative) or "."
+                locked = self._locked_versions(entry["language"], directory) if entry.get("dependencies") else {}
+                for package, declared in entry.get("dependencies", {}).items():
+                    graph[entry["language"]].setdefault(package, []).append({
+                        "project": directory,
+                        "manifest": relative,
+                        "constraint": declared["constraint"] if declared["constraint"] != "workspace"
+                        else self._inherited_constraint(package, directory),
+                        "locked": locked.get(package),
+                        "dev": declared["dev"],
+                    })
+        return graph
+
+    def projects(self) -> List[str]:
+        """Directories with at least one manifest that declares dependencies."""
+        with self._lock:
+            return sorted({os.path.dirname(relative) or "." for relative, entry in self.files.items()
+                           if entry.get("dependencies")})
+
+    def dependencies(self) -> Dict[str, Set[str]]:
+        """Every package used anywhere under the root, once per language."""
+        return {language: set(packages) for language, packages in self.graph().items()}
+
+    def dev_dependencies(self) -> Dict[str, Set[str]]:
+        """Packages that every project using them only needs for development."""
+        return {language: {package for package, uses in packages.items() if all(use["dev"] for use in uses)}
+                for language, packages in self.graph().items()}
+
+    def environments(self) -> Dict[str, Dict[str, Dict[str, List[Dict]]]]:
+        """The graph's uses of each package grouped by the environment they install in."""
+        grouped: Dict[str, Dict[str, Dict[str, List[Dict]]]] = {}
+        for language, packages in self.graph().items():
+            grouped[language] = {}
+            for package, uses in packages.items():
+                for use in uses:
+                    environment = self.environment(language, use["project"])
+                    grouped[language].setdefault(package, {}).setdefault(environment, []).append(use)
+        return grouped
+
+    def current_versions(self) -> Dict[str, Dict[str, str]]:
+        """The oldest version (or, failing that, a constraint) of each package any project uses now."""
+        return {language: {package: current_version(language, uses) for package, uses in packages.items()}
+                for language, packages in self.graph().items()}
+
+def current_version(language: str, uses: List[Dict]) -> str:
+    """The oldest version locked by uses of a package or, failing that, the first constraint."""
+    scheme = "pep440" if language == "python" else "semver"
+    locked = [use["locked"] for use in uses if use["locked"] and parse_version(use["locked"], scheme)]
+    if locked:
+        return min(locked, key=lambda v: parse_version(v, scheme))
+    return uses[0]["constraint"]
+
+def python_requirements(root: str = ".") -> Optional[List[str]]:
+    """What to install into the baseline of a Python project that has no requirements.txt.
+
+    Versions locked in ``poetry.lock`` are pinned; without a lockfile the
+    runtime and dev dependencies of ``pyproject.toml`` are used, keeping only
+    constraints pip understands (Poetry's ``^1.2`` and ``~1.2`` are dropped).
+    None when the directory has neither file.
+    """
+    found = {}
+    for name in ("poetry.lock", "pyproject.toml"):
+        path = os.path.join(root, name)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                parsed = parse_manifest(f.read(), name)
+            if "error" in parsed:
+                raise ValueError(f"Could not read {path}: {parsed['error']}")
+            found[name] = parsed
+    if "poetry.lock" in found:
+        return sorted(f"{name}=={version}" for name, version in found["poetry.lock"]["locked"].items() if version)
+    if "pyproject.toml" in found:
+        return sorted(name + (declared["constraint"] if declared["constraint"].startswith(PEP440_OPERATORS) else "")
+                      for name, declared in found["pyproject.toml"]["dependencies"].items())
+    return None
+
+_indexes: Dict[str, ManifestIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_manifest_index(root: str = ".") -> ManifestIndex:
+    """Return the process-wide, freshly refreshed manifest index for a tree."""
+    key = os.path.abspath(root)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = ManifestIndex(key)
+        index = _indexes[key]
+    return index.refresh()
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache import default_cache_dir
+
+PYPI_SIMPLE_URL = os.environ.get("DTM_PYPI_SIMPLE_URL", "https://pypi.org/simple")
+NPM_REGISTRY_URL = os.environ.get("DTM_NPM_REGISTRY_URL", "https://registry.npmjs.org")
+PYPI_JSON_URL = os.environ.get("DTM_PYPI_JSON_URL", "https://pypi.org/pypi")
+CRATES_INDEX_URL = os.environ.get("DTM_CRATES_INDEX_URL", "https://index.crates.io")
+
+PYPI_SIMPLE_JSON = "application/vnd.pypi.simple.v1+json"
+NPM_ABBREVIATED_JSON = "application/vnd.npm.install-v1+json"
+
+# Seconds a revalidated document is served from memory before asking again
+DEFAULT_FRESH_TTL = 300
+
+def normalize_python_name(package: str) -> str:
+    """Normalize a project name as PEP 503 does."""
+    return re.sub(r"[-_.]+", "-", package).lower()
+
+def crates_index_path(crate: str) -> str:
+    """Relative path of a crate's file in the crates.io sparse index."""
+    name = crate.lower()
+    if len(name) <= 2:
+        return f"{len(name)}/{name}"
+    if len(name) == 3:
+        return f"3/{name[0]}/{name}"
+    return f"{name[:2]}/{name[2:4]}/{name}"
+
+SDIST_SUFFIXES = (".tar.gz", ".tar.bz2", ".tgz", ".zip")
+
+def version_from_filename(filename: str) -> Optional[str]:
+    """Version encoded in a wheel or sdist filename."""
+    if filename.endswith(".whl"):
+        parts = filename.split("-")
+        return parts[1] if len(parts) >= 5 else None
+    for suffix in SDIST_SUFFIXES:
+        if filename.endswith(suffix):
+            stem = filename[:-len(suffix)]
+            return stem.rsplit("-", 1)[1] if "-" in stem else None
+    return None
+
+class _SimpleIndexParser(HTMLParser):
+    """Collects file entries from a PEP 503 HTML project page."""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+        self.files: List[Dict] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        attrs = dict(attrs)
+        url = urljoin(self.base_url, attrs.get("href", ""))
+        filename = url.split("#", 1)[0].rsplit("/", 1)[-1]
+        metadata = attrs.get("data-core-metadata", attrs.get("data-dist-info-metadata"))
+        self.files.append({
+            "filename": filename,
+            "url": url,
+            "requires-python": attrs.get("data-requires-python"),
+            "yanked": "data-yanked" in attrs,
+            "core-metadata": bool(metadata) and metadata != "false",
+        })
+
+def parse_simple_index(body: str, url: str) -> Dict:
+    """Parse a simple-index project page into PEP 691 JSON shape.
+
+    Mirrors that only serve the PEP 503 HTML form are handled too.
+    """
+    if body.lstrip().startswith("{"):
+        project = json.loads(body)
+    else:
+        parser = _SimpleIndexParser(url)
+        parser.feed(body)
+        project = {"files": parser.files}
+    if "versions" not in project:
+        versions = []
+        for file in project.get("files", []):
+            version = version_from_filename(file["filename"])
+            if version and version not in versions:
+                versions.append(version)
+        project["versions"] = versions
+    return project
+
+class MetadataClient:
+    """Registry metadata fetcher with a pooled session and an on-disk HTTP cache.
+
+    Responses are stored with their ETag and Last-Modified headers and
+    revalidated with conditional requests, so unchanged documents cost a 304.
+    When the registry is unreachable the last stored copy is used. Within
+    ``fresh_ttl`` seconds of a revalidation a document is served from
+    memory, so a long-lived ``watch`` or ``serve`` still sees new releases.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: int = 8, timeout: float = 15,
+                 fresh_ttl: float = DEFAULT_FRESH_TTL):
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), "metadata")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.fresh_ttl = fresh_ttl
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Documents fetched or revalidated by this process, with when they go stale
+        self._fresh: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _cache_path(self, url: str, accept: str) -> str:
+        key = hashlib.sha256(f"{accept} {url}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def fetch(self, url: str, accept: str = "application/json", immutable: bool = False) -> Optional[str]:
+        """Return the body at url, revalidating any cached copy. None on 404.
+
+        ``immutable`` documents (per-release metadata) are served from the
+        cache without asking the registry again.
+        """
+        memo_key = f"{accept} {url}"
+        with self._lock:
+            expires, body = self._fresh.get(memo_key, (0.0, None))
+            if time.monotonic() < expires:
+                return body
+
+        path = self._cache_path(url, accept)
+        cached = None
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                cached = json.load(f)
+            if immutable:
+                with self._lock:
+                    self._fresh[memo_key] = (float("inf"), cached["body"])
+                return cached["body"]
+
+        headers = {"Accept": accept}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            if cached is None:
+                raise
+            body = cached["body"]
+        else:
+            if response.status_code == 304 and cached is not None:
+                body = cached["body"]
+            elif response.status_code == 404:
+                body = None
+            else:
+                response.raise_for_status()
+                body = response.text
+                entry = {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "body": body,
+                }
+                staging = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+                with open(staging, "w") as f:
+                    json.dump(entry, f)
+                os.replace(staging, path)
+
+        with self._lock:
+            self._fresh[memo_key] = (float("inf") if immutable else time.monotonic() + self.fresh_ttl, body)
+        return body
+
+    def fetch_json(self, url: str, accept: str = "application/json", immutable: bool = False) -> Optional[Dict]:
+        body = self.fetch(url, accept, immutable=immutable)
+        return json.loads(body) if body is not None else None
+
+    def fetch_many(self, urls: List[str], accept: str = "application/json") -> Dict[str, Optional[str]]:
+        """Fetch several documents concurrently, at most max_workers at a time.
+
+        Failures are reported as missing entries rather than raised.
+        """
+        def fetch_one(url: str):
+            try:
+                return url, self.fetch(url, accept)
+            except requests.RequestException as e:
+                print(f"Error fetching {url}: {e}")
+                return url, None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(pool.map(fetch_one, urls))
+
+    # Registry specific helpers
+
+    def pypi_project_url(self, package: str) -> str:
+        return f"{PYPI_SIMPLE_URL}/{normalize_python_name(package)}/"
+
+    def pypi_project(self, package: str) -> Optional[Dict]:
+        """Simple-index entry for a Python project, in PEP 691 JSON shape."""
+        url = self.pypi_project_url(package)
+        body = self.fetch(url, f"{PYPI_SIMPLE_JSON}, text/html;q=0.1")
+        return parse_simple_index(body, url) if body is not None else None
+
+    def pypi_release_url(self, package: str, version: str) -> str:
+        return f"{PYPI_JSON_URL}/{normalize_python_name(package)}/{version}/json"
+
+    def pypi_versions(self, package: str) -> List[str]:
+        project = self.pypi_project(package)
+        return list(project.get("versions", [])) if project else []
+
+    def npm_package_url(self, package: str) -> str:
+        return f"{NPM_REGISTRY_URL}/{package.replace('/', '%2F')}"
+
+    def npm_versions(self, package: str) -> List[str]:
+        document = self.fetch_json(self.npm_package_url(package), NPM_ABBREVIATED_JSON)
+        return list(document.get("versions", {}).keys()) if document else []
+
+    def crate_index_url(self, crate: str) -> str:
+        return f"{CRATES_INDEX_URL}/{crates_index_path(crate)}"
+
+    def crate_releases(self, crate: str) -> List[Dict]:
+        """Entries of a crate's sparse-index file, one per published version."""
+        body = self.fetch(self.crate_index_url(crate), "text/plain")
+        if body is None:
+            return []
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+    def crate_versions(self, crate: str) -> List[str]:
+        return [release["vers"] for release in self.crate_releases(crate) if not release.get("yanked")]
+
+    def prefetch(self, language: str, packages: List[str]):
+        """Warm the cache for many packages of one ecosystem concurrently."""
+        if language == "js":
+            self.fetch_many([self.npm_package_url(p) for p in packages], NPM_ABBREVIATED_JSON)
+        elif language == "rust":
+            self.fetch_many([self.crate_index_url(p) for p in packages], "text/plain")
+        else:
+            self.fetch_many([self.pypi_project_url(p) for p in packages], f"{PYPI_SIMPLE_JSON}, text/html;q=0.1")
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_metadata_client() -> MetadataClient:
+    """Return the process-wide metadata client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MetadataClient()
+        return _client
@@ -0,0 +1,142 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Tuple
+from cache import ResultCache
+from instrument import span
+from probe import probe_version
+from scheduler import ResourcePool
+
+def _evenly_spaced(low: int, high: int, count: int) -> List[int]:
+    """Pick up to count indices evenly spread over the open interval (low, high)."""
+    size = high - low - 1
+    if size <= 0:
+        return []
+    count = min(count, size)
+    return sorted({low + (k * (size + 1)) // (count + 1) for k in range(1, count + 1)})
+
+def _next_candidate(low: int, high: int, in_flight: List[int]) -> Optional[int]:
+    """Midpoint of the largest unprobed gap in (low, high) between in-flight probes."""
+    points = [low] + sorted(i for i in in_flight if low < i < high) + [high]
+    best = None
+    for a, b in zip(points, points[1:]):
+        if b - a > 1 and (best is None or b - a > best[1] - best[0]):
+            best = (a, b)
+    if best is None:
+        return None
+    return (best[0] + best[1]) // 2
+
+def parallel_search_versions(versions: List[str], adapter_factory: Callable[[int], object], test_command: str,
+                             workers: int, cache: Optional[ResultCache] = None,
+                             fingerprint: Optional[str] = None,
+                             stats: Optional[Dict] = None,
+                             resources: Optional[ResourcePool] = None,
+                             run_probe: Optional[Callable[[str, threading.Event], Optional[Dict]]] = None
+                             ) -> Tuple[Optional[str], Optional[str], Optional[Dict]]:
+    """Find the latest working version by probing several candidates at once.
+
+    Each worker slot gets its own adapter from ``adapter_factory(slot)`` so
+    probes run in separate sandboxes. ``run_probe(version, cancel)``, when
+    given, runs the probes instead, for instance on remote workers. Like the serial binary search this
+    assumes versions work up to a boundary and fail after it, and returns the
+    same ``(latest_working, first_broken, dependency_conflicts)`` triple.
+    Probes that fall outside the remaining interval are cancelled.
+    """
+    if not versions:
+        return None, None, None
+
+    start = time.monotonic()
+    low, high = -1, len(versions)  # versions[low] works, versions[high] is broken
+    conflicts_at: Dict[int, Dict] = {}
+    counters = {"probes": 0, "cache_hits": 0, "cancelled": 0}
+
+    idle = list(range(workers))
+    adapters: Dict[int, object] = {}
+    slot_lock = threading.Lock()
+
+    def run(index: int, cancel: threading.Event) -> Optional[Dict]:
+        if run_probe is not None:
+            return run_probe(versions[index], cancel)
+        with slot_lock:
+            slot = idle.pop()
+        try:
+            if slot not in adapters:
+                adapters[slot] = adapter_factory(slot)
+            return probe_version(adapters[slot], versions[index], test_command,
+                                 cache=cache, fingerprint=fingerprint, cancel=cancel,
+                                 resources=resources)
+        finally:
+            with slot_lock:
+                idle.append(slot)
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(index: int):
+            print(f"\nTesting version {versions[index]}...")
+            cancel = threading.Event()
+            pending[pool.submit(contextvars.copy_context().run, run, index, cancel)] = (index, cancel)
+            counters["probes"] += 1
+
+        for index in _evenly_spaced(low, high, workers):
+            submit(index)
+
+        while pending:
+            with span("search_iteration", strategy="parallel", remaining=high - low - 1, in_flight=len(pending)):
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                index, _ = pending.pop(future)
+                result = future.result()
+                if result is None or not low < index < high:
+                    continue
+                version = versions[index]
+                if result.get("cached"):
+                    counters["cache_hits"] += 1
+                if result["installed"] and result["passed"]:
+                    print(f"✅ Version {version} works!")
+                    low = index
+                else:
+                    print(f"❌ Version {version} failed!" if result["installed"]
+                          else f"❌ Failed to install version {version}")
+                    if result["conflicts"]:
+                        conflicts_at[index] = result["conflicts"]
+                    high = index
+
+            # Drop probes that can no longer move the boundary
+            for future, (index, cancel) in list(pending.items()):
+                if not low < index < high:
+                    cancel.set()
+                    future.cancel()
+                    counters["cancelled"] += 1
+                    del pending[future]
+
+            while len(pending) < workers:
+                index = _next_candidate(low, high, [i for i, _ in pending.values()])
+                if index is None:
+                    break
+                submit(index)
+
+            # Whichever way the in-flight probes go, the next ones are the
+            # midpoints of the gaps around them
+            planner = next(iter(list(adapters.values())), None)
+            if pending and hasattr(planner, 'prefetch'):
+                points = [low] + sorted(i for i, _ in pending.values()) + [high]
+                planner.prefetch([versions[(a + b) // 2] for a, b in zip(points, points[1:]) if b - a > 1])
+
+    # Mirror the serial search, which reports the conflicts of the last
+    # (lowest) failed install it probed.
+    dependency_conflicts = None
+    if conflicts_at:
+        dependency_conflicts = conflicts_at[min(conflicts_at)]
+
+    if stats is not None:
+        stats.update(counters, mode="parallel", workers=workers,
+                     wall_time=round(time.monotonic() - start, 3))
+
+    for adapter in adapters.values():
+        if hasattr(adapter, 'close'):
+            adapter.close()
+
+    latest_working = versions[low] if low >= 0 else None
+    first_broken = versions[high] if high < len(versions) else None
+    return latest_working, first_broken, dependency_conflicts
@@ -0,0 +1,267 @@
+import math
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from events import emit
+from runner import get_test_runner
+from scheduler import ResourcePool, hold
+
+DEFAULT_SAMPLES = 10
+DEFAULT_LATENCY_THRESHOLD = 0.05
+DEFAULT_MEMORY_THRESHOLD = 0.10
+ALPHA = 0.01
+WARMUP_RUNS = 1
+# Above this many samples in total the normal approximation is used
+EXACT_LIMIT = 40
+
+def measure(argv: List[str], cwd: Optional[str] = None, timeout: Optional[float] = None,
+            env: Optional[Dict[str, str]] = None) -> Dict:
+    """Run argv once and return its wall time, CPU time, peak RSS and exit status.
+
+    Peak RSS (in KiB) and CPU time come from ``wait4`` and cover the process
+    and the children it waited for; they are None where ``wait4`` is
+    unavailable.
+    """
+    with tempfile.TemporaryFile() as output:
+        kwargs = {} if sys.platform == "win32" else {"start_new_session": True}
+        start = time.perf_counter()
+        try:
+            process = subprocess.Popen(argv, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=output,
+                                       stderr=subprocess.STDOUT, **kwargs)
+        except OSError as e:
+            return {"returncode": None, "wall": None, "cpu": None, "rss_kb": None, "output": str(e)}
+
+        timer = None
+        if timeout:
+            def kill():
+                try:
+                    if sys.platform == "win32":
+                        process.kill()
+                    else:
+                        os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            timer = threading.Timer(timeout, kill)
+            timer.daemon = True
+            timer.start()
+
+        cpu = rss_kb = None
+        try:
+            if hasattr(os, "wait4"):
+                _, status, usage = os.wait4(process.pid, 0)
+                wall = time.perf_counter() - start
+                process.returncode = os.waitstatus_to_exitcode(status)
+                cpu = usage.ru_utime + usage.ru_stime
+                # ru_maxrss is in bytes on macOS and KiB elsewhere
+                rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+            else:
+                process.wait()
+                wall = time.perf_counter() - start
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        output.seek(0)
+        tail = output.read()[-4000:].decode("utf-8", "replace")
+    return {"returncode": process.returncode, "wall": wall, "cpu": cpu, "rss_kb": rss_kb, "output": tail}
+
+@lru_cache(maxsize=None)
+def _u_counts(m: int, n: int) -> Tuple[int, ...]:
+    """Number of orderings of m and n untied values giving each U from 0 to m*n."""
+    if m == 0 or n == 0:
+        return (1,)
+    counts = [0] * (m * n + 1)
+    # The largest value belongs either to the first sample (adding n to U) or the second
+    for u, count in enumerate(_u_counts(m - 1, n)):
+        counts[u + n] += count
+    for u, count in enumerate(_u_counts(m, n - 1)):
+        counts[u] += count
+    return tuple(counts)
+
+def mann_whitney_u(baseline: List[float], candidate: List[float]) -> float:
+    """One-sided Mann-Whitney U test that candidate values tend to exceed baseline ones.
+
+    Returns the p-value: the chance of a U this large if both samples came
+    from the same distribution. Small, untied samples use the exact
+    distribution; otherwise a tie-corrected normal approximation.
+    """
+    m, n = len(candidate), len(baseline)
+    if not m or not n:
+        return 1.0
+    u = sum(1.0 if c > b else 0.5 if c == b else 0.0 for c in candidate for b in baseline)
+    values = candidate + baseline
+    ties = len(set(values)) < len(values)
+
+    if not ties and m + n <= EXACT_LIMIT:
+        counts = _u_counts(m, n)
+        return sum(counts[math.ceil(u):]) / sum(counts)
+
+    total = m + n
+    tie_term = sum(count ** 3 - count for count in (values.count(v) for v in set(values)))
+    variance = m * n / 12 * ((total + 1) - tie_term / (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - m * n / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def summarize(values: List[float]) -> Dict:
+    """Distribution summary of one measure's samples."""
+    if not values:
+        return {"samples": []}
+    ordered = sorted(values)
+    return {
+        "samples": [round(v, 6) for v in values],
+        "min": round(ordered[0], 6),
+        "median": round(statistics.median(ordered), 6),
+        "p90": round(ordered[min(len(ordered) - 1, math.ceil(0.9 * len(ordered)) - 1)], 6),
+        "max": round(ordered[-1], 6),
+        "mean": round(statistics.fmean(ordered), 6),
+        "stdev": round(statistics.stdev(ordered), 6) if len(ordered) > 1 else 0.0,
+    }
+
+class PerformanceBisector:
+    """Bisects the working versions of a package for a benchmark regression.
+
+    Each probed version is installed and the benchmark command is run
+    ``samples`` times (after a warm-up run) for latency and peak RSS. A
+    version regressed when a measure is significantly larger than at the
+    baseline version (Mann-Whitney U, p < ``ALPHA``) and its median grew
+    by more than the measure's threshold.
+    """
+
+    def __init__(self, adapter, command: str, samples: int = DEFAULT_SAMPLES,
+                 latency_threshold: float = DEFAULT_LATENCY_THRESHOLD,
+                 memory_threshold: float = DEFAULT_MEMORY_THRESHOLD,
+                 resources: Optional[ResourcePool] = None,
+                 remote: Optional[Callable[[str], Dict]] = None):
+        self.adapter = adapter
+        self.command = command
+        self.samples = max(2, samples)
+        self.latency_threshold = latency_threshold
+        self.memory_threshold = memory_threshold
+        self.resources = resources
+        # Collects a version's samples elsewhere, for instance on a remote worker
+        self.remote = remote
+        self.measured: Dict[str, Dict] = {}
+
+    def _argv(self) -> List[str]:
+        if hasattr(self.adapter, 'command_argv'):
+            return self.adapter.command_argv(self.command)
+        return self.command.split()
+
+    def _cwd(self) -> Optional[str]:
+        if hasattr(self.adapter, 'command_cwd'):
+            return self.adapter.command_cwd()
+        return None
+
+    def _env(self) -> Optional[Dict[str, str]]:
+        if hasattr(self.adapter, 'command_env'):
+            return self.adapter.command_env()
+        return None
+
+    def collect(self, version: str) -> Dict:
+        """Install version and sample the benchmark, remembering the result."""
+        if version in self.measured:
+            return self.measured[version]
+        package = self.adapter.package_name
+        print(f"\n⏱️ Benchmarking {package} {version} ({self.samples} samples)...")
+        if self.remote is not None:
+            self.measured[version] = self.remote(version)
+            return self.measured[version]
+        with hold(self.resources, "network"):
+            installed = self.adapter.install_version(version)
+        latency, cpu, rss = [], [], []
+        error = None if installed else "install failed"
+        if installed:
+            timeout = get_test_runner().wall_timeout
+            with hold(self.resources, "cpu"):
+                for run in range(WARMUP_RUNS + self.samples):
+                    sample = measure(self._argv(), cwd=self._cwd(), timeout=timeout, env=self._env())
+                    if sample["returncode"] != 0:
+                        error = f"benchmark exited with {sample['returncode']}: {sample['output'][-500:]}"
+                        break
+                    if run < WARMUP_RUNS:
+                        continue
+                    latency.append(sample["wall"])
+                    if sample["cpu"] is not None:
+                        cpu.append(sample["cpu"])
+                    if sample["rss_kb"] is not None:
+                        rss.append(sample["rss_kb"])
+        measured = {"latency": summarize(latency), "cpu": summarize(cpu), "rss_kb": summarize(rss)}
+        if error:
+            measured["error"] = error
+        self.measured[version] = measured
+        return measured
+
+    def _compare(self, measure: str, baseline: Dict, candidate: Dict, threshold: float) -> Optional[Dict]:
+        before, after = baseline[measure]["samples"], candidate[measure]["samples"]
+        if not before or not after:
+            return None
+        ratio = statistics.median(after) / statistics.median(before) if statistics.median(before) else 1.0
+        p_value = mann_whitney_u(before, after)
+        return {
+            "ratio": round(ratio, 4),
+            "p_value": round(p_value, 6),
+            "regressed": p_value < ALPHA and ratio - 1 > threshold,
+        }
+
+    def regressed(self, baseline: str, version: str) -> bool:
+        """Whether version is significantly slower or larger than baseline."""
+        candidate = self.collect(version)
+        reference = self.collect(baseline)
+        latency = self._compare("latency", reference, candidate, self.latency_threshold)
+        memory = self._compare("rss_kb", reference, candidate, self.memory_threshold)
+        candidate["vs_baseline"] = {"latency": latency, "rss_kb": memory}
+        # A benchmark that no longer runs is no safer an upgrade than a slow one
+        regressed = "error" in candidate or any(c and c["regressed"] for c in (latency, memory))
+        candidate["regressed"] = regressed
+        emit("benchmark_result", package=self.adapter.package_name, version=version,
+             median=candidate["latency"].get("median"), regressed=regressed)
+        print(f"{'🐢' if regressed else '🐇'} {version}: median {candidate['latency'].get('median')}s"
+              + (f" (x{latency['ratio']} vs {baseline}, p={latency['p_value']})" if latency else ""))
+        return regressed
+
+    def bisect(self, versions: List[str], baseline: str) -> Dict:
+        """Find the first version after baseline in versions whose benchmark regressed.
+
+        ``versions`` are the candidate upgrades in ascending order, all
+        expected to pass the tests; regressions are assumed to persist in
+        later versions.
+        """
+        start = time.monotonic()
+        baseline_result = self.collect(baseline)
+        first_regressed = last_fast = None
+        if "error" in baseline_result:
+            print(f"⚠️ The benchmark does not run on the baseline {baseline}; skipping the performance search")
+        elif versions:
+            if not self.regressed(baseline, versions[-1]):
+                last_fast = versions[-1]
+            else:
+                low, high = -1, len(versions) - 1
+                while high - low > 1:
+                    mid = (low + high) // 2
+                    if self.regressed(baseline, versions[mid]):
+                        high = mid
+                    else:
+                        low = mid
+                first_regressed = versions[high]
+                last_fast = versions[low] if low >= 0 else baseline
+
+        self.measured[baseline]["baseline"] = True
+        return {
+            "command": self.command,
+            "samples": self.samples,
+            "baseline": baseline,
+            "last_fast": last_fast,
+            "first_regressed": first_regressed,
+            "regression": self.measured[first_regressed].get("vs_baseline") if first_regressed else None,
+            "versions": dict(self.measured),
+            "wall_time": round(time.monotonic() - start, 3),
+        }
@@ -0,0 +1,135 @@
+import threading
+from typing import Dict, List, Optional
+from cache import ResultCache
+from scheduler import ResourcePool, hold
+from events import emit
+from instrument import span
+
+def lookup_cached(adapter, version: str, test_command: str,
+                  cache: Optional[ResultCache] = None, fingerprint: Optional[str] = None) -> Optional[Dict]:
+    """Return a stored probe result for version without running anything."""
+    if cache is None or not fingerprint:
+        return None
+    key = cache.make_key(fingerprint, type(adapter).__name__, adapter.package_name, version, test_command)
+    cached = cache.get(key)
+    return dict(cached, cached=True) if cached is not None else None
+
+def store_result(adapter, version: str, test_command: str, result: Dict,
+                 cache: Optional[ResultCache] = None, fingerprint: Optional[str] = None):
+    """Remember a probe result if its outcome is deterministic."""
+    # Install failures without a resolver diagnosis may be transient
+    # (network, index outage), as may timeouts on a loaded machine, so only
+    # deterministic outcomes are stored.
+    if cache is not None and fingerprint and (
+            (result["installed"] and not result.get("timed_out")) or result["conflicts"]):
+        key = cache.make_key(fingerprint, type(adapter).__name__, adapter.package_name, version, test_command)
+        cache.put(key, type(adapter).__name__, adapter.package_name, version, result)
+
+def probe_version(adapter, version: str, test_command: str,
+                  cache: Optional[ResultCache] = None, fingerprint: Optional[str] = None,
+                  cancel: Optional[threading.Event] = None,
+                  resources: Optional[ResourcePool] = None) -> Optional[Dict]:
+    """Install and test a single version, consulting the result cache first.
+
+    Returns a dict with ``version``, ``installed``, ``passed`` and, for failed
+    installs, ``conflicts``. Returns None if ``cancel`` was set before the
+    probe finished. With ``resources`` the install holds a ``network`` slot
+    and the test run a ``cpu`` slot.
+    """
+    package = adapter.package_name
+    cached = lookup_cached(adapter, version, test_command, cache, fingerprint)
+    if cached is not None:
+        print(f"⚡ Using cached result for version {version}")
+        emit("test_result", package=package, version=version, installed=cached["installed"],
+             passed=cached["passed"], cached=True)
+        return cached
+
+    if cancel is not None and cancel.is_set():
+        return None
+    emit("probe_started", package=package, version=version)
+    with hold(resources, "network"), span("install_version", package=package, version=version):
+        installed = adapter.install_version(version)
+    emit("install_finished", package=package, version=version, installed=installed)
+    if installed:
+        if cancel is not None and cancel.is_set():
+            return None
+        with hold(resources, "cpu"), span("run_tests", package=package, version=version):
+            success, output = adapter.run_tests(test_command, cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            return None
+        result = {"version": version, "installed": True, "passed": success, "conflicts": None}
+        run = getattr(adapter, 'last_test_run', None)
+        if run is not None:
+            result["log"] = run.log_path
+            if run.timed_out:
+                result["timed_out"] = run.timed_out
+    else:
+        conflicts = None
+        if hasattr(adapter, 'get_dependency_conflicts'):
+            with span("get_dependency_conflicts", package=package, version=version):
+                conflicts = adapter.get_dependency_conflicts(version)
+        result = {"version": version, "installed": False, "passed": False, "conflicts": conflicts}
+    emit("test_result", package=package, version=version, installed=result["installed"],
+         passed=result["passed"], cached=False)
+    store_result(adapter, version, test_command, result, cache, fingerprint)
+    return result
+
+class Prober:
+    """Runs and remembers probes of one package for a search strategy."""
+
+    def __init__(self, adapter, test_command: str, cache: Optional[ResultCache] = None,
+                 fingerprint: Optional[str] = None, resources: Optional[ResourcePool] = None):
+        self.adapter = adapter
+        self.test_command = test_command
+        self.cache = cache
+        self.fingerprint = fingerprint
+        self.resources = resources
+        self.scheme = getattr(adapter, 'version_scheme', 'pep440')
+        self.results: Dict[str, Dict] = {}
+        self.probes = 0
+        self.cache_hits = 0
+
+    def __call__(self, version: str) -> Dict:
+        """Probe a version once, reporting the outcome."""
+        if version in self.results:
+            return self.results[version]
+        print(f"\nTesting version {version}...")
+        result = probe_version(self.adapter, version, self.test_command,
+                               cache=self.cache, fingerprint=self.fingerprint,
+                               resources=self.resources)
+        self.probes += 1
+        if result.get("cached"):
+            self.cache_hits += 1
+
+        if result["installed"]:
+            if result["passed"]:
+                print(f"✅ Version {version} works!")
+            elif result.get("timed_out"):
+                print(f"⏰ Version {version} timed out ({result['timed_out']} timeout)")
+            else:
+                print(f"❌ Version {version} failed!")
+        else:
+            print(f"❌ Failed to install version {version}")
+            if result["conflicts"]:
+                print("\n🔍 Dependency conflicts detected:")
+                for package, issues in result["conflicts"].items():
+                    print(f"  - {package}:")
+                    for issue in issues:
+                        print(f"    {issue}")
+
+        self.results[version] = result
+        return result
+
+    def works(self, version: str) -> bool:
+        result = self(version)
+        return result["installed"] and result["passed"]
+
+    def known(self, version: str) -> Optional[Dict]:
+        """A result already available for version, from this run or the cache."""
+        if version in self.results:
+            return self.results[version]
+        return lookup_cached(self.adapter, version, self.test_command, self.cache, self.fingerprint)
+
+    def prefetch(self, versions: List[str]):
+        if versions and hasattr(self.adapter, 'prefetch'):
+            self.adapter.prefetch(versions)
@@ -0,0 +1,142 @@
+import platform
+import re
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import Parser
+from typing import Dict, List, Optional, Tuple
+import requests
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.specifiers import InvalidSpecifier, SpecifierSet
+from packaging.version import InvalidVersion, Version
+from metadata import MetadataClient, normalize_python_name, version_from_filename
+
+def parse_pinned_requirements(file_path: str) -> Dict[str, str]:
+    """Return the ``name==version`` pins of a requirements file, keyed by normalized name."""
+    pins = {}
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                match = re.match(r'^([A-Za-z0-9][A-Za-z0-9._-]*)(\[[^\]]*\])?\s*==\s*([^\s;,]+)', line)
+                if match:
+                    pins[normalize_python_name(match.group(1))] = match.group(3)
+    except FileNotFoundError:
+        pass
+    return pins
+
+def _parse_requires_dist(metadata_text: str) -> List[str]:
+    message = Parser().parsestr(metadata_text, headersonly=True)
+    return message.get_all("Requires-Dist") or []
+
+class StaticPruner:
+    """Drops versions that cannot install, using registry metadata only.
+
+    A version is pruned when none of its files accept the running
+    interpreter, when every file is yanked, when its own requirements
+    exclude one of the project's pins, or when a pinned package requires a
+    range of the target that does not include it. The reasons are reported
+    in the same ``{package: [issue, ...]}`` shape as pip's resolver
+    conflicts.
+    """
+
+    def __init__(self, client: MetadataClient, pins: Dict[str, str]):
+        self.client = client
+        self.pins = pins
+        self.python_version = platform.python_version()
+        self.environment = {"extra": ""}
+
+    def _requires_dist(self, package: str, version: str, files: Optional[List[Dict]] = None) -> Optional[List[str]]:
+        """Declared requirements of package==version, or None if unknown."""
+        try:
+            for file in files or []:
+                if file.get("core-metadata"):
+                    url = file["url"].split("#", 1)[0] + ".metadata"
+                    body = self.client.fetch(url, "text/plain", immutable=True)
+                    if body is not None:
+                        return _parse_requires_dist(body)
+            document = self.client.fetch_json(self.client.pypi_release_url(package, version), immutable=True)
+        except (requests.RequestException, ValueError):
+            return None
+        if document is None:
+            return None
+        return document.get("info", {}).get("requires_dist") or []
+
+    def _applies(self, requirement: Requirement) -> bool:
+        return requirement.marker is None or requirement.marker.evaluate(self.environment)
+
+    def _reverse_constraints(self, target: str) -> Dict[str, List[Requirement]]:
+        """Requirements on target declared by the project's other pinned packages."""
+        constraints = {}
+        for name, pinned in self.pins.items():
+            if name == target:
+                continue
+            for line in self._requires_dist(name, pinned) or []:
+                try:
+                    requirement = Requirement(line)
+                except InvalidRequirement:
+                    continue
+                if normalize_python_name(requirement.name) == target and self._applies(requirement):
+                    constraints.setdefault(f"{name}=={pinned}", []).append(requirement)
+        return constraints
+
+    def prune(self, package: str, versions: List[str]) -> Tuple[List[str], Dict[str, Dict[str, List[str]]]]:
+        """Split versions into (installable, {pruned_version: conflicts})."""
+        target = normalize_python_name(package)
+        project = self.client.pypi_project(package) or {"files": []}
+        files_by_version: Dict[str, List[Dict]] = {}
+        for file in project.get("files", []):
+            files_by_version.setdefault(version_from_filename(file["filename"]), []).append(file)
+
+        pruned: Dict[str, Dict[str, List[str]]] = {}
+
+        for version in versions:
+            files = files_by_version.get(version, [])
+            if files and all(file.get("yanked") for file in files):
+                pruned[version] = {package: [f"{version} has been yanked"]}
+                continue
+            accepted = []
+            for file in files:
+                try:
+                    accepted.append(SpecifierSet(file.get("requires-python") or "").contains(
+                        self.python_version, prereleases=True))
+                except InvalidSpecifier:
+                    accepted.append(True)
+            if files and not any(accepted):
+                spec = files[0].get("requires-python")
+                pruned[version] = {"python": [f"requires python{spec} but you have python {self.python_version}"]}
+
+        for owner, requirements in self._reverse_constraints(target).items():
+            for version in versions:
+                if version in pruned:
+                    continue
+                for requirement in requirements:
+                    try:
+                        ok = requirement.specifier.contains(Version(version), prereleases=True)
+                    except InvalidVersion:
+                        ok = True
+                    if not ok:
+                        pruned.setdefault(version, {}).setdefault(owner, []).append(
+                            f"requires {target}{requirement.specifier}, which excludes {target} {version}")
+
+        if self.pins:
+            candidates = [v for v in versions if v not in pruned]
+            with ThreadPoolExecutor(max_workers=self.client.max_workers) as pool:
+                requires = list(pool.map(
+                    lambda v: self._requires_dist(package, v, files_by_version.get(v)), candidates))
+            for version, lines in zip(candidates, requires):
+                for line in lines or []:
+                    try:
+                        requirement = Requirement(line)
+                    except InvalidRequirement:
+                        continue
+                    name = normalize_python_name(requirement.name)
+                    if name not in self.pins or not self._applies(requirement):
+                        continue
+                    try:
+                        ok = requirement.specifier.contains(Version(self.pins[name]), prereleases=True)
+                    except InvalidVersion:
+                        ok = True
+                    if not ok:
+                        pruned.setdefault(version, {}).setdefault(f"{target}=={version}", []).append(
+                            f"requires {name}{requirement.specifier} but you have {name} {self.pins[name]}")
+
+        return [v for v in versions if v not in pruned], pruned
@@ -0,0 +1,203 @@
+import gzip
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Pattern
+from cache import default_cache_dir
+
+# Lines that mean at least one test has already failed, per test tool.
+FAILURE_PATTERNS = {
+    # pytest only reports failures at the end unless run with -v; -x covers the rest
+    "pytest": [r"^\S+::\S+ (FAILED|ERROR)\b"],
+    # TAP failures that are not TODO/SKIP directives, jest's per-file FAIL header
+    # and mocha's summary; plain numbered or ticked lines are ordinary output
+    "npm": [r"^not ok \d+\b(?!.*#\s*(?i:todo|skip)\b)", r"^FAIL\s+\S+\.[cm]?[jt]sx?\b",
+            r"^\s+\d+ failing$"],
+    "cargo": [r"^test .+ \.\.\. FAILED$"],
+}
+
+DEFAULT_WALL_TIMEOUT = 3600
+DEFAULT_IDLE_TIMEOUT = 600
+DEFAULT_TAIL_LINES = 200
+DEFAULT_KEEP_LOGS = 200
+
+class TestRun:
+    """Outcome of one test command."""
+
+    def __init__(self, returncode: Optional[int], output: str, log_path: Optional[str],
+                 duration: float, timed_out: Optional[str] = None, failed_early: bool = False,
+                 cancelled: bool = False):
+        self.returncode = returncode
+        self.output = output
+        self.log_path = log_path
+        self.duration = duration
+        self.timed_out = timed_out  # "wall" or "idle"
+        self.failed_early = failed_early
+        self.cancelled = cancelled
+
+    @property
+    def passed(self) -> bool:
+        return self.returncode == 0 and not (self.timed_out or self.failed_early or self.cancelled)
+
+class TestRunner:
+    """Runs test commands with streamed, bounded output capture.
+
+    Output (stdout and stderr combined) is kept as a ring buffer of the last
+    ``tail_lines`` lines and written in full to a gzip log. A run is killed,
+    with its whole process group, when it exceeds ``wall_timeout``, prints
+    nothing for ``idle_timeout`` seconds, is cancelled, or - with
+    ``fail_fast`` - prints a line matching one of the failure patterns.
+    """
+
+    def __init__(self, wall_timeout: Optional[float] = DEFAULT_WALL_TIMEOUT,
+                 idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT, fail_fast: bool = True,
+                 tail_lines: int = DEFAULT_TAIL_LINES, log_dir: Optional[str] = None,
+                 keep_logs: int = DEFAULT_KEEP_LOGS, fork_server: bool = False):
+        self.wall_timeout = wall_timeout or None
+        self.idle_timeout = idle_timeout or None
+        self.fail_fast = fail_fast
+        self.tail_lines = tail_lines
+        self.log_dir = log_dir or os.path.join(default_cache_dir(), "logs")
+        self.keep_logs = keep_logs
+        # Adapters that support it start tests from a pre-warmed zygote
+        self.fork_server = fork_server
+
+    def _new_log_path(self, label: str) -> str:
+        os.makedirs(self.log_dir, exist_ok=True)
+        safe = re.sub(r"[^A-Za-z0-9._-]+", "_", label)[:80]
+        return os.path.join(self.log_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}-{uuid.uuid4().hex[:6]}.log.gz")
+
+    def _prune_logs(self):
+        try:
+            logs = sorted(entry.path for entry in os.scandir(self.log_dir) if entry.name.endswith(".log.gz"))
+        except FileNotFoundError:
+            return
+        for path in logs[:-self.keep_logs]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _kill(process: subprocess.Popen):
+        """Terminate the process group, escalating to SIGKILL after a grace period."""
+        if sys.platform == "win32":
+            process.kill()
+            return
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=5)
+        except (ProcessLookupError, PermissionError):
+            return
+        except subprocess.TimeoutExpired:
+            pass
+        # Children that ignored SIGTERM or outlived the leader go too
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def run(self, argv: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+            label: str = "tests", failure_patterns: Optional[List[str]] = None,
+            cancel: Optional[threading.Event] = None) -> TestRun:
+        start = time.monotonic()
+        log_path = self._new_log_path(label)
+        patterns: List[Pattern] = [re.compile(p) for p in failure_patterns or []] if self.fail_fast else []
+        tail: deque = deque(maxlen=self.tail_lines)
+        state = {"last_output": start, "failed": False}
+        finished = threading.Event()
+
+        kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if sys.platform == "win32" \
+            else {"start_new_session": True}
+        try:
+            process = subprocess.Popen(argv, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+        except OSError as e:
+            return TestRun(None, str(e), None, 0.0)
+
+        def pump():
+            partial = ""
+            with gzip.open(log_path, "wb") as log:
+                while True:
+                    chunk = process.stdout.read1(65536)
+                    if not chunk:
+                        break
+                    log.write(chunk)
+                    state["last_output"] = time.monotonic()
+                    lines = (partial + chunk.decode("utf-8", "replace")).split("\n")
+                    partial = lines.pop()
+                    for line in lines:
+                        line = line.rstrip("\r")
+                        tail.append(line)
+                        if patterns and not state["failed"] and any(p.search(line) for p in patterns):
+                            state["failed"] = True
+                            finished.set()
+                if partial:
+                    tail.append(partial)
+            finished.set()
+
+        reader = threading.Thread(target=pump, daemon=True)
+        reader.start()
+
+        timed_out = None
+        cancelled = False
+        while not finished.wait(0.2):
+            now = time.monotonic()
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+            elif self.wall_timeout and now - start > self.wall_timeout:
+                timed_out = "wall"
+            elif self.idle_timeout and now - state["last_output"] > self.idle_timeout:
+                timed_out = "idle"
+            elif process.poll() is None:
+                continue
+            break
+
+        failed_early = state["failed"]
+        if timed_out or cancelled or failed_early:
+            self._kill(process)
+        else:
+            # The pipe stays open while any process of the group lives;
+            # background helpers left behind by the suite are killed.
+            reader.join(timeout=1)
+            if reader.is_alive():
+                self._kill(process)
+        reader.join(timeout=10)
+        try:
+            returncode = process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._kill(process)
+            returncode = process.wait()
+
+        if timed_out:
+            limit = self.wall_timeout if timed_out == "wall" else self.idle_timeout
+            tail.append(f"[dtm] killed after {'running for' if timed_out == 'wall' else 'no output for'} {limit:g}s")
+        elif failed_early:
+            tail.append("[dtm] stopped at the first test failure")
+        self._prune_logs()
+        return TestRun(returncode, "\n".join(tail), log_path, round(time.monotonic() - start, 3),
+                       timed_out=timed_out, failed_early=failed_early, cancelled=cancelled)
+
+_runner: Optional[TestRunner] = None
+_runner_lock = threading.Lock()
+
+def configure_test_runner(**options) -> TestRunner:
+    """Replace the process-wide test runner, e.g. with command line timeouts."""
+    global _runner
+    with _runner_lock:
+        _runner = TestRunner(**options)
+        return _runner
+
+def get_test_runner() -> TestRunner:
+    """Return the process-wide test runner shared by all adapters."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = TestRunner()
+        return _runner
@@ -0,0 +1,108 @@
+import contextvars
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Per-adapter caps on concurrent analyses. Cargo builds serialize on its package
+# cache lock and share target directories per toolchain, so a second Rust
+# analysis would only wait on cargo while holding cpu slots.
+DEFAULT_ADAPTER_LIMITS: Dict[str, int] = {"rust": 1}
+
+class ResourcePool:
+    """Named counting semaphores shared by every analysis in the process.
+
+    ``cpu`` bounds concurrent test runs and ``network`` concurrent installs.
+    Unknown names are unlimited.
+    """
+
+    def __init__(self, limits: Dict[str, int]):
+        self.limits = dict(limits)
+        self._semaphores = {name: threading.BoundedSemaphore(count) for name, count in limits.items()}
+
+    @contextmanager
+    def hold(self, name: str) -> Iterator[None]:
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+def hold(resources: Optional[ResourcePool], name: str):
+    """Hold a resource slot, or do nothing when no pool is in use."""
+    return resources.hold(name) if resources is not None else nullcontext()
+
+def default_resources(cpu_slots: Optional[int] = None, network_slots: int = 4) -> ResourcePool:
+    return ResourcePool({"cpu": cpu_slots or os.cpu_count() or 1, "network": network_slots})
+
+class Job:
+    """One package analysis waiting to run."""
+
+    def __init__(self, language: str, package: str, priority: Tuple = (), project: str = "."):
+        self.language = language
+        self.package = package
+        self.priority = priority
+        # Directory whose environment the package is probed in
+        self.project = project
+
+    @property
+    def key(self) -> str:
+        """Name of the job's result: the package, qualified by its project unless that is the root."""
+        return self.package if self.project == "." else f"{self.package} ({self.project})"
+
+class AnalysisScheduler:
+    """Runs package analyses concurrently across languages.
+
+    Jobs start in priority order (lowest tuple first), at most ``max_jobs``
+    at once and at most ``adapter_limits[language]`` per language. A job
+    whose language is at its cap is skipped in favour of the next one that
+    can start, rather than blocking a worker.
+    """
+
+    def __init__(self, max_jobs: int = 1, adapter_limits: Optional[Dict[str, int]] = None):
+        self.max_jobs = max(1, max_jobs)
+        self.adapter_limits = DEFAULT_ADAPTER_LIMITS if adapter_limits is None else adapter_limits
+
+    def run(self, jobs: List[Job], analyze: Callable[[Job], Dict],
+            on_result: Optional[Callable[[Job, Dict], None]] = None) -> Dict[str, Dict]:
+        pending = sorted(jobs, key=lambda job: job.priority)
+        running: Dict[str, int] = {}
+        results: Dict[str, Dict] = {}
+        condition = threading.Condition()
+
+        def next_job() -> Optional[Job]:
+            with condition:
+                while pending:
+                    for i, job in enumerate(pending):
+                        limit = self.adapter_limits.get(job.language)
+                        if limit is None or running.get(job.language, 0) < limit:
+                            running[job.language] = running.get(job.language, 0) + 1
+                            return pending.pop(i)
+                    condition.wait()
+                return None
+
+        def worker():
+            while True:
+                job = next_job()
+                if job is None:
+                    return
+                try:
+                    result = analyze(job)
+                except Exception as e:
+                    result = {"package": job.package, "status": "error", "message": str(e)}
+                with condition:
+                    running[job.language] -= 1
+                    results[job.key] = result
+                    condition.notify_all()
+                if on_result is not None:
+                    on_result(job, result)
+
+        # Each worker runs in a copy of the caller's context so its events keep the caller's scope
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(worker,), daemon=True)
+                   for _ in range(min(self.max_jobs, len(pending)) or 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
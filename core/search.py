@@ -0,0 +1,144 @@
+from typing import Dict, List, Optional, Tuple
+from instrument import span
+from probe import Prober
+from versions import release_prefix
+
+class SearchStrategy:
+    """Base class for strategies that locate the working/broken boundary.
+
+    Strategies assume versions work up to a boundary and fail after it.
+    With ``verify_boundary`` the versions on both sides of the reported
+    boundary, and the newest version, are probed as well; if a later
+    version turns out to work again the search moves above the boundary.
+    """
+
+    name = "base"
+
+    def __init__(self, verify_boundary: bool = False):
+        self.verify_boundary = verify_boundary
+
+    def locate(self, versions: List[str], indices: List[int], prober: Prober) -> Tuple[Optional[int], Optional[int]]:
+        """Return (latest_working, first_broken) positions among indices."""
+        raise NotImplementedError
+
+    def _pick(self, versions: List[str], indices: List[int], left: int, right: int, prober: Prober) -> int:
+        """Midpoint of indices[left..right], nudged to a nearby already-known result."""
+        mid = (left + right) // 2
+        reach = (right - left) // 4
+        for offset in range(1, reach + 1):
+            for candidate in (mid - offset, mid + offset):
+                if prober.known(versions[indices[candidate]]) is not None:
+                    return candidate
+        return mid
+
+    def _bisect(self, versions: List[str], indices: List[int], prober: Prober) -> Tuple[Optional[int], Optional[int]]:
+        left, right = 0, len(indices) - 1
+        latest_working = first_broken = None
+        while left <= right:
+            mid = self._pick(versions, indices, left, right, prober)
+            # Whichever way this probe goes, the next one is one of these
+            prober.prefetch([versions[indices[i]] for i in ((left + mid - 1) // 2, (mid + 1 + right) // 2)
+                             if left <= i <= right and i != mid])
+            with span("search_iteration", strategy=self.name, version=versions[indices[mid]],
+                      remaining=right - left + 1) as attrs:
+                attrs["works"] = prober.works(versions[indices[mid]])
+            if attrs["works"]:
+                latest_working = indices[mid]
+                left = mid + 1
+            else:
+                first_broken = indices[mid]
+                right = mid - 1
+        return latest_working, first_broken
+
+    def search(self, versions: List[str], prober: Prober) -> Tuple[Optional[str], Optional[str], Optional[Dict], Dict]:
+        """Run the strategy, returning (latest_working, first_broken, conflicts, extra stats)."""
+        extra = {}
+        latest_working, first_broken = self.locate(versions, list(range(len(versions))), prober)
+
+        if self.verify_boundary:
+            non_monotonic = False
+            if latest_working is not None and latest_working > 0 and not prober.works(versions[latest_working - 1]):
+                non_monotonic = True
+            if first_broken is not None:
+                # A later release may have fixed the breakage; prefer the
+                # newest working version if there is one.
+                last = len(versions) - 1
+                if last > first_broken and prober.works(versions[last]):
+                    non_monotonic = True
+                    latest_working, first_broken = last, None
+                elif last > first_broken + 1 and prober.works(versions[first_broken + 1]):
+                    non_monotonic = True
+                    above = list(range(first_broken + 1, len(versions)))
+                    latest_working, first_broken = self.locate(versions, above, prober)
+            extra["non_monotonic"] = non_monotonic
+
+        # Like the original serial search, report the conflicts of the
+        # lowest failed install at or above the boundary.
+        conflicts = None
+        if first_broken is not None:
+            for version in versions[first_broken:]:
+                result = prober.results.get(version)
+                if result and not result["installed"] and result["conflicts"]:
+                    conflicts = result["conflicts"]
+                    break
+
+        return (versions[latest_working] if latest_working is not None else None,
+                versions[first_broken] if first_broken is not None else None,
+                conflicts, extra)
+
+class BisectStrategy(SearchStrategy):
+    """Plain binary search over the sorted version list."""
+
+    name = "bisect"
+
+    def locate(self, versions, indices, prober):
+        return self._bisect(versions, indices, prober)
+
+class HierarchicalStrategy(SearchStrategy):
+    """Coarse-to-fine search: majors first, then minors, then patches.
+
+    At each level the latest release of every group stands in for the whole
+    group. Bisecting those representatives finds the first group that
+    breaks, and the search descends into that group only.
+    """
+
+    name = "hierarchical"
+
+    def locate(self, versions, indices, prober):
+        return self._locate_level(versions, indices, prober, level=1)
+
+    def _locate_level(self, versions, indices, prober, level: int):
+        if level > 2 or len(indices) <= 2:
+            return self._bisect(versions, indices, prober)
+
+        groups: List[List[int]] = []
+        for index in indices:
+            prefix = release_prefix(versions[index], prober.scheme, level)
+            if groups and release_prefix(versions[groups[-1][-1]], prober.scheme, level) == prefix:
+                groups[-1].append(index)
+            else:
+                groups.append([index])
+        if len(groups) == 1:
+            return self._locate_level(versions, indices, prober, level + 1)
+
+        representatives = [group[-1] for group in groups]
+        last_ok, first_fail = self._bisect(versions, representatives, prober)
+        if first_fail is None:
+            return last_ok, None
+
+        failing_group = groups[representatives.index(first_fail)]
+        inner_working, inner_broken = self._locate_level(versions, failing_group[:-1], prober, level + 1)
+        latest_working = inner_working if inner_working is not None else last_ok
+        first_broken = inner_broken if inner_broken is not None else first_fail
+        return latest_working, first_broken
+
+STRATEGIES = {
+    BisectStrategy.name: BisectStrategy,
+    HierarchicalStrategy.name: HierarchicalStrategy,
+}
+
+def make_strategy(name: str = "bisect", verify_boundary: bool = False) -> SearchStrategy:
+    """Build a search strategy by name."""
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown search strategy {name!r}; choose from {', '.join(STRATEGIES)}")
+    return STRATEGIES[name](verify_boundary=verify_boundary)
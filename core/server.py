@@ -0,0 +1,350 @@
+import argparse
+import itertools
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from cache import ResultCache, project_fingerprint, project_scoped_fingerprint
+from events import emit, event_scope, subscribe, unsubscribe
+from forkserver import stop_all as stop_all_fork_servers
+from manifests import current_version, get_manifest_index
+from runner import configure_test_runner
+from scheduler import Job, default_resources
+from search import make_strategy
+from state import AnalysisState
+from instrument import enable_tracing, get_tracer
+import main as core
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# Implementation-defined server errors take -32000 to -32099
+RUNNER_BUSY = -32000
+
+def default_socket_path(root: str = ".") -> str:
+    """Where a project's daemon listens: ``.dtm/daemon.sock`` in the project root."""
+    return os.path.join(os.path.abspath(root), ".dtm", "daemon.sock")
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+class CoreService:
+    """The state a daemon keeps warm between requests, and its RPC methods.
+
+    Metadata, environments and wheels are process-wide already; the service
+    adds the result cache and the latest analysis of every package, per
+    project it was probed in, so that ``upgrade`` can answer from a finished
+    ``analyze`` without probing again.
+    """
+
+    def __init__(self):
+        self.cache = ResultCache()
+        self.state = AnalysisState()
+        self.analyses: Dict[Tuple[str, str, str], Tuple[str, Tuple, Dict]] = {}
+        self.busy = 0
+        # The test runner is process-wide: requests share it while their options agree
+        self._runner_options: Optional[Tuple] = None
+        self._runner_users = 0
+        self.last_activity = time.monotonic()
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.methods: Dict[str, Callable[[Dict], object]] = {
+            "ping": self.ping,
+            "analyze": self.analyze,
+            "upgrade": self.upgrade,
+            "results": self.results,
+            "shutdown": self.shutdown,
+        }
+
+    def _options(self, command: str, params: Dict) -> argparse.Namespace:
+        """The parsed CLI defaults for command, overridden by request params."""
+        args = core.build_parser().parse_args([command] + (["-"] if command == "upgrade" else []))
+        for key, value in params.items():
+            name = key.replace("-", "_")
+            if name in ("command", "package") or not hasattr(args, name):
+                raise RpcError(INVALID_PARAMS, f"Unknown parameter {key!r} for {command}")
+            setattr(args, name, value)
+        return args
+
+    def _context(self, args: argparse.Namespace):
+        try:
+            strategy = make_strategy(args.strategy, verify_boundary=args.verify_boundary)
+        except ValueError as e:
+            raise RpcError(INVALID_PARAMS, str(e))
+        if args.trace:
+            enable_tracing()
+        if args.no_cache:
+            return strategy, None, None
+        if args.clear_cache:
+            self.cache.clear()
+        return strategy, self.cache, project_fingerprint()
+
+    @contextmanager
+    def _test_runner(self, args: argparse.Namespace):
+        """Configure the shared test runner for a request, or refuse if a running request needs other options."""
+        options = (args.test_timeout, args.test_idle_timeout, not args.no_fail_fast, args.fork_server)
+        with self._lock:
+            if options != self._runner_options:
+                if self._runner_users:
+                    raise RpcError(RUNNER_BUSY, "Another request is running with different test runner options; "
+                                                "retry when it finishes")
+                configure_test_runner(wall_timeout=options[0], idle_timeout=options[1],
+                                      fail_fast=options[2], fork_server=options[3])
+                self._runner_options = options
+            self._runner_users += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._runner_users -= 1
+
+    @staticmethod
+    def _options_key(args: argparse.Namespace) -> Tuple:
+        # Options that can change the answer, not just how fast it comes
+        return (args.strategy, args.verify_boundary, args.include_prereleases,
+                args.bench, args.samples, args.latency_threshold, args.memory_threshold)
+
+    def _store(self, language: str, package: str, project: str, fingerprint: Optional[str],
+               args: argparse.Namespace, result: Dict):
+        if fingerprint and result.get("status") == "success":
+            with self._lock:
+                self.analyses[(language, package, project)] = (fingerprint, self._options_key(args), result)
+
+    @staticmethod
+    def _export_trace(args: argparse.Namespace):
+        # Spans of requests running at the same time end up in each other's traces
+        if args.trace:
+            get_tracer().export(args.trace)
+
+    def ping(self, params: Dict) -> Dict:
+        return {"pid": os.getpid(), "cwd": os.getcwd()}
+
+    def analyze(self, params: Dict) -> Dict:
+        args = self._options("analyze", params)
+        strategy, cache, fingerprint = self._context(args)
+        try:
+            with self._test_runner(args):
+                return core.analyze_project(
+                    args, cache=cache, fingerprint=fingerprint, strategy=strategy,
+                    on_result=lambda job, result: self._store(job.language, job.package, job.project,
+                                                              fingerprint, args, result),
+                    state=None if args.full else self.state)
+        finally:
+            self._export_trace(args)
+
+    def upgrade(self, params: Dict) -> Dict:
+        params = dict(params)
+        package = params.pop("package", None)
+        if not isinstance(package, str) or not package:
+            raise RpcError(INVALID_PARAMS, "upgrade needs a 'package'")
+        language = params.pop("language", None)
+        # The sub-project whose environment the package is probed in, as analyze --recursive reports it
+        project = os.path.normpath(params.pop("project", None) or ".")
+        reuse = params.pop("reuse", True)
+        args = self._options("upgrade", params)
+        strategy, cache, fingerprint = self._context(args)
+        fingerprint = project_scoped_fingerprint(fingerprint, project)
+
+        with self._lock:
+            if language is None:
+                language = next((lang for lang, name, where in self.analyses
+                                 if (name, where) == (package, project)), None)
+            stored = self.analyses.get((language, package, project))
+        if reuse and stored and stored[0] == fingerprint and stored[1] == self._options_key(args):
+            emit("result_reused", package=package, language=language, project=project)
+            return stored[2]
+
+        language = language or core.detect_language(project)
+        state = None if args.full else self.state
+        current = None
+        if project != ".":
+            if state is not None:
+                state = AnalysisState(os.path.join(os.path.abspath(project), ".dtm", "analysis-state.json"))
+            uses = get_manifest_index().environments().get(language, {}).get(package, {}).get(project)
+            current = current_version(language, uses) if uses else None
+        with self._test_runner(args):
+            result = core.analyze_package(package, language, cache=cache, fingerprint=fingerprint,
+                                          workers=args.workers, strategy=strategy,
+                                          include_prereleases=args.include_prereleases,
+                                          resources=default_resources(args.cpu_slots, args.network_slots),
+                                          select_tests=not args.no_test_selection, state=state,
+                                          root=project, current=current, **core.benchmark_options(args))
+        self._store(language, package, project, fingerprint, args, result)
+        self._export_trace(args)
+        return result
+
+    def results(self, params: Dict) -> Dict:
+        """Every stored analysis, keyed like ``analyze`` keys them: by package, qualified by its project."""
+        with self._lock:
+            return {Job(language, package, project=project).key: result
+                    for (language, package, project), (_, _, result) in self.analyses.items()}
+
+    def shutdown(self, params: Dict) -> bool:
+        self.stopped.set()
+        return True
+
+    def handle(self, line: str, send: Callable[[Dict], None]):
+        """Answer one JSON-RPC 2.0 request line."""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            send({"jsonrpc": "2.0", "id": None, "error": {"code": PARSE_ERROR, "message": "Parse error"}})
+            return
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or request.get("jsonrpc") != "2.0" \
+                    or not isinstance(request.get("method"), str):
+                raise RpcError(INVALID_REQUEST, "Invalid request")
+            method = self.methods.get(request["method"])
+            if method is None:
+                raise RpcError(METHOD_NOT_FOUND, f"Unknown method {request['method']!r}")
+            params = request.get("params", {})
+            if not isinstance(params, dict):
+                raise RpcError(INVALID_PARAMS, "params must be an object")
+            with self._lock:
+                self.busy += 1
+            try:
+                response = {"jsonrpc": "2.0", "id": request_id, "result": method(params)}
+            finally:
+                with self._lock:
+                    self.busy -= 1
+                    self.last_activity = time.monotonic()
+        except RpcError as e:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": e.code, "message": e.message}}
+        except Exception as e:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": INTERNAL_ERROR, "message": str(e)}}
+        # Requests without an id are notifications and get no reply
+        if not isinstance(request, dict) or "id" in request:
+            send(response)
+
+class Connection:
+    """One client: requests run concurrently, progress is pushed as notifications.
+
+    Each request runs in its own event scope, so a client only hears the
+    progress of its own requests, not that of other clients of the daemon.
+    """
+
+    _requests = itertools.count()
+
+    def __init__(self, service: CoreService, write: Callable[[str], None]):
+        self.service = service
+        self._write = write
+        self._lock = threading.Lock()
+
+    def send(self, message: Dict):
+        with self._lock:
+            self._write(json.dumps(message) + "\n")
+
+    def _progress(self, event: str, fields: Dict):
+        self.send({"jsonrpc": "2.0", "method": "progress", "params": dict(fields, event=event)})
+
+    def _handle(self, line: str):
+        scope = f"request-{next(self._requests)}"
+
+        def listener(event: str, fields: Dict):
+            # One listener per request: unsubscribing it leaves the connection's other requests alone
+            self._progress(event, fields)
+
+        subscribe(listener, scope=scope)
+        try:
+            with event_scope(scope):
+                self.service.handle(line, self._safe_send)
+        finally:
+            unsubscribe(listener)
+
+    def serve(self, lines: Iterable[str]):
+        workers = []
+        for line in lines:
+            if not line.strip():
+                continue
+            worker = threading.Thread(target=self._handle, args=(line,), daemon=True)
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+
+    def _safe_send(self, message: Dict):
+        try:
+            self.send(message)
+        except (OSError, ValueError):
+            pass  # the client went away
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        def write(text: str):
+            self.wfile.write(text.encode())
+            self.wfile.flush()
+        Connection(self.server.service, write).serve(line.decode() for line in self.rfile)
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def _claim_socket(path: str):
+    """Remove a socket left behind by a dead daemon; refuse if one is alive."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A DTM daemon is already listening on {path}")
+
+def serve(socket_path: Optional[str] = None, idle_timeout: float = 900):
+    """Serve line-delimited JSON-RPC on stdin/stdout, or on a unix socket.
+
+    Human-readable progress goes to stderr so stdout carries protocol
+    messages only.
+    """
+    service = CoreService()
+    # Child processes (pip, npm, cargo) write to fd 1 directly, so the
+    # protocol gets a private copy of it and fd 1 itself becomes stderr.
+    sys.stdout.flush()
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    if socket_path is None:
+        def write(text: str):
+            protocol_out.write(text)
+            protocol_out.flush()
+        try:
+            Connection(service, write).serve(sys.stdin)
+        finally:
+            stop_all_fork_servers()
+        return
+
+    _claim_socket(socket_path)
+    server = _UnixServer(socket_path, _Handler)
+    server.service = service
+    os.chmod(socket_path, 0o600)
+
+    def watchdog():
+        while not service.stopped.wait(min(5.0, idle_timeout)):
+            if service.busy == 0 and time.monotonic() - service.last_activity > idle_timeout:
+                service.stopped.set()
+        server.shutdown()
+
+    threading.Thread(target=watchdog, daemon=True).start()
+    print(f"🛰️ DTM daemon {os.getpid()} listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        stop_all_fork_servers()
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
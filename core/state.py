@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from cache import IGNORED_DIRS, fingerprinted
+from versions import parse_version
+
+STATE_VERSION = 1
+
+# Manifests whose changes can move the boundary of a language's packages.
+LANGUAGE_MANIFESTS = {
+    "python": ["requirements.txt", "setup.py", "setup.cfg", "pyproject.toml", "poetry.lock", "Pipfile", "Pipfile.lock"],
+    "js": ["package.json", "package-lock.json", "yarn.lock", "pnpm-lock.yaml"],
+    "rust": ["Cargo.toml", "Cargo.lock"],
+}
+
+def usage_signature(language: str, files: List[str], test_command: str, root: str = ".") -> str:
+    """Hash of everything that decides how a package is used.
+
+    That is the project files that reach the package, the language's
+    manifests and the test command.
+    """
+    digest = hashlib.sha256(test_command.encode())
+    for relative in sorted(files) + LANGUAGE_MANIFESTS.get(language, []):
+        digest.update(b"\0" + relative.encode() + b"\0")
+        try:
+            with open(os.path.join(root, relative), "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"<missing>")
+    return digest.hexdigest()
+
+def incremental_candidates(record: Dict, versions: List[str],
+                           scheme: str) -> Optional[Tuple[List[str], List[str]]]:
+    """Versions that still need probing given a previous analysis, oldest first.
+
+    Returns the versions that appeared since that analysis between its
+    latest working and first broken version, which can move the boundary,
+    and those above the first broken one, which only matter if one of them
+    fixed the breakage. Both are empty when nothing needs probing. Returns
+    None when the previous result cannot be reused because its boundary
+    versions are gone from the registry.
+    """
+    latest_working, first_broken = record.get("latest_working"), record.get("first_broken")
+    if any(v is not None and v not in versions for v in (latest_working, first_broken)):
+        return None
+    seen = set(record.get("versions", []))
+    low = parse_version(latest_working, scheme) if latest_working else None
+    high = parse_version(first_broken, scheme) if first_broken else None
+    between, above = [], []
+    for version in versions:
+        if version in seen:
+            continue
+        parsed = parse_version(version, scheme)
+        if parsed is None or (low is not None and parsed <= low):
+            continue
+        (above if high is not None and parsed >= high else between).append(version)
+    return between, above
+
+class AnalysisState:
+    """Per-package results of earlier analyses, kept in ``.dtm/analysis-state.json``.
+
+    Each record holds the versions seen, the working/broken boundary with
+    its full result, the project fingerprint, the usage signature and the
+    options that produced it.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(os.path.abspath("."), ".dtm", "analysis-state.json")
+        self._lock = threading.Lock()
+        self.packages: Dict[str, Dict] = {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == STATE_VERSION:
+                self.packages = data.get("packages", {})
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _key(language: str, package: str) -> str:
+        return f"{language}:{package}"
+
+    def get(self, language: str, package: str, usage: str, options: List) -> Optional[Dict]:
+        """The stored record, if it was made with the same usage and options."""
+        with self._lock:
+            record = self.packages.get(self._key(language, package))
+        if record and record.get("usage") == usage and record.get("options") == list(options):
+            return record
+        return None
+
+    def put(self, language: str, package: str, versions: List[str], result: Dict,
+            fingerprint: Optional[str], usage: str, options: List):
+        if result.get("status") != "success":
+            return
+        record = {
+            "versions": versions,
+            "latest_working": result.get("latest_working"),
+            "first_broken": result.get("first_broken"),
+            "result": result,
+            "fingerprint": fingerprint,
+            "usage": usage,
+            "options": list(options),
+            "updated": time.time(),
+        }
+        with self._lock:
+            self.packages[self._key(language, package)] = record
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, "w") as f:
+                json.dump({"version": STATE_VERSION, "packages": self.packages}, f)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"Could not save analysis state: {e}")
+
+def snapshot(root: str = ".") -> Dict[str, Tuple[int, int]]:
+    """(mtime, size) of every file in the project fingerprint, for cheap change polling."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if fingerprinted(os.path.relpath(path, root)):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[os.path.relpath(path, root)] = (stat.st_mtime_ns, stat.st_size)
+    return files
@@ -0,0 +1,85 @@
+import functools
+import re
+from typing import List, Optional, Tuple, Union
+from packaging.version import InvalidVersion, Version
+
+SEMVER_PATTERN = re.compile(
+    r"^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$"
+)
+
+@functools.total_ordering
+class SemVer:
+    """A semantic version as used by npm and Cargo.
+
+    Exposes the same ``release``, ``major``, ``minor``, ``micro`` and
+    ``is_prerelease`` attributes as ``packaging.version.Version`` so the
+    search strategies can treat both schemes alike.
+    """
+
+    def __init__(self, text: str):
+        match = SEMVER_PATTERN.match(text.strip())
+        if not match:
+            raise ValueError(f"Invalid semantic version: {text!r}")
+        self.text = text
+        self.release = tuple(int(part or 0) for part in match.group(1, 2, 3))
+        self.pre = tuple(match.group(4).split(".")) if match.group(4) else ()
+
+    @property
+    def major(self) -> int:
+        return self.release[0]
+
+    @property
+    def minor(self) -> int:
+        return self.release[1]
+
+    @property
+    def micro(self) -> int:
+        return self.release[2]
+
+    @property
+    def is_prerelease(self) -> bool:
+        return bool(self.pre)
+
+    def _key(self):
+        # A release sorts after all of its pre-releases; numeric identifiers
+        # sort numerically and before alphanumeric ones (semver 2.0.0, 11).
+        if not self.pre:
+            return self.release, (1,)
+        identifiers = tuple((0, int(p), "") if p.isdigit() else (1, 0, p) for p in self.pre)
+        return self.release, (0, identifiers)
+
+    def __eq__(self, other):
+        return isinstance(other, SemVer) and self._key() == other._key()
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"SemVer({self.text!r})"
+
+ParsedVersion = Union[Version, SemVer]
+
+def parse_version(text: str, scheme: str = "pep440") -> Optional[ParsedVersion]:
+    """Parse a version string, returning None if it is not valid in the scheme."""
+    try:
+        return SemVer(text) if scheme == "semver" else Version(text)
+    except (InvalidVersion, ValueError):
+        return None
+
+def sort_versions(versions: List[str], scheme: str = "pep440") -> List[str]:
+    """Sort version strings oldest first, dropping ones that cannot be parsed."""
+    parsed = [(parse_version(v, scheme), v) for v in versions]
+    return [v for p, v in sorted((item for item in parsed if item[0] is not None), key=lambda item: item[0])]
+
+def is_prerelease(text: str, scheme: str = "pep440") -> bool:
+    parsed = parse_version(text, scheme)
+    return parsed is not None and parsed.is_prerelease
+
+def release_prefix(text: str, scheme: str, length: int) -> Tuple[int, ...]:
+    """First ``length`` release components, padded with zeros (e.g. (major, minor))."""
+    parsed = parse_version(text, scheme)
+    release = tuple(parsed.release) + (0,) * length if parsed is not None else (0,) * length
+    return release[:length]
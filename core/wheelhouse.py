@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+from cache import default_cache_dir
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Wheels differ per interpreter and platform, so requirement sets are keyed by both.
+PLATFORM_TAG = f"{sys.implementation.cache_tag}-{sys.platform}"
+
+def _normalize(package: str) -> str:
+    """Normalize a project name as PEP 503 does."""
+    return re.sub(r"[-_.]+", "-", package).lower()
+
+class Wheelhouse:
+    """Persistent, content-addressed store of wheels shared across runs.
+
+    Wheels are stored once under ``blobs/`` by SHA-256 and hardlinked into
+    ``links/`` under their real filename, which is what pip's
+    ``--find-links`` reads. For every ``package==version`` the set of wheels
+    needed to install it is recorded, so a complete set can be installed
+    with ``--no-index``.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root or os.path.join(default_cache_dir(), "wheelhouse")
+        self.blobs_dir = os.path.join(self.root, "blobs")
+        self.links_dir = os.path.join(self.root, "links")
+        self.max_bytes = max_bytes
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.links_dir, exist_ok=True)
+        self.db_path = os.path.join(self.root, "index.sqlite3")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS wheels (
+                    filename TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sets (
+                    package TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    platform TEXT NOT NULL,
+                    filenames TEXT NOT NULL,
+                    PRIMARY KEY (package, version, platform)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def add_set(self, package: str, version: str, wheel_paths: List[str]):
+        """Store the wheels needed to install package==version."""
+        now = time.time()
+        filenames = []
+        with self._connect() as conn:
+            for path in wheel_paths:
+                with open(path, "rb") as f:
+                    sha256 = hashlib.sha256(f.read()).hexdigest()
+                filename = os.path.basename(path)
+                blob = os.path.join(self.blobs_dir, f"{sha256}.whl")
+                staging = f".{os.getpid()}-{threading.get_ident()}.tmp"
+                if not os.path.exists(blob):
+                    shutil.copyfile(path, blob + staging)
+                    os.replace(blob + staging, blob)
+                link = os.path.join(self.links_dir, filename)
+                try:
+                    os.link(blob, link + staging)
+                except OSError:
+                    shutil.copyfile(blob, link + staging)
+                os.replace(link + staging, link)
+                conn.execute(
+                    "INSERT OR REPLACE INTO wheels VALUES (?, ?, ?, ?)",
+                    (filename, sha256, os.path.getsize(blob), now)
+                )
+                filenames.append(filename)
+            conn.execute(
+                "INSERT OR REPLACE INTO sets VALUES (?, ?, ?, ?)",
+                (_normalize(package), version, PLATFORM_TAG, json.dumps(filenames))
+            )
+        self.evict()
+
+    def lookup(self, package: str, version: str) -> Optional[List[str]]:
+        """Return the stored wheel filenames for package==version if all are present."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT filenames FROM sets WHERE package = ? AND version = ? AND platform = ?",
+                (_normalize(package), version, PLATFORM_TAG)
+            ).fetchone()
+            if row is None:
+                return None
+            filenames = json.loads(row[0])
+            if not all(os.path.exists(os.path.join(self.links_dir, name)) for name in filenames):
+                return None
+            conn.executemany(
+                "UPDATE wheels SET last_used = ? WHERE filename = ?",
+                [(time.time(), name) for name in filenames]
+            )
+        return filenames
+
+    def evict(self):
+        """Remove least recently used wheels until the store fits in max_bytes."""
+        with self._connect() as conn:
+            doomed = [row[0] for row in conn.execute("""
+                SELECT filename FROM (
+                    SELECT filename, SUM(size) OVER (ORDER BY last_used DESC) AS running
+                    FROM wheels
+                ) WHERE running > ?
+            """, (self.max_bytes,))]
+            if not doomed:
+                return
+            for filename in doomed:
+                sha256 = conn.execute("SELECT sha256 FROM wheels WHERE filename = ?", (filename,)).fetchone()[0]
+                conn.execute("DELETE FROM wheels WHERE filename = ?", (filename,))
+                link = os.path.join(self.links_dir, filename)
+                if os.path.exists(link):
+                    os.remove(link)
+                blob = os.path.join(self.blobs_dir, f"{sha256}.whl")
+                if os.path.exists(blob) and not conn.execute(
+                        "SELECT 1 FROM wheels WHERE sha256 = ?", (sha256,)).fetchone():
+                    os.remove(blob)
+            # Sets that lost a wheel can no longer be installed offline
+            for package, version, platform, filenames in conn.execute("SELECT * FROM sets").fetchall():
+                if set(json.loads(filenames)) & set(doomed):
+                    conn.execute(
+                        "DELETE FROM sets WHERE package = ? AND version = ? AND platform = ?",
+                        (package, version, platform)
+                    )
+
+class Prefetcher:
+    """Downloads and builds wheels for upcoming probes in the background.
+
+    ``index_url`` points pip at a different simple index and ``find_links``
+    at a flat directory of distributions (used without any index), which
+    lets the prefetcher run fully offline.
+    """
+
+    def __init__(self, wheelhouse: Wheelhouse, python: str = sys.executable,
+                 index_url: Optional[str] = None, find_links: Optional[str] = None, workers: int = 2):
+        self.wheelhouse = wheelhouse
+        self.python = python
+        self.index_url = index_url
+        self.find_links = find_links
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _build(self, package: str, version: str) -> bool:
+        with tempfile.TemporaryDirectory(prefix="dtm-wheels-") as tmp:
+            command = [self.python, "-m", "pip", "wheel", "--disable-pip-version-check",
+                       "--wheel-dir", tmp, f"{package}=={version}"]
+            if self.index_url:
+                command += ["--index-url", self.index_url]
+            if self.find_links:
+                command += ["--no-index", "--find-links", self.find_links]
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode != 0:
+                return False
+            wheels = [os.path.join(tmp, name) for name in os.listdir(tmp) if name.endswith(".whl")]
+            self.wheelhouse.add_set(package, version, wheels)
+            return True
+
+    def _submit(self, package: str, version: str) -> Future:
+        key = f"{_normalize(package)}=={version}"
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._build, package, version)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+            return future
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def prefetch(self, package: str, version: str):
+        """Queue package==version for download unless it is already stored."""
+        if self.wheelhouse.lookup(package, version) is None:
+            self._submit(package, version)
+
+    def available(self, package: str, version: str) -> Optional[List[str]]:
+        """Return the wheel set for package==version if it is stored or already downloading.
+
+        Unlike ``fetch`` this never starts a download, so a caller that
+        finds nothing can install straight from the index instead.
+        """
+        filenames = self.wheelhouse.lookup(package, version)
+        if filenames is not None:
+            return filenames
+        with self._lock:
+            future = self._in_flight.get(f"{_normalize(package)}=={version}")
+        if future is None or not future.result():
+            return None
+        return self.wheelhouse.lookup(package, version)
+
+    def fetch(self, package: str, version: str) -> Optional[List[str]]:
+        """Return the wheel set for package==version, joining or starting its download."""
+        filenames = self.wheelhouse.lookup(package, version)
+        if filenames is not None:
+            return filenames
+        if not self._submit(package, version).result():
+            return None
+        return self.wheelhouse.lookup(package, version)
+
+_prefetchers = {}
+_prefetchers_lock = threading.Lock()
+
+def get_prefetcher(python: str = sys.executable) -> Prefetcher:
+    """Return the process-wide prefetcher for an interpreter."""
+    with _prefetchers_lock:
+        if python not in _prefetchers:
+            _prefetchers[python] = Prefetcher(Wheelhouse(), python=python)
+        return _prefetchers[python]
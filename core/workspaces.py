@@ -0,0 +1,147 @@
+import os
+import shutil
+import uuid
+from typing import List, Optional, Set
+from cache import IGNORED_DIRS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl that makes a file share another's blocks copy-on-write (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# Files a process keeps in a cache directory while it uses it
+IN_USE_PREFIX = ".dtm-in-use-"
+# Directories still being built; named .staging-<pid>-<id>
+STAGING_PREFIX = ".staging-"
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+def copy_file(source: str, target: str):
+    """Copy source to target with its mtime, sharing blocks copy-on-write where the filesystem can."""
+    if fcntl is not None:
+        try:
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, target)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, target)
+
+def mirror_project(root: str, destination: str, rewritten: Set[str]) -> List[str]:
+    """Mirror the project at root into destination with private copies.
+
+    Copies rather than hardlinks, so a test that rewrites a file in place
+    changes the mirror and never the project. Files whose size and mtime
+    already match the project's are left alone, so build tools that compare
+    mtimes see no change. Files named in ``rewritten`` are skipped, and
+    their relative paths are returned for the caller to write. Files that
+    are gone from the project are removed; ignored directories
+    (``node_modules``, ``target``, ...) in destination are kept.
+    """
+    wanted = set()
+    skipped = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        relative_dir = os.path.relpath(dirpath, root)
+        os.makedirs(os.path.join(destination, relative_dir), exist_ok=True)
+        for name in filenames:
+            relative = os.path.normpath(os.path.join(relative_dir, name))
+            wanted.add(relative)
+            if name in rewritten:
+                skipped.append(relative)
+                continue
+            source, target = os.path.join(root, relative), os.path.join(destination, relative)
+            try:
+                a, b = os.stat(source), os.stat(target)
+                if (a.st_size, a.st_mtime_ns) == (b.st_size, b.st_mtime_ns) and not os.path.samefile(source, target):
+                    continue
+                os.remove(target)  # also breaks hardlinks left by older mirrors
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            try:
+                copy_file(source, target)
+            except OSError:
+                continue
+    for dirpath, dirnames, filenames in os.walk(destination):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        for name in filenames:
+            relative = os.path.normpath(os.path.relpath(os.path.join(dirpath, name), destination))
+            if relative not in wanted:
+                os.remove(os.path.join(dirpath, name))
+    return skipped
+
+def write_if_changed(path: str, content: str):
+    """Write content unless the file already has it, keeping its mtime otherwise."""
+    try:
+        with open(path, "r") as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    with open(path, "w") as f:
+        f.write(content)
+
+def mark_in_use(directory: str) -> str:
+    """Mark directory as used by this process until ``release_mark`` is called."""
+    marker = os.path.join(directory, f"{IN_USE_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    with open(marker, "w"):
+        pass
+    return marker
+
+def release_mark(marker: Optional[str]):
+    if marker is not None:
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+
+def in_use(directory: str) -> bool:
+    """Whether a live process has marked directory as in use."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return False
+    for name in names:
+        if name.startswith(IN_USE_PREFIX):
+            pid = name[len(IN_USE_PREFIX):].split("-", 1)[0]
+            if pid.isdigit() and pid_alive(int(pid)):
+                return True
+    return False
+
+def prune_least_recent(directory: str, keep: int):
+    """Delete all but the ``keep`` most recently modified subdirectories of directory.
+
+    Directories a live process has marked in use are always kept, and
+    count towards ``keep``. Staging directories are left to the process
+    building them, or removed once it has exited.
+    """
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return
+    candidates, busy = [], 0
+    for entry in entries:
+        if entry.name.startswith(STAGING_PREFIX):
+            pid = entry.name[len(STAGING_PREFIX):].split("-", 1)[0]
+            if pid.isdigit() and not pid_alive(int(pid)):
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif in_use(entry.path):
+            busy += 1
+        else:
+            candidates.append(entry)
+    candidates.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in candidates[max(0, keep - busy):]:
+        shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,13 @@
+import os
+import sys
+import pytest
+
+# The core modules import each other by top-level name, as when run as core/main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep every cache a test touches out of the user's ~/.cache/dtm."""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("DTM_CACHE_DIR", str(path))
+    return path
@@ -0,0 +1,70 @@
+import json
+import time
+from cache import ResultCache, project_fingerprint, project_scoped_fingerprint
+from probe import store_result
+
+class Adapter:
+    package_name = "mylib"
+
+def result(version, installed=True, passed=True, conflicts=None, **extra):
+    return dict({"version": version, "installed": installed, "passed": passed, "conflicts": conflicts}, **extra)
+
+def test_results_round_trip_per_fingerprint_and_test_command(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    key = cache.make_key("fp", "Adapter", "mylib", "1.0.0", "pytest")
+    cache.put(key, "Adapter", "mylib", "1.0.0", result("1.0.0"))
+    assert cache.get(key) == result("1.0.0")
+    assert cache.get(cache.make_key("other", "Adapter", "mylib", "1.0.0", "pytest")) is None
+    assert cache.get(cache.make_key("fp", "Adapter", "mylib", "1.0.0", "pytest tests/a.py")) is None
+    # Another process sees the same store
+    assert ResultCache(str(tmp_path / "results.sqlite3")).get(key) == result("1.0.0")
+    cache.clear()
+    assert cache.get(key) is None
+
+def test_expired_and_least_recently_used_entries_are_evicted(tmp_path):
+    expired = ResultCache(str(tmp_path / "expired.sqlite3"), max_age=0.05)
+    expired.put("k", "Adapter", "mylib", "1.0.0", result("1.0.0"))
+    time.sleep(0.1)
+    assert expired.get("k") is None
+
+    entries = {version: result(version) for version in ("1.0.0", "1.1.0", "1.2.0")}
+    size = len(json.dumps(entries["1.0.0"]))
+    cache = ResultCache(str(tmp_path / "lru.sqlite3"), max_bytes=2 * size)
+    for version, entry in entries.items():
+        cache.put(version, "Adapter", "mylib", version, entry)
+        time.sleep(0.01)
+    assert cache.get("1.0.0") is not None  # now the most recently used
+    cache.evict()
+    assert [cache.get(version) is not None for version in entries] == [True, False, True]
+
+def test_only_deterministic_outcomes_are_stored(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    outcomes = {
+        "1.0.0": result("1.0.0"),
+        "1.1.0": result("1.1.0", passed=False),
+        "1.2.0": result("1.2.0", installed=False, passed=False, conflicts={"dep": ["needs < 1.2"]}),
+        "1.3.0": result("1.3.0", installed=False, passed=False),  # maybe the network
+        "1.4.0": result("1.4.0", passed=False, timed_out="wall"),
+    }
+    for version, outcome in outcomes.items():
+        store_result(Adapter(), version, "pytest", outcome, cache, "fp")
+    stored = [version for version in outcomes
+              if cache.get(cache.make_key("fp", "Adapter", "mylib", version, "pytest")) is not None]
+    assert stored == ["1.0.0", "1.1.0", "1.2.0"]
+
+def test_fingerprint_covers_test_data_and_config_but_not_build_output(tmp_path):
+    root = tmp_path / "project"
+    root.mkdir()
+    (root / "app.py").write_text("import mylib\n")
+    (root / "tests" / "data").mkdir(parents=True)
+    (root / "node_modules").mkdir()
+    fingerprint = project_fingerprint(str(root))
+    (root / "node_modules" / "dep.js").write_text("")
+    assert project_fingerprint(str(root)) == fingerprint
+    for path in ("tests/data/input.json", "setup.cfg"):
+        (root / path).write_text("{}")
+        assert project_fingerprint(str(root)) != fingerprint
+        fingerprint = project_fingerprint(str(root))
+    assert project_scoped_fingerprint(fingerprint, ".") == fingerprint
+    assert project_scoped_fingerprint(fingerprint, "apps/b") not in (fingerprint, None)
+    assert project_scoped_fingerprint(None, "apps/b") is None
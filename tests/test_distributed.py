@@ -0,0 +1,45 @@
+import sys
+import threading
+import pytest
+from benchmark import TEST_COMMAND, FakeAdapter, Scenario
+from distributed import Coordinator, RemoteBenchmark, RemoteProber, Worker
+from parallel import parallel_search_versions
+
+SCENARIO = Scenario("remote", majors=2, minors=4, patches=3, boundary=0.5, install_latency=0.05)
+
+@pytest.fixture
+def coordinator():
+    """A coordinator on a free localhost port with two single-slot workers."""
+    coordinator = Coordinator(lease_timeout=5)
+    host, port = coordinator.serve("127.0.0.1", 0)
+    workers = [Worker(f"http://{host}:{port}", lambda package, language, project: FakeAdapter(package, SCENARIO))
+               for _ in range(2)]
+    for worker in workers:
+        threading.Thread(target=worker.run, daemon=True).start()
+    assert coordinator.wait_for_workers(2, timeout=10)
+    yield coordinator
+    for worker in workers:
+        worker.stopped.set()
+    coordinator.shutdown()
+
+def test_search_spreads_probes_over_workers(coordinator):
+    prober = RemoteProber(coordinator, FakeAdapter("synthetic-remote", SCENARIO), "python", TEST_COMMAND)
+    latest_working, first_broken, _ = parallel_search_versions(
+        SCENARIO.versions, None, TEST_COMMAND, coordinator.capacity(), run_probe=prober)
+    assert (latest_working, first_broken) == SCENARIO.expected
+    workers = coordinator.status()["workers"]
+    assert len(workers) == 2
+    assert all(worker["completed"] > 0 for worker in workers)
+
+def test_confirmation_runs_on_workers(coordinator):
+    latest_working, first_broken = SCENARIO.expected
+    prober = RemoteProber(coordinator, FakeAdapter("synthetic-remote", SCENARIO), "python", TEST_COMMAND)
+    assert prober.works(latest_working)
+    assert not prober.works(first_broken)
+
+def test_benchmarks_stay_on_one_worker(coordinator):
+    benchmark = RemoteBenchmark(coordinator, FakeAdapter("synthetic-remote", SCENARIO), "python",
+                                f"{sys.executable} -c pass", samples=2)
+    measured = [benchmark(version) for version in SCENARIO.versions[:3]]
+    assert all("error" not in result and len(result["latency"]["samples"]) == 2 for result in measured)
+    assert len({result["worker"] for result in measured}) == 1
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import time
+import pytest
+from envs import EnvironmentManager
+
+@pytest.fixture
+def manager(tmp_path):
+    return EnvironmentManager(str(tmp_path / "requirements.txt"), extra_requirements=[], pool_size=1)
+
+def wait_for(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+def test_clones_share_the_baseline_files_and_are_isolated(manager):
+    env = manager.acquire()
+    assert os.path.dirname(env.path) == manager.in_use_dir
+    assert os.path.basename(env.path).startswith(f"{os.getpid()}-")
+    # Hardlinked, not copied
+    config = "pyvenv.cfg"
+    assert os.path.samefile(os.path.join(manager.baseline_path, config), os.path.join(env.path, config))
+    subprocess.run([env.python, "-c", "import sys; assert sys.prefix != sys.base_prefix"], check=True)
+    # The pool is refilled in the background, then handed out first
+    wait_for(lambda: len(os.listdir(manager.pool_dir)) == 1)
+    warm = os.listdir(manager.pool_dir)[0]
+    second = manager.acquire()
+    assert warm not in os.listdir(manager.pool_dir)
+    for used in (env, second):
+        manager.release(used)
+    wait_for(lambda: not os.listdir(manager.in_use_dir))
+    assert os.path.exists(manager.baseline_python)
+
+def test_clones_of_exited_processes_are_removed(manager):
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    leftovers = [os.path.join(manager.in_use_dir, f"{dead.pid}-abc"),
+                 os.path.join(manager.root, f"staging-{dead.pid}-abc"),
+                 os.path.join(manager.in_use_dir, f"{os.getpid()}-mine")]
+    for path in leftovers:
+        os.makedirs(path)
+    EnvironmentManager(manager.requirements_path, extra_requirements=[], pool_size=1)
+    assert [os.path.exists(path) for path in leftovers] == [False, False, True]
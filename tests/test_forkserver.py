@@ -0,0 +1,69 @@
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+import forkserver
+from forkserver import STALE_EXIT, _same_file, _stale_module, get_fork_server, stop_fork_servers
+
+pytestmark = pytest.mark.skipif(not forkserver.supported(), reason="needs fork and fd passing")
+
+@pytest.fixture
+def projects(tmp_path):
+    """Two projects with the same package under test and a module that prints where it ran."""
+    roots = []
+    for name in ("a", "b"):
+        root = tmp_path / name
+        root.mkdir()
+        (root / "tinylib.py").write_text("")
+        (root / "helper.py").write_text("import tinylib\n")
+        (root / "where.py").write_text("import os\nprint(os.getcwd())\n")
+        roots.append(str(root))
+    yield roots
+    stop_fork_servers("tinylib")
+
+def run(server, root, prefix=sys.prefix):
+    return subprocess.run(server.command(prefix, ["where"]), cwd=root, capture_output=True, text=True)
+
+def test_projects_sharing_an_interpreter_keep_their_own_zygotes(projects):
+    a, b = projects
+    server_a = get_fork_server(sys.executable, a, "tinylib", ["tinylib"], ["json"], "sig-a")
+    server_b = get_fork_server(sys.executable, b, "tinylib", ["tinylib"], ["json"], "sig-b")
+    assert server_a is not None and server_b is not None and server_a is not server_b
+    assert server_a.process.poll() is None
+    assert get_fork_server(sys.executable, a, "tinylib", ["tinylib"], ["json"], "sig-a") is server_a
+    for server, root in ((server_a, a), (server_b, b)):
+        completed = run(server, root)
+        assert (completed.returncode, completed.stdout.strip()) == (0, root)
+    stop_fork_servers("tinylib", b)
+    assert server_a.process.poll() is None and server_b.process.poll() is not None
+
+def test_a_preload_that_imports_the_package_taints_the_zygote(projects):
+    assert get_fork_server(sys.executable, projects[0], "tinylib", ["tinylib"], ["helper"], "sig") is None
+
+def test_runs_against_a_venv_with_other_files_fall_back_to_cold(projects, tmp_path):
+    server = get_fork_server(sys.executable, projects[0], "tinylib", ["tinylib"], ["json"], "sig")
+    completed = run(server, projects[0], prefix=str(tmp_path / "elsewhere"))
+    assert completed.returncode == STALE_EXIT
+    assert "needs a cold start" in completed.stderr
+
+def test_stale_modules_are_found_by_content(tmp_path, monkeypatch):
+    baseline, clone = tmp_path / "baseline", tmp_path / "clone"
+    baseline.mkdir()
+    clone.mkdir()
+    (baseline / "stalemod.py").write_text("VALUE = 1\n")
+    os.link(baseline / "stalemod.py", clone / "stalemod.py")
+    monkeypatch.syspath_prepend(str(baseline))
+    monkeypatch.delitem(sys.modules, "stalemod", raising=False)
+    __import__("stalemod")
+    try:
+        assert _stale_module(str(baseline), str(clone)) is None
+        # pip replaces files rather than editing them; an identical copy is still fresh
+        os.remove(clone / "stalemod.py")
+        shutil.copy(baseline / "stalemod.py", clone / "stalemod.py")
+        assert _same_file(str(baseline / "stalemod.py"), str(clone / "stalemod.py"))
+        assert _stale_module(str(baseline), str(clone)) is None
+        (clone / "stalemod.py").write_text("VALUE = 2\n")
+        assert _stale_module(str(baseline), str(clone)) == "stalemod"
+    finally:
+        sys.modules.pop("stalemod", None)
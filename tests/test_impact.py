@@ -0,0 +1,69 @@
+import json
+from impact import ImpactIndex, narrow_test_command
+
+def write(root, files):
+    for relative, content in files.items():
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+def test_python_tests_reaching_a_package_through_project_modules(tmp_path):
+    write(tmp_path, {
+        "app/__init__.py": "",
+        "app/client.py": "import requests\n",
+        "app/service.py": "from . import client\nimport json\n",
+        "app/pure.py": "import json\n",
+        "tests/conftest.py": "",
+        "tests/test_service.py": "from app.service import run\n",
+        "tests/test_pure.py": "from app import pure\n",
+        "tests/test_direct.py": "import requests.adapters\n",
+        "tests/api/conftest.py": "import requests\n",
+        "tests/api/test_api.py": "",
+        "venv/lib/test_vendored.py": "import requests\n",
+    })
+    index = ImpactIndex(str(tmp_path)).refresh()
+    assert "venv/lib/test_vendored.py" not in index.files
+    assert index.tests_reaching("python", ["requests"]) == [
+        "tests/api/test_api.py", "tests/test_direct.py", "tests/test_service.py"]
+    assert "app/pure.py" not in index.usage_files("python", ["requests"])
+    preload = index.python_preload_modules(["requests"])
+    assert "json" in preload and "app.pure" in preload
+    assert not {"requests", "app.client", "app.service"} & set(preload)
+    assert narrow_test_command("python", "pytest", ["tests/test_direct.py"]) == "pytest tests/test_direct.py"
+
+def test_js_and_rust_graphs(tmp_path):
+    write(tmp_path, {
+        "src/fmt.js": "const pad = require('left-pad');\n",
+        "src/index.ts": "import { fmt } from './fmt';\n",
+        "src/__tests__/index.test.ts": "import '../index';\n",
+        "test/other.spec.js": "import x from '@scope/other/sub';\n",
+        "Cargo.toml": '[package]\nname = "my-crate"\n',
+        "src/lib.rs": "mod wire;\n",
+        "src/wire.rs": "use serde::Serialize;\n#[test]\nfn round_trip() {}\n",
+        "tests/api.rs": "use my_crate::wire;\n",
+        "tests/plain.rs": "#[test]\nfn ok() {}\n",
+    })
+    index = ImpactIndex(str(tmp_path)).refresh()
+    assert index.tests_reaching("js", ["left-pad"]) == ["src/__tests__/index.test.ts"]
+    assert index.tests_reaching("js", ["@scope/other"]) == ["test/other.spec.js"]
+    # Unit tests live next to the code; integration tests reach it through the crate root
+    assert index.tests_reaching("rust", ["serde"]) == ["src/wire.rs", "tests/api.rs"]
+    assert narrow_test_command("rust", "cargo test", ["src/wire.rs", "tests/api.rs"]) == "cargo test --lib --test api"
+    assert narrow_test_command("js", "npm test", ["a.test.js"]) == "npm test -- a.test.js"
+
+def test_only_changed_files_are_parsed_again(tmp_path, monkeypatch):
+    write(tmp_path, {"app.py": "import requests\n", "test_app.py": "import app\n"})
+    ImpactIndex(str(tmp_path)).refresh()
+    stored = json.loads((tmp_path / ".dtm" / "impact-index.json").read_text())
+    assert set(stored["files"]) == {"app.py", "test_app.py"}
+    (tmp_path / "app.py").write_text("import json\n")
+    parsed = []
+    original = ImpactIndex._parse
+    monkeypatch.setattr(ImpactIndex, "_parse",
+                        lambda self, relative, language: parsed.append(relative) or original(self, relative, language))
+    index = ImpactIndex(str(tmp_path)).refresh()
+    assert parsed == ["app.py"]
+    assert index.tests_reaching("python", ["requests"]) == []
+    signature = index.signature()
+    (tmp_path / "test_app.py").unlink()
+    assert index.refresh().signature() != signature
@@ -0,0 +1,54 @@
+import copy
+import json
+import threading
+from benchmark import compare, run_benchmarks
+from instrument import Tracer
+
+def install(tracer, version, together):
+    with tracer.span("install_version", version=version):
+        together.wait()  # both alive at once, so their thread ids differ
+
+def test_spans_are_timed_summarized_and_exported(tmp_path):
+    tracer = Tracer(enabled=True)
+    with tracer.span("search", strategy="bisect") as attrs:
+        attrs["probes"] = 3
+        together = threading.Barrier(2, timeout=5)
+        threads = [threading.Thread(target=install, args=(tracer, version, together)) for version in ("1.0", "1.1")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert [record["name"] for record in tracer.spans] == ["install_version", "install_version", "search"]
+    search = tracer.spans[-1]
+    assert search["attrs"] == {"strategy": "bisect", "probes": 3}
+    assert search["duration"] >= max(record["duration"] for record in tracer.spans[:2])
+    assert tracer.phases()["install_version"]["count"] == 2
+
+    spans_path, trace_path = tracer.export(str(tmp_path / "trace"))
+    with open(spans_path) as f:
+        assert set(json.load(f)["phases"]) == {"search", "install_version"}
+    with open(trace_path) as f:
+        events = json.load(f)["traceEvents"]
+    complete = [event for event in events if event["ph"] == "X"]
+    assert sorted(event["args"].get("version") or "" for event in complete) == ["", "1.0", "1.1"]
+    # Each thread gets its own track and a name for it
+    assert len({event["tid"] for event in complete}) == 3
+    assert sum(event["ph"] == "M" for event in events) == 3
+
+def test_a_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span("search") as attrs:
+        attrs["probes"] = 1
+    assert tracer.spans == [] and tracer.phases() == {}
+
+def test_benchmarks_flag_extra_probes_and_wrong_answers():
+    results = run_benchmarks(["small"], ["bisect"])
+    run = results["small"]["modes"]["bisect"]
+    assert run["correct"] and run["probes"] > 0
+    assert "install_version" in run["phases"] and "run_tests" in run["phases"]
+    assert compare(results, results) == []
+    baseline = copy.deepcopy(results)
+    baseline["small"]["modes"]["bisect"]["probes"] -= 1
+    run["correct"] = False
+    problems = compare(results, baseline)
+    assert len(problems) == 2 and problems[1].endswith(f"{run['probes']} probes, was {run['probes'] - 1}")
@@ -0,0 +1,86 @@
+import json
+import os
+import stat
+import sys
+import pytest
+from adapters.js_adapter import JSAdapter
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the fake npm is a shebang script")
+
+# Stands in for npm: installs name@version as a stub package and records the call
+FAKE_NPM = """#!{python}
+import json, os, sys
+name, _, version = sys.argv[2].rpartition("@")
+with open(os.environ["NPM_CALLS"], "a") as log:
+    log.write(f"{{name}}@{{version}}\\n")
+if version == "9.9.9":
+    sys.stderr.write("npm ERR! code ERESOLVE\\nnpm ERR! Could not resolve dependency:\\n"
+                     'npm ERR! peer react@"^18.0.0" from ' + name + "@9.9.9\\n")
+    sys.exit(1)
+with open("package.json") as f:
+    manifest = json.load(f)
+manifest.setdefault("dependencies", {{}})[name] = version
+with open("package.json", "w") as f:
+    json.dump(manifest, f)
+os.makedirs(os.path.join("node_modules", name))
+with open(os.path.join("node_modules", name, "package.json"), "w") as f:
+    json.dump({{"name": name, "version": version}}, f)
+"""
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    npm = bin_dir / "npm"
+    npm.write_text(FAKE_NPM.format(python=sys.executable))
+    npm.chmod(npm.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("NPM_CALLS", str(tmp_path / "npm-calls"))
+    root = tmp_path / "project"
+    (root / "src").mkdir(parents=True)
+    (root / "package.json").write_text(json.dumps({"name": "app", "dependencies": {"mylib": "^1.0.0"}}))
+    (root / "src" / "index.js").write_text("require('mylib');\n")
+    return root
+
+def npm_calls(project):
+    path = project.parent / "npm-calls"
+    return path.read_text().split() if path.exists() else []
+
+def installed(adapter):
+    with open(os.path.join(adapter.workspace, "node_modules", "mylib", "package.json")) as f:
+        return json.load(f)["version"]
+
+def test_versions_switch_between_snapshots_without_touching_the_project(project):
+    original = (project / "package.json").read_text()
+    adapter = JSAdapter("mylib", root=str(project))
+    for version in ("1.0.0", "1.1.0", "1.0.0"):
+        assert adapter.install_version(version)
+        assert installed(adapter) == version
+    assert npm_calls(project) == ["mylib@1.0.0", "mylib@1.1.0"]
+    workspace = adapter.workspace
+    assert os.path.islink(os.path.join(workspace, "node_modules"))
+    with open(os.path.join(workspace, "package.json")) as f:
+        assert json.load(f)["dependencies"]["mylib"] == "1.0.0"
+    assert (project / "package.json").read_text() == original
+    assert not (project / "node_modules").exists()
+    assert open(os.path.join(workspace, "src", "index.js")).read() == "require('mylib');\n"
+    adapter.close()
+    assert not os.path.exists(workspace)
+
+    # A later run reuses the snapshots; a changed lockfile needs new ones
+    again = JSAdapter("mylib", root=str(project))
+    assert again.install_version("1.1.0") and installed(again) == "1.1.0"
+    assert len(npm_calls(project)) == 2
+    (project / "package-lock.json").write_text("{}")
+    assert again.install_version("1.1.0")
+    assert npm_calls(project)[-1] == "mylib@1.1.0" and len(npm_calls(project)) == 3
+    again.close()
+
+def test_failed_installs_report_peer_conflicts_and_old_snapshots_are_pruned(project):
+    adapter = JSAdapter("mylib", root=str(project), keep_snapshots=1)
+    assert not adapter.install_version("9.9.9")
+    assert adapter.get_dependency_conflicts("9.9.9") == {"react": ['"^18.0.0" required by mylib@9.9.9']}
+    for version in ("1.0.0", "1.1.0"):
+        assert adapter.install_version(version)
+    adapter.close()
+    assert len([name for name in os.listdir(adapter.snapshots_dir) if not name.startswith(".")]) == 1
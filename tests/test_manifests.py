@@ -0,0 +1,79 @@
+import json
+import subprocess
+from adapters.python_adapter import PythonAdapter
+from envs import EnvironmentManager
+from manifests import ManifestIndex, python_requirements
+from test_wheelhouse import build_wheel
+
+def write(root, files):
+    for relative, content in files.items():
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+def test_index_finds_every_project_and_honors_ignore_files(tmp_path):
+    write(tmp_path, {
+        "requirements.txt": "mylib==1.0.0\n",
+        "requirements-dev.txt": "pytest>=7\n",
+        "package.json": json.dumps({"workspaces": ["packages/*"], "devDependencies": {"jest": "^29.0.0"}}),
+        "package-lock.json": json.dumps({"packages": {"node_modules/left-pad": {"version": "1.3.0"}}}),
+        "packages/ui/package.json": json.dumps({"dependencies": {"left-pad": "^1.0.0"}}),
+        "tools/cli/package.json": json.dumps({"dependencies": {"left-pad": "^1.1.0"}}),
+        "services/api/pyproject.toml": '[project]\nname = "api"\ndependencies = ["MyLib>=1.0"]\n',
+        "node_modules/left-pad/package.json": json.dumps({"dependencies": {"nope": "1"}}),
+        "build/requirements.txt": "nope\n",
+        "legacy/requirements.txt": "nope\n",
+        ".gitignore": "build/\n",
+        ".dtmignore": "legacy\n",
+    })
+    index = ManifestIndex(str(tmp_path)).refresh()
+    assert index.projects() == [".", "packages/ui", "services/api", "tools/cli"]
+    assert index.errors() == {}
+    graph = index.graph()
+    assert "nope" not in graph["python"] and "nope" not in graph["js"]
+    assert [(use["project"], use["constraint"]) for use in graph["python"]["mylib"]] \
+        == [(".", "==1.0.0"), ("services/api", ">=1.0")]
+    assert index.dev_dependencies()["python"] == {"pytest"}
+    # Workspace members install into the workspace root; other projects keep their own environment
+    environments = index.environments()["js"]["left-pad"]
+    assert sorted(environments) == [".", "tools/cli"]
+    assert environments["."][0]["locked"] == "1.3.0"
+
+def test_only_changed_manifests_are_parsed_again(tmp_path, monkeypatch):
+    write(tmp_path, {"a/requirements.txt": "mylib\n", "b/requirements.txt": "other\n"})
+    ManifestIndex(str(tmp_path)).refresh()
+    (tmp_path / "b" / "requirements.txt").write_text("other\nthird\n")
+    parsed = []
+    original = ManifestIndex._reparse
+    monkeypatch.setattr(ManifestIndex, "_reparse",
+                        lambda self, relative, stat: parsed.append(relative) or original(self, relative, stat))
+    index = ManifestIndex(str(tmp_path)).refresh()
+    assert parsed == ["b/requirements.txt"]
+    assert set(index.graph()["python"]) == {"mylib", "other", "third"}
+
+def test_pyproject_only_projects_get_a_baseline_from_their_manifest(tmp_path, monkeypatch):
+    index = tmp_path / "index"
+    index.mkdir()
+    for version in ("1.0.0", "1.1.0"):
+        build_wheel(str(index), "tinylib", version)
+    write(tmp_path, {
+        "poetry/pyproject.toml": '[tool.poetry.dependencies]\npython = "^3.8"\ntinylib = "^1.0"\n'
+                                 '[tool.poetry.group.dev.dependencies]\nhelper = ">=2"\n',
+        "locked/pyproject.toml": '[tool.poetry.dependencies]\ntinylib = "^1.0"\n',
+        "locked/poetry.lock": '[[package]]\nname = "TinyLib"\nversion = "1.0.0"\n',
+        "pep621/pyproject.toml": '[project]\nname = "svc"\ndependencies = ["tinylib<1.1"]\n',
+    })
+    assert python_requirements(str(tmp_path / "poetry")) == ["helper>=2", "tinylib"]
+    assert python_requirements(str(tmp_path / "locked")) == ["tinylib==1.0.0"]
+    assert python_requirements(str(tmp_path)) is None
+
+    adapter = PythonAdapter("tinylib", root=str(tmp_path / "pep621"))
+    assert adapter.env_manager.requirements == ["tinylib<1.1"]
+    assert PythonAdapter("tinylib", root=str(tmp_path / "locked")).env_manager is not adapter.env_manager
+
+    monkeypatch.setenv("PIP_NO_INDEX", "1")
+    monkeypatch.setenv("PIP_FIND_LINKS", str(index))
+    manager = EnvironmentManager(adapter.requirements_path, extra_requirements=[], requirements=adapter.declared)
+    completed = subprocess.run([manager.baseline_python, "-c", "import tinylib; print(tinylib.VERSION)"],
+                               capture_output=True, text=True)
+    assert completed.stdout.strip() == "1.0.0"
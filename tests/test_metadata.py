@@ -0,0 +1,84 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import metadata
+from metadata import NPM_ABBREVIATED_JSON, MetadataClient
+
+class Registry(BaseHTTPRequestHandler):
+    """Serves ``documents`` with ETags, answering conditional requests with 304."""
+
+    documents = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("Accept"), self.headers.get("If-None-Match")))
+        if self.path not in self.documents:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.documents[self.path].encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def registry():
+    Registry.documents = {"/mylib": json.dumps({"versions": {"1.0.0": {}, "1.1.0": {}}})}
+    Registry.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Registry)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def conditional(url):
+    """Whether each request the registry saw for url revalidated an ETag."""
+    return [etag is not None for path, _, etag in Registry.requests if url.endswith(path)]
+
+def test_revalidates_with_etag_and_serves_the_stored_copy_on_304(registry, tmp_path):
+    url = f"{registry}/mylib"
+    first = MetadataClient(cache_dir=str(tmp_path))
+    assert json.loads(first.fetch(url))["versions"]
+    # Memoized within fresh_ttl: no second request
+    first.fetch(url)
+    assert conditional(url) == [False]
+    # A new process revalidates the on-disk copy
+    second = MetadataClient(cache_dir=str(tmp_path))
+    assert second.fetch(url) == first.fetch(url)
+    assert conditional(url) == [False, True]
+
+def test_changed_documents_are_seen_once_fresh_ttl_expires(registry, tmp_path):
+    url = f"{registry}/mylib"
+    client = MetadataClient(cache_dir=str(tmp_path), fresh_ttl=0)
+    client.fetch(url)
+    Registry.documents["/mylib"] = json.dumps({"versions": {"1.0.0": {}, "1.1.0": {}, "2.0.0": {}}})
+    assert list(json.loads(client.fetch(url))["versions"]) == ["1.0.0", "1.1.0", "2.0.0"]
+    assert conditional(url) == [False, True]
+
+def test_immutable_documents_and_missing_ones(registry, tmp_path):
+    client = MetadataClient(cache_dir=str(tmp_path), fresh_ttl=0)
+    url = f"{registry}/mylib"
+    client.fetch(url, immutable=True)
+    assert MetadataClient(cache_dir=str(tmp_path), fresh_ttl=0).fetch(url, immutable=True) is not None
+    assert conditional(url) == [False]
+    assert client.fetch(f"{registry}/missing") is None
+
+def test_npm_versions_ask_for_the_abbreviated_document(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(metadata, "NPM_REGISTRY_URL", registry)
+    client = MetadataClient(cache_dir=str(tmp_path))
+    assert client.npm_versions("mylib") == ["1.0.0", "1.1.0"]
+    assert Registry.requests[-1][1] == NPM_ABBREVIATED_JSON
+    assert client.fetch_many([f"{registry}/mylib", f"{registry}/missing"]) == {
+        f"{registry}/mylib": client.fetch(f"{registry}/mylib"), f"{registry}/missing": None}
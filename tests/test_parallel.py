@@ -0,0 +1,46 @@
+import pytest
+from benchmark import SCENARIOS, TEST_COMMAND, FakeAdapter
+from cache import ResultCache
+from parallel import _evenly_spaced, _next_candidate, parallel_search_versions
+
+class ClosingAdapter(FakeAdapter):
+    closed = []
+
+    def close(self):
+        self.closed.append(self)
+
+def test_candidates_split_the_open_interval():
+    assert _evenly_spaced(-1, 11, 3) == [2, 5, 8]
+    assert _evenly_spaced(-1, 2, 5) == [0, 1]
+    assert _evenly_spaced(3, 4, 2) == []
+    assert _next_candidate(-1, 11, [1]) == 6
+    assert _next_candidate(2, 4, [3]) is None
+
+@pytest.mark.parametrize("workers", [1, 3, 8])
+@pytest.mark.parametrize("scenario", ["small", "wide", "no-break", "early-break", "conflicts"])
+def test_parallel_search_finds_the_boundary(scenario, workers):
+    scenario = SCENARIOS[scenario]
+    stats = {}
+    latest_working, first_broken, conflicts = parallel_search_versions(
+        scenario.versions, lambda slot: FakeAdapter(f"synthetic-{scenario.name}", scenario, slot),
+        TEST_COMMAND, workers, stats=stats)
+    assert (latest_working, first_broken) == scenario.expected
+    assert stats["mode"] == "parallel" and stats["workers"] == workers
+    if first_broken in scenario.uninstallable:
+        assert conflicts is not None
+
+def test_slot_adapters_are_closed_and_results_cached(tmp_path):
+    scenario = SCENARIOS["small"]
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    ClosingAdapter.closed = []
+
+    def search(stats):
+        return parallel_search_versions(scenario.versions, lambda slot: ClosingAdapter("closing", scenario, slot),
+                                        TEST_COMMAND, 4, cache=cache, fingerprint="f" * 64, stats=stats)
+
+    first, second = {}, {}
+    assert search(first)[:2] == scenario.expected
+    assert 0 < len(ClosingAdapter.closed) <= 4
+    assert search(second)[:2] == scenario.expected
+    assert first["cache_hits"] == 0
+    assert second["cache_hits"] > 0
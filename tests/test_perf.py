@@ -0,0 +1,54 @@
+import sys
+import pytest
+from perf import ALPHA, PerformanceBisector, mann_whitney_u, measure, summarize
+
+def test_mann_whitney_exact_and_approximate():
+    assert mann_whitney_u([1, 2, 3], [4, 5, 6]) == pytest.approx(1 / 20)
+    assert mann_whitney_u([4, 5, 6], [1, 2, 3]) == pytest.approx(1.0)
+    assert mann_whitney_u([1.0] * 5, [1.0] * 5) == 1.0
+    assert mann_whitney_u([], [1.0]) == 1.0
+    baseline = [1 + i / 100 for i in range(30)]
+    assert mann_whitney_u(baseline, [v + 1 for v in baseline]) < 1e-6
+    assert mann_whitney_u(baseline, [v + 0.005 for v in baseline]) > ALPHA
+    # Ties take the normal approximation and still see a clear shift
+    assert mann_whitney_u([1, 1, 2, 2, 3], [3, 4, 4, 5, 5]) < 0.05
+
+def test_measure_reports_time_memory_and_exit_status():
+    sample = measure([sys.executable, "-c", "import time; data = bytearray(50_000_000); time.sleep(0.05)"])
+    assert sample["returncode"] == 0 and sample["wall"] >= 0.05
+    if sample["rss_kb"] is not None:
+        assert sample["rss_kb"] > 40_000
+    assert measure([sys.executable, "-c", "raise SystemExit(3)"])["returncode"] == 3
+    assert summarize([3.0, 1.0, 2.0])["median"] == 2.0
+
+class Adapter:
+    package_name = "mylib"
+
+def synthetic(slow_from, collected):
+    """Benchmark samples that double in latency from version slow_from on."""
+    def remote(version):
+        collected.append(version)
+        base = 2.0 if version >= slow_from else 1.0
+        return {"latency": summarize([base + i / 100 for i in range(10)]),
+                "rss_kb": summarize([1000.0] * 10)}
+    return remote
+
+@pytest.mark.parametrize("slow_from, expected", [("1.3", ("1.2", "1.3")), ("9", ("1.5", None)),
+                                                 ("1.1", ("1.0", "1.1"))])
+def test_bisect_finds_the_first_slower_version(slow_from, expected):
+    collected = []
+    versions = ["1.1", "1.2", "1.3", "1.4", "1.5"]
+    result = PerformanceBisector(Adapter(), "bench", remote=synthetic(slow_from, collected)).bisect(versions, "1.0")
+    assert (result["last_fast"], result["first_regressed"]) == expected
+    assert len(collected) <= 4 and len(set(collected)) == len(collected)
+    assert result["versions"]["1.0"]["baseline"]
+    if result["first_regressed"]:
+        assert result["regression"]["latency"]["ratio"] > 1.9
+        assert not result["regression"]["rss_kb"]["regressed"]
+
+def test_a_benchmark_that_breaks_counts_as_a_regression():
+    def remote(version):
+        samples = {"latency": summarize([1.0] * 10), "rss_kb": summarize([])}
+        return dict(samples, error="benchmark exited with 1") if version == "1.2" else samples
+    result = PerformanceBisector(Adapter(), "bench", remote=remote).bisect(["1.1", "1.2"], "1.0")
+    assert result["first_regressed"] == "1.2"
@@ -0,0 +1,55 @@
+from pruning import StaticPruner, parse_pinned_requirements
+
+def wheel(version, requires_python=None, yanked=False, metadata=False):
+    return {"filename": f"mylib-{version}-py3-none-any.whl", "url": f"https://files/mylib-{version}.whl#sha256=0",
+            "requires-python": requires_python, "yanked": yanked, "core-metadata": metadata}
+
+class Client:
+    """Registry metadata for mylib and the project's other pins, without a network."""
+
+    max_workers = 2
+    files = [wheel("1.0", yanked=True), wheel("1.1"), wheel("1.2", metadata=True), wheel("2.0"),
+             wheel("2.1", requires_python=">=4")]
+    releases = {
+        ("otherlib", "3.0"): ["mylib<2.0", 'mylib<1.1; extra == "fast"'],
+        ("mylib", "1.1"): ["dep>=3"],
+        ("mylib", "2.0"): [],
+    }
+    core_metadata = {"https://files/mylib-1.2.whl.metadata": "Name: mylib\nRequires-Dist: dep>=5\n"}
+
+    def pypi_project(self, package):
+        return {"files": self.files} if package.lower() == "mylib" else None
+
+    def pypi_release_url(self, package, version):
+        return f"{package}/{version}"
+
+    def fetch(self, url, accept="application/json", immutable=False):
+        return self.core_metadata.get(url)
+
+    def fetch_json(self, url, immutable=False):
+        package, version = url.split("/")
+        requires = self.releases.get((package.lower(), version))
+        return None if requires is None else {"info": {"requires_dist": requires}}
+
+def test_versions_are_pruned_from_metadata_alone():
+    pruner = StaticPruner(Client(), {"otherlib": "3.0", "dep": "4.0"})
+    pruner.python_version = "3.11.0"
+    kept, pruned = pruner.prune("MyLib", ["1.0", "1.1", "1.2", "2.0", "2.1"])
+    assert kept == ["1.1"]
+    assert pruned == {
+        "1.0": {"MyLib": ["1.0 has been yanked"]},
+        "1.2": {"mylib==1.2": ["requires dep>=5 but you have dep 4.0"]},
+        "2.0": {"otherlib==3.0": ["requires mylib<2.0, which excludes mylib 2.0"]},
+        "2.1": {"python": ["requires python>=4 but you have python 3.11.0"]},
+    }
+
+def test_without_pins_only_the_files_are_checked():
+    kept, pruned = StaticPruner(Client(), {}).prune("mylib", ["1.0", "1.1", "1.2", "2.0", "9.9"])
+    assert kept == ["1.1", "1.2", "2.0", "9.9"]
+    assert list(pruned) == ["1.0"]
+
+def test_pins_are_read_from_requirements(tmp_path):
+    path = tmp_path / "requirements.txt"
+    path.write_text("Other_Lib==3.0  # pinned\nrequests[socks]==2.31.0; python_version > '3'\nloose>=1\n")
+    assert parse_pinned_requirements(str(path)) == {"other-lib": "3.0", "requests": "2.31.0"}
+    assert parse_pinned_requirements(str(tmp_path / "missing.txt")) == {}
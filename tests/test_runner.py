@@ -0,0 +1,72 @@
+import gzip
+import os
+import sys
+import threading
+import time
+import pytest
+from runner import FAILURE_PATTERNS
+from runner import TestRunner as Runner  # not a test class
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+def gone(pid):
+    """Whether pid has exited (a zombie nobody reaps counts as gone)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] == "Z"
+    except FileNotFoundError:
+        return True
+
+@pytest.fixture
+def runner(tmp_path):
+    return Runner(wall_timeout=30, idle_timeout=30, tail_lines=5, log_dir=str(tmp_path / "logs"), keep_logs=2)
+
+def test_output_keeps_a_tail_and_a_full_log(runner):
+    run = runner.run(python("for i in range(50): print(i)"), label="tail")
+    assert run.passed and run.returncode == 0
+    assert run.output.split("\n") == ["45", "46", "47", "48", "49"]
+    with gzip.open(run.log_path, "rt") as log:
+        assert log.read().split() == [str(i) for i in range(50)]
+    for _ in range(2):
+        runner.run(python("pass"))
+    assert len(os.listdir(runner.log_dir)) == 2
+
+def test_silent_and_overlong_runs_are_killed(runner):
+    runner.idle_timeout = 0.5
+    run = runner.run(python("print('started', flush=True); import time; time.sleep(30)"))
+    assert (run.timed_out, run.passed) == ("idle", False)
+    assert run.duration < 10
+    assert run.output.endswith("[dtm] killed after no output for 0.5s")
+
+    runner.idle_timeout, runner.wall_timeout = 30, 1
+    run = runner.run(python("import time\nwhile True:\n    print('.', flush=True)\n    time.sleep(0.1)"))
+    assert run.timed_out == "wall" and run.duration < 10
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="checks the process group through /proc")
+def test_first_failure_stops_the_whole_process_group(runner):
+    script = ("import subprocess, sys, time\n"
+              "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+              "print(child.pid)\n"
+              "print('not ok 1 - skipped # SKIP not here')\n"
+              "print('not ok 2 - broken', flush=True)\n"
+              "time.sleep(30)")
+    run = runner.run(python(script), failure_patterns=FAILURE_PATTERNS["npm"])
+    assert run.failed_early and not run.passed and run.duration < 10
+    assert run.output.endswith("[dtm] stopped at the first test failure")
+    child = int(run.output.split("\n")[0])
+    deadline = time.monotonic() + 5
+    while not gone(child):
+        assert time.monotonic() < deadline, "the test command's child outlived it"
+        time.sleep(0.05)
+
+    runner.fail_fast = False
+    run = runner.run(python("print('not ok 2 - broken'); raise SystemExit(1)"),
+                     failure_patterns=FAILURE_PATTERNS["npm"])
+    assert (run.failed_early, run.returncode) == (False, 1)
+
+def test_cancelled_runs_stop_and_do_not_pass(runner):
+    cancel = threading.Event()
+    threading.Timer(0.3, cancel.set).start()
+    run = runner.run(python("import time; time.sleep(30)"), cancel=cancel)
+    assert run.cancelled and not run.passed and run.duration < 10
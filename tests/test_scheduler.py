@@ -0,0 +1,60 @@
+import threading
+import time
+from scheduler import DEFAULT_ADAPTER_LIMITS, AnalysisScheduler, Job, ResourcePool, hold
+
+class Tracker:
+    """Records how many analyses of each language ran at once."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.running, self.peak, self.order = {}, {}, []
+        self.lock = threading.Lock()
+
+    def __call__(self, job):
+        with self.lock:
+            self.order.append(job.key)
+            self.running[job.language] = self.running.get(job.language, 0) + 1
+            self.peak[job.language] = max(self.peak.get(job.language, 0), self.running[job.language])
+        time.sleep(self.delay)
+        with self.lock:
+            self.running[job.language] -= 1
+        if job.package == "broken":
+            raise RuntimeError("boom")
+        return {"package": job.package, "status": "success"}
+
+def test_jobs_start_in_priority_order():
+    tracker = Tracker(delay=0)
+    jobs = [Job("python", name, (rank,)) for rank, name in [(2, "c"), (0, "a"), (1, "b")]]
+    AnalysisScheduler(max_jobs=1).run(jobs, tracker)
+    assert tracker.order == ["a", "b", "c"]
+
+def test_rust_analyses_run_one_at_a_time_without_blocking_others():
+    assert DEFAULT_ADAPTER_LIMITS["rust"] == 1
+    tracker = Tracker()
+    jobs = [Job("rust", f"crate{i}", (0, i)) for i in range(3)] + [Job("python", f"pkg{i}", (1, i)) for i in range(3)]
+    results = AnalysisScheduler(max_jobs=4).run(jobs, tracker)
+    assert len(results) == 6
+    assert tracker.peak == {"rust": 1, "python": 3}
+
+def test_failures_become_error_results_keyed_by_project():
+    jobs = [Job("js", "broken"), Job("js", "mylib", project="apps/b"), Job("js", "mylib")]
+    reported = []
+    results = AnalysisScheduler(max_jobs=2).run(jobs, Tracker(delay=0), on_result=lambda job, r: reported.append(job.key))
+    assert results["broken"] == {"package": "broken", "status": "error", "message": "boom"}
+    assert set(results) == set(reported) == {"broken", "mylib", "mylib (apps/b)"}
+
+def test_resource_pool_bounds_concurrent_holders():
+    pool = ResourcePool({"cpu": 2})
+    tracker = Tracker()
+
+    def work():
+        with hold(pool, "cpu"):
+            tracker(Job("cpu", "slot"))
+        with hold(pool, "gpu"), hold(None, "cpu"):
+            pass  # unknown names and no pool never block
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tracker.peak["cpu"] == 2
@@ -0,0 +1,58 @@
+import pytest
+from benchmark import SCENARIOS, TEST_COMMAND, FakeAdapter
+from probe import Prober
+from search import STRATEGIES, make_strategy
+
+class WindowAdapter:
+    """Versions fail inside [start, stop) of the list and work everywhere else."""
+
+    version_scheme = "semver"
+
+    def __init__(self, versions, start, stop):
+        self.package_name = "window"
+        self.versions = versions
+        self.broken = set(versions[start:stop])
+        self.version = None
+
+    def install_version(self, version):
+        self.version = version
+        return True
+
+    def run_tests(self, test_command, cancel=None):
+        return self.version not in self.broken, ""
+
+@pytest.mark.parametrize("strategy", sorted(STRATEGIES))
+@pytest.mark.parametrize("scenario", sorted(SCENARIOS.keys() - {"flaky"}))
+def test_strategies_find_the_boundary(strategy, scenario):
+    scenario = SCENARIOS[scenario]
+    prober = Prober(FakeAdapter(f"synthetic-{scenario.name}", scenario), TEST_COMMAND)
+    latest_working, first_broken, conflicts, _ = make_strategy(strategy).search(scenario.versions, prober)
+    assert (latest_working, first_broken) == scenario.expected
+    assert prober.probes < len(scenario.versions)
+    if first_broken in scenario.uninstallable:
+        assert conflicts is not None
+
+def test_hierarchical_descends_into_the_breaking_minor():
+    scenario = SCENARIOS["wide"]
+    prober = Prober(FakeAdapter("synthetic-wide", scenario), TEST_COMMAND)
+    make_strategy("hierarchical").search(scenario.versions, prober)
+    # Every probed version is either a group representative or inside the breaking minor
+    broken_minor = scenario.expected[1].rsplit(".", 1)[0]
+    for version in prober.results:
+        assert version.startswith(broken_minor + ".") or version.endswith(".7")
+
+def test_verify_boundary_moves_above_a_fixed_regression():
+    versions = [f"1.{minor}.0" for minor in range(12)]
+
+    def search(verify):
+        prober = Prober(WindowAdapter(versions, 3, 6), TEST_COMMAND)
+        return make_strategy("bisect", verify_boundary=verify).search(versions, prober)
+
+    assert search(False)[:2] == ("1.2.0", "1.3.0")
+    latest_working, first_broken, _, extra = search(True)
+    assert (latest_working, first_broken) == ("1.11.0", None)
+    assert extra["non_monotonic"]
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError, match="Unknown search strategy"):
+        make_strategy("random")
@@ -0,0 +1,85 @@
+import json
+import threading
+import pytest
+from cache import project_fingerprint, project_scoped_fingerprint
+from events import emit
+from server import (INVALID_PARAMS, INVALID_REQUEST, METHOD_NOT_FOUND, PARSE_ERROR, RUNNER_BUSY,
+                    Connection, CoreService)
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "requirements.txt").write_text("mylib\n")
+    monkeypatch.chdir(project)
+    return CoreService()
+
+def call(service, method, params=None, **request):
+    replies = []
+    request = dict({"jsonrpc": "2.0", "id": 1, "method": method}, **request)
+    if params is not None:
+        request["params"] = params
+    service.handle(json.dumps(request), replies.append)
+    return replies
+
+def error_code(replies):
+    return replies[0]["error"]["code"]
+
+def test_malformed_requests_get_json_rpc_errors(service):
+    replies = []
+    service.handle("{not json", replies.append)
+    assert replies == [{"jsonrpc": "2.0", "id": None, "error": {"code": PARSE_ERROR, "message": "Parse error"}}]
+    assert error_code(call(service, "ping", jsonrpc="1.0")) == INVALID_REQUEST
+    assert error_code(call(service, "nope")) == METHOD_NOT_FOUND
+    assert error_code(call(service, "analyze", [])) == INVALID_PARAMS
+    assert error_code(call(service, "analyze", {"bogus": 1})) == INVALID_PARAMS
+    assert error_code(call(service, "upgrade", {})) == INVALID_PARAMS
+    assert call(service, "ping")[0]["result"]["pid"]
+    # Notifications run but are not answered
+    replies = []
+    service.handle(json.dumps({"jsonrpc": "2.0", "method": "ping"}), replies.append)
+    assert replies == []
+
+def test_results_of_each_project_are_kept_and_reused(service):
+    args = service._options("upgrade", {})
+    fingerprint = project_fingerprint()
+    for project, latest in ((".", "1.0.0"), ("apps/b", "2.0.0")):
+        service._store("python", "mylib", project, project_scoped_fingerprint(fingerprint, project), args,
+                       {"package": "mylib", "status": "success", "latest_working": latest})
+    assert {key: result["latest_working"] for key, result in call(service, "results")[0]["result"].items()} \
+        == {"mylib": "1.0.0", "mylib (apps/b)": "2.0.0"}
+    assert call(service, "upgrade", {"package": "mylib", "project": "apps/b"})[0]["result"]["latest_working"] \
+        == "2.0.0"
+    assert call(service, "upgrade", {"package": "mylib"})[0]["result"]["latest_working"] == "1.0.0"
+
+def test_requests_needing_other_runner_options_are_refused_while_one_runs(service):
+    with service._test_runner(service._options("upgrade", {})):
+        replies = call(service, "upgrade", {"package": "mylib", "test_timeout": 5})
+    assert error_code(replies) == RUNNER_BUSY
+    with service._test_runner(service._options("upgrade", {"test_timeout": 5})):
+        pass
+    assert service._runner_users == 0
+
+def test_each_client_hears_only_its_own_progress(service):
+    both_running = threading.Barrier(2, timeout=5)
+
+    def noisy(params):
+        both_running.wait()
+        emit("probe_started", package=params["package"], version="1.0.0")
+        return True
+
+    service.methods["noisy"] = noisy
+    written = {"a": [], "b": []}
+    threads = []
+    for client in written:
+        line = json.dumps({"jsonrpc": "2.0", "id": 1, "method": "noisy", "params": {"package": client}})
+        connection = Connection(service, lambda text, client=client: written[client].append(json.loads(text)))
+        threads.append(threading.Thread(target=connection.serve, args=([line],)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for client, messages in written.items():
+        progress = [message["params"]["package"] for message in messages if message.get("method") == "progress"]
+        assert progress == [client]
+        assert messages[-1] == {"jsonrpc": "2.0", "id": 1, "result": True}
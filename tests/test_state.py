@@ -0,0 +1,78 @@
+import main
+from state import AnalysisState, incremental_candidates
+
+RECORD = {"versions": ["1.0.0", "1.1.0", "1.3.0", "2.0.0"], "latest_working": "1.1.0", "first_broken": "1.3.0"}
+
+def test_new_versions_are_split_around_the_known_boundary():
+    versions = ["1.0.0", "1.0.1", "1.1.0", "1.2.0", "1.2.1", "1.3.0", "1.4.0", "2.0.0", "2.1.0"]
+    assert incremental_candidates(RECORD, versions, "semver") == (["1.2.0", "1.2.1"], ["1.4.0", "2.1.0"])
+
+def test_nothing_to_probe_without_new_versions():
+    assert incremental_candidates(RECORD, RECORD["versions"], "semver") == ([], [])
+
+def test_unbroken_packages_only_probe_versions_above_the_working_one():
+    record = dict(RECORD, first_broken=None)
+    assert incremental_candidates(record, RECORD["versions"] + ["2.1.0"], "semver") == (["2.1.0"], [])
+
+def test_boundary_versions_gone_from_the_registry_force_a_full_search():
+    assert incremental_candidates(RECORD, ["1.0.0", "1.3.0", "2.0.0"], "semver") is None
+
+def test_state_round_trips_and_ignores_changed_usage(tmp_path):
+    path = str(tmp_path / ".dtm" / "analysis-state.json")
+    result = {"status": "success", "latest_working": "1.1.0", "first_broken": "1.3.0"}
+    AnalysisState(path).put("js", "mylib", RECORD["versions"], result, "fp", "usage", ["bisect", False, False])
+    state = AnalysisState(path)
+    assert state.get("js", "mylib", "usage", ["bisect", False, False])["first_broken"] == "1.3.0"
+    assert state.get("js", "mylib", "other usage", ["bisect", False, False]) is None
+    assert state.get("js", "mylib", "usage", ["hierarchical", False, False]) is None
+
+class Registry:
+    """A package whose versions fail exactly where ``broken`` says."""
+
+    version_scheme = "semver"
+
+    def __init__(self, versions, broken):
+        self.versions, self.broken, self.probed = versions, broken, []
+
+    def adapter(self, package_name, language, root="."):
+        registry = self
+
+        class Adapter:
+            version_scheme = "semver"
+
+            def __init__(self):
+                self.package_name = package_name
+
+            def enumerate_versions(self):
+                return list(registry.versions)
+
+            def install_version(self, version):
+                self.version = version
+                registry.probed.append(version)
+                return True
+
+            def run_tests(self, test_command, cancel=None):
+                return self.version not in registry.broken, ""
+        return Adapter()
+
+def test_releases_past_a_known_break_are_checked_without_a_full_search(tmp_path, monkeypatch):
+    registry = Registry(["1.0.0", "1.1.0", "1.2.0", "1.3.0"], {"1.2.0", "1.3.0"})
+    monkeypatch.setattr(main, "get_adapter", registry.adapter)
+    state = AnalysisState(str(tmp_path / "analysis-state.json"))
+
+    def analyze():
+        registry.probed = []
+        return main.analyze_package("mylib", "js", select_tests=False, state=state, root=str(tmp_path))
+
+    assert (analyze()["latest_working"], analyze()["search"]["reused"]) == ("1.1.0", True)
+    # Newer releases that are still broken cost one probe each
+    registry.versions += ["1.4.0", "2.0.0"]
+    registry.broken |= {"1.4.0", "2.0.0"}
+    result = analyze()
+    assert (result["latest_working"], result["first_broken"]) == ("1.1.0", "1.2.0")
+    assert sorted(registry.probed) == ["1.4.0", "2.0.0"]
+    # One that works again means the old boundary is wrong
+    registry.versions.append("2.1.0")
+    result = analyze()
+    assert (result["latest_working"], result["first_broken"]) == ("2.1.0", None)
+    assert "incremental" not in result["search"] and result["search"]["non_monotonic"]
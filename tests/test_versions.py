@@ -0,0 +1,31 @@
+import pytest
+from versions import SemVer, is_prerelease, parse_version, release_prefix, sort_versions
+
+def test_semver_orders_prereleases_before_their_release():
+    ordered = ["1.0.0-alpha", "1.0.0-alpha.1", "1.0.0-alpha.beta", "1.0.0-beta", "1.0.0-beta.2",
+               "1.0.0-beta.11", "1.0.0-rc.1", "1.0.0", "1.0.1", "1.10.0", "2.0.0"]
+    assert sorted(ordered[::-1], key=SemVer) == ordered
+
+def test_semver_ignores_build_metadata_and_pads_missing_parts():
+    assert SemVer("1.2.3+build.5") == SemVer("1.2.3")
+    assert SemVer("v2").release == (2, 0, 0)
+    assert (SemVer("1.2.3").major, SemVer("1.2.3").minor, SemVer("1.2.3").micro) == (1, 2, 3)
+
+def test_parse_version_rejects_invalid_versions():
+    assert parse_version("not-a-version", "semver") is None
+    assert parse_version("1.2.3.4.x", "pep440") is None
+    with pytest.raises(ValueError):
+        SemVer("1.2.x")
+
+@pytest.mark.parametrize("scheme, versions, expected", [
+    ("pep440", ["1.10", "1.9", "1.9rc1", "bogus", "1.9.post1"], ["1.9rc1", "1.9", "1.9.post1", "1.10"]),
+    ("semver", ["1.10.0", "1.9.0", "1.9.0-rc.1", "bogus"], ["1.9.0-rc.1", "1.9.0", "1.10.0"]),
+])
+def test_sort_versions_drops_what_it_cannot_parse(scheme, versions, expected):
+    assert sort_versions(versions, scheme) == expected
+
+def test_prereleases_and_release_prefixes():
+    assert is_prerelease("2.0.0b1") and not is_prerelease("2.0.0")
+    assert is_prerelease("2.0.0-next.3", "semver") and not is_prerelease("garbage", "semver")
+    assert release_prefix("3.4.5", "semver", 2) == (3, 4)
+    assert release_prefix("3", "pep440", 3) == (3, 0, 0)
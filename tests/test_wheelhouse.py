@@ -0,0 +1,79 @@
+import base64
+import hashlib
+import os
+import subprocess
+import sys
+import zipfile
+import pytest
+import wheelhouse
+from wheelhouse import Prefetcher, Wheelhouse
+
+def build_wheel(directory, name, version):
+    """Write a pure-Python wheel for name==version that provides module ``name``."""
+    dist_info = f"{name}-{version}.dist-info"
+    files = {
+        f"{name}.py": f"VERSION = {version!r}\n",
+        f"{dist_info}/METADATA": f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    record = []
+    for path, content in files.items():
+        digest = base64.urlsafe_b64encode(hashlib.sha256(content.encode()).digest()).rstrip(b"=").decode()
+        record.append(f"{path},sha256={digest},{len(content)}")
+    files[f"{dist_info}/RECORD"] = "\n".join(record + [f"{dist_info}/RECORD,,"]) + "\n"
+    path = os.path.join(directory, f"{name}-{version}-py3-none-any.whl")
+    with zipfile.ZipFile(path, "w") as wheel:
+        for member, content in files.items():
+            wheel.writestr(member, content)
+    return path
+
+@pytest.fixture
+def index(tmp_path):
+    """A flat directory index with two releases of tinylib."""
+    directory = tmp_path / "index"
+    directory.mkdir()
+    for version in ("1.0.0", "1.1.0"):
+        build_wheel(str(directory), "tinylib", version)
+    return str(directory)
+
+def test_fetch_stores_a_set_that_installs_offline(index, tmp_path, monkeypatch):
+    store = Wheelhouse(str(tmp_path / "wheelhouse"))
+    prefetcher = Prefetcher(store, find_links=index)
+    assert prefetcher.fetch("tinylib", "1.1.0") == ["tinylib-1.1.0-py3-none-any.whl"]
+    assert store.lookup("TinyLib", "1.1.0") == ["tinylib-1.1.0-py3-none-any.whl"]
+    assert store.lookup("tinylib", "1.0.0") is None
+
+    # A second fetch, from a prefetcher without any index, is served from the store
+    def no_pip(*args, **kwargs):
+        raise AssertionError("pip ran for a stored wheel set")
+    monkeypatch.setattr(wheelhouse.subprocess, "run", no_pip)
+    offline = Prefetcher(Wheelhouse(store.root), find_links=str(tmp_path / "missing"))
+    assert offline.fetch("tinylib", "1.1.0") == ["tinylib-1.1.0-py3-none-any.whl"]
+    monkeypatch.undo()
+
+    # And installs with pip's index switched off, as install_version does
+    target = tmp_path / "site"
+    subprocess.run([sys.executable, "-m", "pip", "install", "--disable-pip-version-check", "--no-index",
+                    "--find-links", store.links_dir, "--target", str(target), "tinylib==1.1.0"],
+                   check=True, capture_output=True)
+    assert (target / "tinylib.py").read_text() == "VERSION = '1.1.0'\n"
+
+def test_available_never_starts_a_download(index, tmp_path):
+    prefetcher = Prefetcher(Wheelhouse(str(tmp_path / "wheelhouse")), find_links=index)
+    assert prefetcher.available("tinylib", "1.0.0") is None
+    assert not prefetcher._in_flight
+    # A download already in flight is joined
+    prefetcher.prefetch("tinylib", "1.0.0")
+    assert prefetcher.available("tinylib", "1.0.0") == ["tinylib-1.0.0-py3-none-any.whl"]
+    assert prefetcher.fetch("tinylib", "9.9.9") is None
+
+def test_evicting_a_wheel_drops_the_sets_that_need_it(index, tmp_path):
+    store = Wheelhouse(str(tmp_path / "wheelhouse"))
+    for version in ("1.0.0", "1.1.0"):
+        store.add_set("tinylib", version, [os.path.join(index, f"tinylib-{version}-py3-none-any.whl")])
+    size = os.path.getsize(os.path.join(index, "tinylib-1.1.0-py3-none-any.whl"))
+    store.lookup("tinylib", "1.1.0")
+    store.max_bytes = size
+    store.evict()
+    assert store.lookup("tinylib", "1.1.0") is not None
+    assert store.lookup("tinylib", "1.0.0") is None
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import time
+from adapters.rust_adapter import pin_dependency
+from workspaces import STAGING_PREFIX, mark_in_use, mirror_project, prune_least_recent, release_mark
+
+MANIFEST = """[package]
+name = "app"
+
+[dependencies]
+serde = "1.0"
+serde_json = { version = "1.0", features = ["std"] }
+tokio = { workspace = true }
+
+[dev-dependencies]
+"serde" = { features = ["derive"] }
+
+[target.'cfg(unix)'.build-dependencies.serde]
+version = "1"  # build scripts too
+"""
+
+def test_pin_dependency_rewrites_every_table():
+    pinned, found = pin_dependency(MANIFEST, "serde", "1.0.200")
+    assert found
+    assert 'serde = "=1.0.200"\n' in pinned
+    assert '"serde" = { features = ["derive"], version = "=1.0.200" }\n' in pinned
+    assert 'version = "=1.0.200"\n' in pinned.split("build-dependencies.serde]\n")[1]
+    assert 'serde_json = { version = "1.0", features = ["std"] }' in pinned
+    # Crates inherited from the workspace are pinned in the workspace's manifest instead
+    assert pin_dependency(MANIFEST, "tokio", "1.0.0") == (MANIFEST, False)
+    assert pin_dependency(MANIFEST, "rand", "0.8.5") == (MANIFEST, False)
+
+def test_mirror_copies_changed_files_and_leaves_the_rest(tmp_path):
+    project, mirror = tmp_path / "project", tmp_path / "mirror"
+    (project / "src").mkdir(parents=True)
+    (project / "src" / "lib.rs").write_text("pub fn a() {}\n")
+    (project / "Cargo.toml").write_text(MANIFEST)
+    (project / "target").mkdir()
+    (project / "target" / "big").write_text("build output")
+    assert mirror_project(str(project), str(mirror), {"Cargo.toml"}) == ["Cargo.toml"]
+    assert (mirror / "src" / "lib.rs").read_text() == "pub fn a() {}\n"
+    assert not (mirror / "Cargo.toml").exists() and not (mirror / "target").exists()
+    # A private copy: tests rewriting it leave the project alone
+    assert not os.path.samefile(project / "src" / "lib.rs", mirror / "src" / "lib.rs")
+    mtime = os.stat(mirror / "src" / "lib.rs").st_mtime_ns
+
+    (mirror / "target").mkdir()
+    (project / "src" / "gone.rs").write_text("")
+    mirror_project(str(project), str(mirror), set())
+    (project / "src" / "gone.rs").unlink()
+    mirror_project(str(project), str(mirror), set())
+    assert not (mirror / "src" / "gone.rs").exists()
+    assert (mirror / "target").is_dir()
+    assert os.stat(mirror / "src" / "lib.rs").st_mtime_ns == mtime
+
+def test_pruning_keeps_recent_and_in_use_workspaces(tmp_path):
+    for age, name in enumerate(["newest", "busy", "old", "oldest"]):
+        (tmp_path / name).mkdir()
+        os.utime(tmp_path / name, (time.time() - age * 60,) * 2)
+    marker = mark_in_use(str(tmp_path / "busy"))
+    os.utime(tmp_path / "busy", (time.time() - 3600,) * 2)
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    (tmp_path / f"{STAGING_PREFIX}{dead.pid}-abc").mkdir()
+    (tmp_path / f"{STAGING_PREFIX}{os.getpid()}-abc").mkdir()
+    prune_least_recent(str(tmp_path), keep=2)
+    assert sorted(os.listdir(tmp_path)) == sorted(["newest", "busy", f"{STAGING_PREFIX}{os.getpid()}-abc"])
+    # Releasing the mark touches the workspace, which makes it the most recently used
+    release_mark(marker)
+    prune_least_recent(str(tmp_path), keep=1)
+    assert [name for name in os.listdir(tmp_path) if not name.startswith(STAGING_PREFIX)] == ["busy"]